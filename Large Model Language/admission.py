@@ -0,0 +1,174 @@
+"""
+Admission control cho các endpoint /query
+Giới hạn số câu hỏi xử lý đồng thời (toàn server và theo từng client), hàng đợi có giới hạn
+và thời hạn chờ; quá tải thì từ chối nhanh bằng 429/503 kèm Retry-After thay vì để
+Gemini/vnstock trả lỗi quota cho mọi request
+"""
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from observability import ADMISSION_REJECTED, QUERIES_ACTIVE, QUERY_QUEUE_DEPTH, QUERY_QUEUE_SECONDS, logger
+
+
+# Cấu hình (có thể thay đổi qua biến môi trường; 0 = không giới hạn)
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "16"))  # Số câu hỏi xử lý đồng thời
+MAX_CONCURRENT_PER_CLIENT = int(os.getenv("MAX_CONCURRENT_PER_CLIENT", "4"))  # Kể cả câu hỏi đang chờ
+QUERY_QUEUE_SIZE = int(os.getenv("QUERY_QUEUE_SIZE", "64"))  # Số câu hỏi chờ tối đa
+QUERY_QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", "10"))  # Thời gian chờ tối đa (giây)
+CLIENT_ID_HEADER = "X-Client-Id"
+
+
+class AdmissionRejected(Exception):
+    """
+    Câu hỏi bị từ chối do quá tải
+
+    Attributes:
+        status_code: 429 (client vượt giới hạn riêng) hoặc 503 (server quá tải)
+        retry_after: Số giây nên chờ trước khi gửi lại
+        reason: client_limit, queue_full hoặc queue_timeout
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Ticket:
+    """Một chỗ xử lý đã cấp cho câu hỏi; release() nhiều lần chỉ có tác dụng một lần"""
+
+    def __init__(self, controller, client: str):
+        self.controller = controller
+        self.client = client
+        self.started = controller.clock()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Giới hạn đồng thời toàn server và theo client, hàng đợi FIFO có giới hạn và thời hạn chờ"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_QUERIES, per_client: int = MAX_CONCURRENT_PER_CLIENT,
+                 queue_size: int = QUERY_QUEUE_SIZE, queue_timeout: float = QUERY_QUEUE_TIMEOUT, clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.per_client = per_client
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.clock = clock
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._clients = {}  # client -> số câu hỏi đang chờ hoặc đang xử lý
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self._avg_service = 1.0  # Thời gian xử lý trung bình (EWMA, giây) để ước lượng Retry-After
+
+    async def acquire(self, client: str) -> Ticket:
+        """
+        Xin chỗ xử lý cho một câu hỏi, chờ trong hàng đợi nếu server đang bận
+
+        Raises:
+            AdmissionRejected: Client vượt giới hạn riêng, hàng đợi đầy hoặc chờ quá thời hạn
+        """
+        if self.per_client > 0 and self._clients.get(client, 0) >= self.per_client:
+            self._reject("client_limit")
+            raise AdmissionRejected(
+                f"Client đang có {self.per_client} câu hỏi chưa xử lý xong, vui lòng thử lại sau",
+                429, self._retry_after(1), "client_limit")
+
+        if self._semaphore is not None and self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self._reject("queue_full")
+                raise AdmissionRejected("Hệ thống đang quá tải, vui lòng thử lại sau",
+                                        503, self._retry_after(self.waiting + 1), "queue_full")
+
+        self._clients[client] = self._clients.get(client, 0) + 1
+        try:
+            if self._semaphore is not None:
+                await self._wait_for_slot()
+        except BaseException:
+            self._forget(client)
+            raise
+
+        self.active += 1
+        QUERIES_ACTIVE.inc()
+        return Ticket(self, client)
+
+    async def _wait_for_slot(self):
+        queued_at = self.clock()
+        self.waiting += 1
+        QUERY_QUEUE_DEPTH.inc()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout")
+            raise AdmissionRejected("Hệ thống đang quá tải, vui lòng thử lại sau",
+                                    503, self._retry_after(self.waiting), "queue_timeout") from None
+        finally:
+            self.waiting -= 1
+            QUERY_QUEUE_DEPTH.dec()
+            QUERY_QUEUE_SECONDS.observe(self.clock() - queued_at)
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        """Giữ chỗ xử lý trong suốt khối with"""
+        ticket = await self.acquire(client)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _release(self, ticket: Ticket):
+        self.active -= 1
+        QUERIES_ACTIVE.dec()
+        self._forget(ticket.client)
+        self._avg_service = 0.8 * self._avg_service + 0.2 * (self.clock() - ticket.started)
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def _forget(self, client: str):
+        count = self._clients.get(client, 0) - 1
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        logger.info("Từ chối câu hỏi (%s): %d đang xử lý, %d đang chờ", reason, self.active, self.waiting)
+
+    def _retry_after(self, position: int) -> int:
+        """Ước lượng số giây tới khi có chỗ cho câu hỏi thứ `position` trong hàng đợi"""
+        slots = self.max_concurrent if self.max_concurrent > 0 else 1
+        return max(1, math.ceil(self._avg_service * position / slots))
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "clients": len(self._clients),
+            "max_concurrent": self.max_concurrent,
+            "queue_size": self.queue_size,
+        }
+
+
+def client_id(request) -> str:
+    """Định danh client: header X-Client-Id nếu có, không thì địa chỉ IP"""
+    header = request.headers.get(CLIENT_ID_HEADER)
+    if header:
+        return header.strip()[:128]
+    return request.client.host if request.client else "unknown"
+
+
+# Admission control dùng chung cho toàn bộ process
+admission = AdmissionController()
@@ -1,18 +1,36 @@
 """
 Agent tích hợp LLM (Google Gemini) với function calling
 Điều phối giữa LLM và các tools từ tools.py
+SDK google.generativeai và tool schema chỉ nạp ở lần dùng đầu tiên hoặc khi warmup (warmup.py)
+để import module này (và main) không tốn thời gian khởi động
 """
 
 import os
-import google.generativeai as genai
+import json
+import asyncio
+import contextlib
+import functools
+import inspect
+import threading
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from datetime import datetime, timedelta
-from tools import get_company_info, get_historical_price, calculate_technical_indicator
+from observability import ERRORS, QUERY_ITERATIONS, TOOL_PAYLOAD_BYTES, logger, span
+from tools import (
+    get_company_info, get_historical_price, calculate_technical_indicator, calculate_technical_indicators,
+    get_company_info_batch, get_historical_price_batch, calculate_technical_indicators_batch, screen_stocks
+)
 
 
 # Cấu hình API key (cần thiết lập biến môi trường GEMINI_API_KEY)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+
+
+# Thread pool giới hạn cho các tool vẫn chạy đồng bộ (vnstock, pandas)
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="agent-tool")
+# Thời gian tối đa (giây) chờ một tool; quá hạn thì báo lỗi cho model thay vì treo request
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))
 
 
 # System Prompt cho agent
@@ -26,99 +44,351 @@ Nhiệm vụ của bạn:
 Quy tắc quan trọng:
 - Nếu người dùng hỏi về giá mà không nói rõ khoảng thời gian, tự động lấy dữ liệu 3 tháng gần nhất
 - Nếu người dùng hỏi về chỉ báo kỹ thuật mà không nói rõ thời gian, tự động lấy 3 tháng gần nhất
+- Khi cần nhiều chỉ báo cho cùng một mã, gọi calculate_technical_indicators một lần với danh sách chỉ báo
+- Khi câu hỏi liên quan nhiều mã (so sánh, cả ngành, rổ VN30), dùng các tool *_batch với danh sách mã thay vì gọi lần lượt từng mã
+- Khi câu hỏi là sàng lọc theo điều kiện trên cả sàn (ví dụ "mã HOSE nào có RSI dưới 30"), dùng screen_stocks thay vì liệt kê mã
+- Chỉ báo cần chu kỳ dài (SMA50, SMA200, MACD) cần khoảng thời gian đủ dài, ví dụ 1 năm cho SMA200
 - Luôn trả lời bằng tiếng Việt, rõ ràng và chuyên nghiệp
 - Khi trả về giá, hãy tóm tắt xu hướng và thông tin quan trọng thay vì liệt kê toàn bộ dữ liệu
 """
 
 
-# Định nghĩa Tools schema cho Gemini Function Calling
-get_company_info_func = genai.protos.FunctionDeclaration(
-    name="get_company_info",
-    description="Lấy thông tin tổng quan về một công ty niêm yết trên thị trường chứng khoán Việt Nam. Bao gồm các thông tin như tên công ty, ngành nghề, vốn điều lệ, lịch sử hình thành, v.v.",
-    parameters=genai.protos.Schema(
-        type=genai.protos.Type.OBJECT,
-        properties={
-            "ticker": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG', 'VNM'). Viết hoa tất cả các ký tự."
-            )
-        },
-        required=["ticker"]
+# SDK Gemini dùng chung, import ở lần dùng đầu tiên (xem load_genai)
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def load_genai():
+    """
+    Import google.generativeai ở lần gọi đầu tiên (an toàn đa luồng) và cấu hình API key
+
+    Returns:
+        Module google.generativeai
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if GEMINI_API_KEY:
+                genai.configure(api_key=GEMINI_API_KEY)
+            _genai = genai
+    return _genai
+
+
+@functools.cache
+def get_financial_tool():
+    """Tools schema cho Gemini Function Calling, dựng một lần cho cả process"""
+    genai = load_genai()
+
+    get_company_info_func = genai.protos.FunctionDeclaration(
+        name="get_company_info",
+        description="Lấy thông tin tổng quan về một công ty niêm yết trên thị trường chứng khoán Việt Nam. Bao gồm các thông tin như tên công ty, ngành nghề, vốn điều lệ, lịch sử hình thành, v.v.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "ticker": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG', 'VNM'). Viết hoa tất cả các ký tự."
+                )
+            },
+            required=["ticker"]
+        )
     )
-)
 
-get_historical_price_func = genai.protos.FunctionDeclaration(
-    name="get_historical_price",
-    description="Lấy dữ liệu giá lịch sử của một cổ phiếu trong khoảng thời gian cụ thể. Trả về thông tin giá mở cửa, đóng cửa, cao nhất, thấp nhất và khối lượng giao dịch theo từng ngày.",
-    parameters=genai.protos.Schema(
-        type=genai.protos.Type.OBJECT,
-        properties={
-            "ticker": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG')"
-            ),
-            "start_date": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD' (ví dụ: '2024-01-01')"
-            ),
-            "end_date": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD' (ví dụ: '2024-12-31')"
-            )
-        },
-        required=["ticker", "start_date", "end_date"]
+    get_historical_price_func = genai.protos.FunctionDeclaration(
+        name="get_historical_price",
+        description="Lấy dữ liệu giá lịch sử của một cổ phiếu trong khoảng thời gian cụ thể. Trả về phần tóm tắt (% thay đổi, cao nhất, thấp nhất, biến động, xu hướng khối lượng) và các nến giá mở cửa, đóng cửa, cao nhất, thấp nhất, khối lượng dạng cột; khoảng thời gian dài được gộp theo tuần hoặc tháng.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "ticker": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG')"
+                ),
+                "start_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD' (ví dụ: '2024-01-01')"
+                ),
+                "end_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD' (ví dụ: '2024-12-31')"
+                ),
+                "full_series": genai.protos.Schema(
+                    type=genai.protos.Type.BOOLEAN,
+                    description="Chỉ đặt true khi người dùng yêu cầu rõ dữ liệu chi tiết từng ngày; mặc định false"
+                )
+            },
+            required=["ticker", "start_date", "end_date"]
+        )
     )
-)
 
-calculate_technical_indicator_func = genai.protos.FunctionDeclaration(
-    name="calculate_technical_indicator",
-    description="Tính toán các chỉ báo kỹ thuật phân tích cổ phiếu. Hỗ trợ SMA (Simple Moving Average - Đường trung bình động đơn giản) và RSI (Relative Strength Index - Chỉ số sức mạnh tương đối).",
-    parameters=genai.protos.Schema(
-        type=genai.protos.Type.OBJECT,
-        properties={
-            "ticker": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG')"
-            ),
-            "indicator_name": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Tên chỉ báo cần tính. Chỉ hỗ trợ 'SMA' hoặc 'RSI'"
-            ),
-            "window_size": genai.protos.Schema(
-                type=genai.protos.Type.INTEGER,
-                description="Độ dài chu kỳ tính toán (ví dụ: 14 cho RSI 14 ngày, 20 cho SMA 20 ngày)"
-            ),
-            "start_date": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD'"
-            ),
-            "end_date": genai.protos.Schema(
-                type=genai.protos.Type.STRING,
-                description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD'"
-            )
-        },
-        required=["ticker", "indicator_name", "window_size", "start_date", "end_date"]
+    calculate_technical_indicator_func = genai.protos.FunctionDeclaration(
+        name="calculate_technical_indicator",
+        description="Tính toán một chỉ báo kỹ thuật phân tích cổ phiếu. Hỗ trợ SMA (Simple Moving Average - Đường trung bình động đơn giản), EMA, RSI (Relative Strength Index - Chỉ số sức mạnh tương đối, làm trơn Wilder), MACD, BB (Bollinger Bands), ATR, OBV, VWAP, ROC, STOCH.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "ticker": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG')"
+                ),
+                "indicator_name": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Tên chỉ báo cần tính: 'SMA', 'EMA', 'RSI', 'MACD', 'BB', 'ATR', 'OBV', 'VWAP', 'ROC' hoặc 'STOCH'"
+                ),
+                "window_size": genai.protos.Schema(
+                    type=genai.protos.Type.INTEGER,
+                    description="Độ dài chu kỳ tính toán (ví dụ: 14 cho RSI 14 ngày, 20 cho SMA 20 ngày)"
+                ),
+                "start_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                ),
+                "end_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                )
+            },
+            required=["ticker", "indicator_name", "window_size", "start_date", "end_date"]
+        )
     )
-)
 
-# Tạo Tool object
-financial_tool = genai.protos.Tool(
-    function_declarations=[
-        get_company_info_func,
-        get_historical_price_func,
-        calculate_technical_indicator_func
-    ]
-)
+    calculate_technical_indicators_func = genai.protos.FunctionDeclaration(
+        name="calculate_technical_indicators",
+        description="Tính nhiều chỉ báo kỹ thuật cho một cổ phiếu trong một lần gọi (chỉ lấy dữ liệu một lần). Dùng khi câu hỏi cần từ hai chỉ báo trở lên, ví dụ 'RSI và MACD và SMA50 của HPG'.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "ticker": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Mã chứng khoán của công ty (ví dụ: 'FPT', 'VCB', 'HPG')"
+                ),
+                "indicators": genai.protos.Schema(
+                    type=genai.protos.Type.ARRAY,
+                    items=genai.protos.Schema(type=genai.protos.Type.STRING),
+                    description="Danh sách chỉ báo, có thể kèm chu kỳ: 'RSI14', 'SMA50', 'EMA20', 'MACD(12,26,9)', 'BB(20,2)', 'ATR14', 'OBV', 'VWAP', 'ROC12', 'STOCH(14,3)'"
+                ),
+                "start_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                ),
+                "end_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                )
+            },
+            required=["ticker", "indicators", "start_date", "end_date"]
+        )
+    )
+
+    # Schema dùng chung cho tham số danh sách mã của các tool theo lô
+    _tickers_schema = genai.protos.Schema(
+        type=genai.protos.Type.ARRAY,
+        items=genai.protos.Schema(type=genai.protos.Type.STRING),
+        description="Danh sách mã chứng khoán (ví dụ: ['VCB', 'BID', 'CTG', 'TCB']), tối đa 30 mã"
+    )
+
+    get_company_info_batch_func = genai.protos.FunctionDeclaration(
+        name="get_company_info_batch",
+        description="Lấy thông tin tổng quan (rút gọn) của nhiều công ty trong một lần gọi. Dùng khi cần so sánh nhiều công ty hoặc cả một ngành.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "tickers": _tickers_schema
+            },
+            required=["tickers"]
+        )
+    )
+
+    get_historical_price_batch_func = genai.protos.FunctionDeclaration(
+        name="get_historical_price_batch",
+        description="Lấy tóm tắt giá (giá đầu/cuối kỳ, % thay đổi, cao nhất, thấp nhất, khối lượng trung bình) của nhiều cổ phiếu trong một lần gọi. Dùng để so sánh diễn biến giá giữa các mã.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "tickers": _tickers_schema,
+                "start_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                ),
+                "end_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                )
+            },
+            required=["tickers", "start_date", "end_date"]
+        )
+    )
+
+    calculate_technical_indicators_batch_func = genai.protos.FunctionDeclaration(
+        name="calculate_technical_indicators_batch",
+        description="Tính các chỉ báo kỹ thuật cho nhiều cổ phiếu trong một lần gọi. Dùng cho câu hỏi sàng lọc hoặc so sánh chỉ báo giữa nhiều mã.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "tickers": _tickers_schema,
+                "indicators": genai.protos.Schema(
+                    type=genai.protos.Type.ARRAY,
+                    items=genai.protos.Schema(type=genai.protos.Type.STRING),
+                    description="Danh sách chỉ báo, có thể kèm chu kỳ: 'RSI14', 'SMA50', 'MACD', 'BB(20,2)'"
+                ),
+                "start_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày bắt đầu lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                ),
+                "end_date": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Ngày kết thúc lấy dữ liệu, định dạng 'YYYY-MM-DD'"
+                )
+            },
+            required=["tickers", "indicators", "start_date", "end_date"]
+        )
+    )
+
+    screen_stocks_func = genai.protos.FunctionDeclaration(
+        name="screen_stocks",
+        description="Sàng lọc cổ phiếu toàn sàn theo điều kiện chỉ báo kỹ thuật tại phiên gần nhất đã đóng cửa, trả về top mã đã xếp hạng.",
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties={
+                "filter": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Điều kiện lọc dùng CLOSE, VOLUME, RSI14, SMA50, EMA20, ROC20, ATR14, MAX20, MIN20, VOLUME_SMA20, "
+                                "+ - * /, so sánh và and/or/not. Ví dụ: 'RSI14 < 30 and VOLUME > VOLUME_SMA20'"
+                ),
+                "sort_by": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Biểu thức xếp hạng (ví dụ: 'ROC20' hoặc 'VOLUME / VOLUME_SMA20'), tùy chọn"
+                ),
+                "ascending": genai.protos.Schema(
+                    type=genai.protos.Type.BOOLEAN,
+                    description="Xếp tăng dần (true) hay giảm dần (false), tùy chọn"
+                ),
+                "limit": genai.protos.Schema(
+                    type=genai.protos.Type.INTEGER,
+                    description="Số mã trả về, mặc định 20"
+                ),
+                "exchange": genai.protos.Schema(
+                    type=genai.protos.Type.STRING,
+                    description="Giới hạn theo sàn: 'HOSE', 'HNX' hoặc 'UPCOM', tùy chọn"
+                ),
+                "tickers": _tickers_schema
+            },
+            required=["filter"]
+        )
+    )
+
+    # Tạo Tool object
+    return genai.protos.Tool(
+        function_declarations=[
+            get_company_info_func,
+            get_historical_price_func,
+            calculate_technical_indicator_func,
+            calculate_technical_indicators_func,
+            get_company_info_batch_func,
+            get_historical_price_batch_func,
+            calculate_technical_indicators_batch_func,
+            screen_stocks_func
+        ]
+    )
 
 
 # Map tên hàm đến function thực tế
 AVAILABLE_FUNCTIONS = {
     "get_company_info": get_company_info,
     "get_historical_price": get_historical_price,
-    "calculate_technical_indicator": calculate_technical_indicator
+    "calculate_technical_indicator": calculate_technical_indicator,
+    "calculate_technical_indicators": calculate_technical_indicators,
+    "get_company_info_batch": get_company_info_batch,
+    "get_historical_price_batch": get_historical_price_batch,
+    "calculate_technical_indicators_batch": calculate_technical_indicators_batch,
+    "screen_stocks": screen_stocks
 }
 
 
+# Model dùng chung cho toàn bộ process (tool schema + system prompt dựng một lần)
+_model = None
+
+
+def get_model():
+    """
+    Lấy GenerativeModel dùng chung, khởi tạo ở lần gọi đầu tiên
+    
+    Model không giữ trạng thái hội thoại nên có thể dùng cho nhiều request đồng thời;
+    mỗi câu hỏi vẫn tạo chat session riêng qua model.start_chat().
+    """
+    global _model
+    if _model is None:
+        _model = load_genai().GenerativeModel(
+            model_name='gemini-2.0-flash',
+            tools=[get_financial_tool()],
+            system_instruction=SYSTEM_PROMPT
+        )
+    return _model
+
+
+def reset_model():
+    """Bỏ model dùng chung (gọi khi shutdown hoặc khi đổi cấu hình)"""
+    global _model
+    _model = None
+
+
+def _function_calls(candidate) -> list:
+    """Lấy tất cả function_call trong một lượt trả lời của model (có thể nhiều hơn một)"""
+    calls = []
+    for part in candidate.content.parts:
+        function_call = getattr(part, 'function_call', None)
+        if function_call and function_call.name:
+            calls.append(function_call)
+    return calls
+
+
+def _to_plain(value):
+    """Chuyển giá trị protobuf (MapComposite, RepeatedComposite) về dict/list thuần Python"""
+    if isinstance(value, (str, bytes)):
+        return value
+    if isinstance(value, Mapping):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, Iterable):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+def _function_args(function_call) -> dict:
+    """Tham số của function call dạng dict thuần (serialize JSON được)"""
+    return _to_plain(function_call.args)
+
+
+def _response_text(candidate) -> str:
+    """Ghép các phần text trong một lượt trả lời của model"""
+    return "".join(part.text for part in candidate.content.parts if getattr(part, 'text', None))
+
+
+def _function_response_part(function_name: str, function_result: str):
+    """Đóng gói kết quả một tool thành Part FunctionResponse gửi lại cho model"""
+    protos = load_genai().protos
+    return protos.Part(
+        function_response=protos.FunctionResponse(
+            name=function_name,
+            response={'result': function_result}
+        )
+    )
+
+
+def _timeout_result(function_name: str) -> str:
+    """Kết quả trả về model khi tool chạy quá TOOL_CALL_TIMEOUT"""
+    return json.dumps(
+        {"error": f"Function '{function_name}' vượt quá thời gian chờ {TOOL_CALL_TIMEOUT:g} giây"},
+        ensure_ascii=False
+    )
+
+
+def _exception_result(function_name: str, error: Exception) -> str:
+    """Kết quả trả về model khi tool ném exception (các tool khác trong lượt vẫn được trả về)"""
+    logger.exception("Tool %s lỗi", function_name, exc_info=error)
+    return json.dumps({"error": f"Lỗi khi chạy function '{function_name}': {error}"}, ensure_ascii=False)
+
+
 def run_agent_query(question: str) -> str:
     """
     Chạy agent với câu hỏi từ người dùng
@@ -132,23 +402,17 @@ def run_agent_query(question: str) -> str:
     if not GEMINI_API_KEY:
         return "Lỗi: Chưa cấu hình GEMINI_API_KEY. Vui lòng thiết lập biến môi trường GEMINI_API_KEY với API key của bạn."
     
+    iteration = 0
     try:
-        # Khởi tạo model với tools
-        model = genai.GenerativeModel(
-            model_name='gemini-2.0-flash',
-            tools=[financial_tool],
-            system_instruction=SYSTEM_PROMPT
-        )
-        
-        # Bắt đầu chat session
-        chat = model.start_chat(enable_automatic_function_calling=False)
+        # Dùng model dùng chung của process, mỗi câu hỏi một chat session riêng
+        chat = get_model().start_chat(enable_automatic_function_calling=False)
         
         # Gửi câu hỏi người dùng
-        response = chat.send_message(question)
+        with span("llm", iteration=1):
+            response = chat.send_message(question)
         
         # Vòng lặp xử lý function calling
         max_iterations = 10  # Giới hạn số lần gọi để tránh vòng lặp vô hạn
-        iteration = 0
         
         while iteration < max_iterations:
             iteration += 1
@@ -158,51 +422,249 @@ def run_agent_query(question: str) -> str:
                 return "Lỗi: Không nhận được phản hồi từ model"
             
             candidate = response.candidates[0]
+            function_calls = _function_calls(candidate)
             
             # Nếu model trả về text (không có function call), trả về kết quả
-            if candidate.content.parts and candidate.content.parts[0].text:
-                return candidate.content.parts[0].text
-            
-            # Nếu có function call
-            if candidate.content.parts and hasattr(candidate.content.parts[0], 'function_call'):
-                function_call = candidate.content.parts[0].function_call
-                function_name = function_call.name
-                function_args = dict(function_call.args)
-                
-                print(f"[DEBUG] Gọi function: {function_name} với args: {function_args}")
-                
-                # Gọi function tương ứng
-                if function_name in AVAILABLE_FUNCTIONS:
-                    function_to_call = AVAILABLE_FUNCTIONS[function_name]
-                    function_result = function_to_call(**function_args)
-                    
-                    print(f"[DEBUG] Kết quả function: {function_result[:200]}...")
-                    
-                    # Gửi kết quả về cho model
-                    response = chat.send_message(
-                        genai.protos.Content(
-                            parts=[genai.protos.Part(
-                                function_response=genai.protos.FunctionResponse(
-                                    name=function_name,
-                                    response={'result': function_result}
-                                )
-                            )]
-                        )
-                    )
-                else:
-                    return f"Lỗi: Function '{function_name}' không được hỗ trợ"
-            else:
+            if not function_calls:
+                text = _response_text(candidate)
+                if text:
+                    return text
                 # Không có function call và không có text
                 break
+            
+            for function_call in function_calls:
+                if function_call.name not in AVAILABLE_FUNCTIONS:
+                    return f"Lỗi: Function '{function_call.name}' không được hỗ trợ"
+            
+            # Chạy đồng thời tất cả function call trong lượt này
+            futures = [
+                _tool_executor.submit(_run_tool, function_call.name, _function_args(function_call))
+                for function_call in function_calls
+            ]
+            
+            # Một hạn chờ chung cho cả lượt (không phải TOOL_CALL_TIMEOUT cho từng tool nối tiếp nhau)
+            done, _ = wait_futures(futures, timeout=TOOL_CALL_TIMEOUT)
+            
+            parts = []
+            for function_call, future in zip(function_calls, futures):
+                if future not in done:
+                    future.cancel()
+                    function_result = _timeout_result(function_call.name)
+                elif future.exception() is not None:
+                    function_result = _exception_result(function_call.name, future.exception())
+                else:
+                    function_result = future.result()
+                _record_tool_result(function_call.name, function_result)
+                parts.append(_function_response_part(function_call.name, function_result))
+            
+            # Gửi tất cả kết quả về cho model trong một message
+            with span("llm", iteration=iteration + 1):
+                response = chat.send_message(load_genai().protos.Content(parts=parts))
         
         # Nếu vượt quá số lần lặp
         if iteration >= max_iterations:
+            ERRORS.labels("max_iterations").inc()
             return "Lỗi: Đã vượt quá số lần gọi function tối đa"
         
         return "Lỗi: Không thể xử lý câu hỏi"
         
     except Exception as e:
+        ERRORS.labels("agent").inc()
+        logger.exception("Lỗi khi chạy agent")
         return f"Lỗi khi chạy agent: {str(e)}"
+    finally:
+        QUERY_ITERATIONS.observe(iteration)
+
+
+def _run_tool(function_name: str, function_args: dict) -> str:
+    """Chạy một tool đồng bộ trong span 'tool' (dùng trong thread pool)"""
+    with span("tool", function_name, args=function_args):
+        return AVAILABLE_FUNCTIONS[function_name](**function_args)
+
+
+def _record_tool_result(function_name: str, function_result: str):
+    """Ghi kích thước payload gửi lại LLM và đếm lỗi của tool"""
+    TOOL_PAYLOAD_BYTES.labels(function_name).observe(len(function_result.encode("utf-8")))
+    if function_result.startswith("Lỗi") or function_result.startswith('{"error"'):
+        ERRORS.labels("tool").inc()
+
+
+async def _call_function_async(function_to_call, function_args: dict):
+    """
+    Gọi một tool mà không chặn event loop
+
+    Tool async được await trực tiếp, tool đồng bộ chạy trong thread pool giới hạn
+    (TOOL_MAX_WORKERS) để nhiều câu hỏi có thể xử lý đồng thời trên một worker.
+    """
+    if inspect.iscoroutinefunction(function_to_call):
+        return await function_to_call(**function_args)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _tool_executor,
+        functools.partial(function_to_call, **function_args)
+    )
+
+
+async def _execute_function_call_async(function_call, session=None) -> str:
+    """
+    Chạy một function call với giới hạn thời gian TOOL_CALL_TIMEOUT
+    
+    Args:
+        function_call: Function call của model
+        session: Phiên hội thoại (sessions.Session) để dùng lại kết quả tool đã lấy, hoặc None
+    
+    Returns:
+        Kết quả của tool (hoặc JSON lỗi khi hết thời gian)
+    """
+    function_name = function_call.name
+    function_args = _function_args(function_call)
+    
+    if session is not None:
+        cached = session.cached_result(function_name, function_args)
+        if cached is not None:
+            return cached
+    
+    with span("tool", function_name, args=function_args):
+        try:
+            function_result = await asyncio.wait_for(
+                _call_function_async(AVAILABLE_FUNCTIONS[function_name], function_args),
+                timeout=TOOL_CALL_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            function_result = _timeout_result(function_name)
+        except Exception as e:
+            function_result = _exception_result(function_name, e)
+    
+    _record_tool_result(function_name, function_result)
+    if session is not None:
+        session.remember_result(function_name, function_args, function_result)
+    return function_result
+
+
+async def stream_agent_query(question: str, stream_text: bool = True, session=None):
+    """
+    Chạy agent và phát sự kiện trong lúc vòng lặp function calling đang chạy
+    
+    Args:
+        question: Câu hỏi của người dùng
+        stream_text: True để nhận text của Gemini theo từng đoạn khi đang sinh
+        session: Phiên hội thoại (sessions.Session): chat tiếp nối lịch sử của phiên
+            và lịch sử được cập nhật khi có câu trả lời; None = câu hỏi độc lập
+    
+    Yields:
+        Dict sự kiện, trường "event" là một trong:
+        - "tool_call": {"name", "args"} khi bắt đầu gọi tool
+        - "tool_result": {"name", "result"} khi tool trả kết quả
+        - "token": {"text"} đoạn text Gemini vừa sinh (chỉ khi stream_text)
+        - "answer": {"answer"} câu trả lời cuối cùng
+        - "error": {"message"} thông báo lỗi (bắt đầu bằng "Lỗi")
+    """
+    if not GEMINI_API_KEY:
+        yield {"event": "error", "message": "Lỗi: Chưa cấu hình GEMINI_API_KEY. Vui lòng thiết lập biến môi trường GEMINI_API_KEY với API key của bạn."}
+        return
+    
+    iteration = 0
+    try:
+        # Dùng model dùng chung của process; câu hỏi trong phiên tiếp nối lịch sử của phiên
+        history = list(session.history) if session is not None else None
+        chat = get_model().start_chat(history=history, enable_automatic_function_calling=False)
+        
+        # Nội dung gửi tiếp cho model: câu hỏi, sau đó là kết quả các tool
+        message = question
+        
+        # Vòng lặp xử lý function calling
+        max_iterations = 10  # Giới hạn số lần gọi để tránh vòng lặp vô hạn
+        
+        for iteration in range(1, max_iterations + 1):
+            with span("llm", iteration=iteration, stream=stream_text):
+                response = await chat.send_message_async(message, stream=stream_text)
+                if stream_text:
+                    # Phát text ngay khi Gemini sinh ra; sau vòng lặp response chứa kết quả đầy đủ
+                    async for chunk in response:
+                        if chunk.candidates:
+                            text = _response_text(chunk.candidates[0])
+                            if text:
+                                yield {"event": "token", "text": text}
+            
+            # Kiểm tra xem có function call không
+            if not response.candidates:
+                yield {"event": "error", "message": "Lỗi: Không nhận được phản hồi từ model"}
+                return
+            
+            candidate = response.candidates[0]
+            function_calls = _function_calls(candidate)
+            
+            # Nếu model trả về text (không có function call), trả về kết quả
+            if not function_calls:
+                text = _response_text(candidate)
+                if text:
+                    if session is not None:
+                        session.update_history(chat.history)
+                    yield {"event": "answer", "answer": text}
+                else:
+                    # Không có function call và không có text
+                    yield {"event": "error", "message": "Lỗi: Không thể xử lý câu hỏi"}
+                return
+            
+            for function_call in function_calls:
+                if function_call.name not in AVAILABLE_FUNCTIONS:
+                    yield {"event": "error", "message": f"Lỗi: Function '{function_call.name}' không được hỗ trợ"}
+                    return
+            
+            # Chạy đồng thời tất cả function call trong lượt này, báo kết quả theo thứ tự hoàn thành
+            tasks = {}
+            for function_call in function_calls:
+                yield {"event": "tool_call", "name": function_call.name, "args": _function_args(function_call)}
+                task = asyncio.ensure_future(_execute_function_call_async(function_call, session))
+                tasks[task] = function_call.name
+            
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield {"event": "tool_result", "name": tasks[task], "result": task.result()}
+            
+            # Gửi tất cả kết quả về cho model trong một message (giữ thứ tự function call)
+            message = load_genai().protos.Content(parts=[
+                _function_response_part(name, task.result()) for task, name in tasks.items()
+            ])
+        
+        # Nếu vượt quá số lần lặp
+        ERRORS.labels("max_iterations").inc()
+        yield {"event": "error", "message": "Lỗi: Đã vượt quá số lần gọi function tối đa"}
+        
+    except Exception as e:
+        ERRORS.labels("agent").inc()
+        logger.exception("Lỗi khi chạy agent")
+        yield {"event": "error", "message": f"Lỗi khi chạy agent: {str(e)}"}
+    finally:
+        QUERY_ITERATIONS.observe(iteration)
+
+
+async def run_agent_query_async(question: str, session=None) -> str:
+    """
+    Phiên bản async của run_agent_query, dùng cho FastAPI
+    
+    Gọi Gemini qua send_message_async và chạy tools qua _call_function_async
+    nên không chặn event loop của uvicorn trong lúc chờ LLM hoặc vnstock.
+    Các function call trong cùng một lượt được chạy đồng thời.
+    
+    Args:
+        question: Câu hỏi của người dùng
+        session: Phiên hội thoại (xem stream_agent_query), None = câu hỏi độc lập
+    
+    Returns:
+        Câu trả lời từ agent
+    """
+    async with contextlib.aclosing(stream_agent_query(question, stream_text=False, session=session)) as events:
+        async for event in events:
+            if event["event"] == "answer":
+                return event["answer"]
+            if event["event"] == "error":
+                return event["message"]
+    
+    return "Lỗi: Không thể xử lý câu hỏi"
 
 
 # Test agent
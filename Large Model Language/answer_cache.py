@@ -0,0 +1,154 @@
+"""
+Cache câu trả lời cho tới khi dữ liệu thị trường có thể đã thay đổi
+- Câu trả lời của fast path (route cố định, dựng từ tool) theo ý định: các câu hỏi khác
+  cách viết nhưng cùng route ("Thông tin FPT?", "thong tin fpt") dùng chung
+- Câu trả lời tự do của LLM theo câu hỏi đã chuẩn hóa (bỏ dấu, chữ thường) và khoảng ngày
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from cache import is_session_open, last_closed_session, market_now, next_session_open
+from intent import Intent, parse_intent
+from observability import CACHE_REQUESTS
+from router import plan_route
+from shared_state import shared_state
+
+
+# Cấu hình cache (có thể thay đổi qua biến môi trường)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))  # Số câu trả lời giữ lại
+ANSWER_CACHE_OPEN_TTL = float(os.getenv("ANSWER_CACHE_OPEN_TTL", "60"))  # TTL (giây) khi dữ liệu thuộc phiên đang mở
+ANSWER_CACHE_MAX_TTL = float(os.getenv("ANSWER_CACHE_MAX_TTL", "86400"))  # TTL (giây) tối đa của mọi câu trả lời
+
+
+class AnswerCache:
+    """
+    Cache LRU câu trả lời theo Intent.key (fast path) hoặc Intent.question_key (LLM),
+    hết hạn theo độ tươi của dữ liệu thị trường
+
+    - Khoảng ngày chỉ gồm các phiên đã đóng cửa: giữ tới ANSWER_CACHE_MAX_TTL
+    - Khoảng ngày gồm phiên chưa đóng cửa: TTL ngắn khi đang trong phiên,
+      ngoài giờ giao dịch thì giữ tới lúc mở cửa phiên kế tiếp
+    - Khi bật SHARED_STATE_DB, câu trả lời được ghi cả vào bảng dùng chung để các worker khác dùng lại
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, open_ttl: float = ANSWER_CACHE_OPEN_TTL,
+                 max_ttl: float = ANSWER_CACHE_MAX_TTL, clock=market_now, shared=shared_state):
+        self.max_entries = max_entries
+        self.open_ttl = open_ttl
+        self.max_ttl = max_ttl
+        self.clock = clock
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Khóa -> (câu trả lời, thời điểm hết hạn)
+        self._lock = threading.Lock()
+
+    def parse(self, question: str) -> Intent:
+        """Phân tích câu hỏi với ngày hiện tại theo đồng hồ của cache"""
+        return parse_intent(question, self.clock().date())
+
+    @staticmethod
+    def keys(intent: Intent) -> list:
+        """Các khóa có thể chứa câu trả lời cho intent: theo câu hỏi, thêm theo ý định nếu fast path trả lời được"""
+        keys = [intent.question_key]
+        if plan_route(intent) is not None:
+            keys.append(intent.key)
+        return keys
+
+    def get(self, intent: Intent):
+        """Câu trả lời còn hạn cho intent, hoặc None (có cập nhật bộ đếm hit/miss)"""
+        now = self.clock()
+        keys = self.keys(intent)
+        for key in keys:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and now < entry[1]:
+                    self._entries.move_to_end(key)
+                    return self._hit(entry[0])
+                if entry is not None:
+                    del self._entries[key]
+
+        if self.shared.enabled and self.max_entries > 0:
+            for key in keys:
+                entry = self.shared.get("answer", repr(key))
+                if entry is not None and now < entry[1]:
+                    with self._lock:
+                        self._store(key, *entry)
+                    return self._hit(entry[0])
+
+        with self._lock:
+            self.misses += 1
+        CACHE_REQUESTS.labels("answer", "miss").inc()
+        return None
+
+    def _hit(self, answer: str) -> str:
+        with self._lock:
+            self.hits += 1
+        CACHE_REQUESTS.labels("answer", "hit").inc()
+        return answer
+
+    def put(self, intent: Intent, answer: str, fast_path: bool = False):
+        """
+        Lưu câu trả lời với thời điểm hết hạn tính theo expires_at
+
+        Args:
+            fast_path: Câu trả lời dựng từ route cố định (dùng chung cho cả ý định);
+                False = câu trả lời tự do của LLM, chỉ dùng lại cho cùng câu hỏi
+        """
+        now = self.clock()
+        key = intent.key if fast_path else intent.question_key
+        expires_at = self.expires_at(intent, now)
+        with self._lock:
+            self._store(key, answer, expires_at)
+        if self.max_entries > 0:
+            self.shared.put("answer", repr(key), (answer, expires_at), (expires_at - now).total_seconds())
+
+    def _store(self, key, answer: str, expires_at: datetime):
+        self._entries[key] = (answer, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def expires_at(self, intent: Intent, now: datetime) -> datetime:
+        """Thời điểm câu trả lời cho intent có thể đã lỗi thời"""
+        latest = now + timedelta(seconds=self.max_ttl)
+
+        if intent.kind == "company":
+            return latest
+
+        if intent.kind in ("price", "indicator"):
+            closed = last_closed_session(now).isoformat()
+            if intent.end_date <= closed:
+                # Dữ liệu của các phiên đã đóng cửa không còn thay đổi
+                return latest
+
+        # Dữ liệu gồm phiên chưa đóng cửa (hoặc không rõ thời gian)
+        if is_session_open(now):
+            return min(latest, now + timedelta(seconds=self.open_ttl))
+        return min(latest, next_session_open(now))
+
+    def clear(self):
+        """Xóa toàn bộ câu trả lời và bộ đếm"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Bộ đếm hit/miss và kích thước hiện tại"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+            }
+
+
+# Cache dùng chung cho toàn bộ process
+answer_cache = AnswerCache()
@@ -0,0 +1,402 @@
+"""
+Kho nến ngày OHLCV dạng cột cho toàn sàn, đọc bằng memory-map (np.memmap)
+Mỗi trường (open, high, low, close, volume) là một file nhị phân float64 hình chữ nhật
+[ngày giao dịch x mã]; dates.bin giữ trục ngày, meta.json giữ danh sách mã và khoảng
+ngày đã nạp của từng mã. Đọc một lát (một mã hoặc cả sàn trong một khoảng ngày) chỉ là
+view trên memmap, không copy và không gọi nguồn dữ liệu
+
+Ghi: một tiến trình ghi duy nhất (lệnh ingest bên dưới). Thêm phiên mới chỉ nối thêm
+hàng vào cuối file; khi cần chèn ngày ở giữa hoặc hết chỗ cho mã mới thì ghi lại toàn
+bộ sang thế hệ file mới rồi đổi meta.json (atomic), người đọc không thấy trạng thái dở dang
+
+Chạy:
+    python bar_store.py ingest --start 2015-01-01      # backfill toàn sàn, lần sau chỉ nối phiên mới
+    python bar_store.py ingest --tickers FPT,VCB
+    python bar_store.py info
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from cache import PRICE_COLUMNS, has_trading_day, last_closed_session
+from observability import CACHE_REQUESTS, logger
+
+
+# Cấu hình (có thể thay đổi qua biến môi trường)
+BAR_STORE_DIR = os.getenv("BAR_STORE_DIR", "")  # Thư mục kho nến, rỗng = tắt (tools đọc qua PriceCache như cũ)
+BAR_STORE_START = os.getenv("BAR_STORE_START", "2015-01-01")  # Ngày bắt đầu backfill cho mã chưa có trong kho
+BAR_STORE_CAPACITY = int(os.getenv("BAR_STORE_CAPACITY", "2048"))  # Số cột mã dành sẵn (gấp đôi khi hết chỗ)
+BAR_STORE_BATCH = 50  # Số mã mỗi lần ghi khi ingest
+BAR_STORE_RATE = float(os.getenv("BAR_STORE_RATE", "2"))  # Số lần gọi nguồn dữ liệu tối đa mỗi giây khi ingest
+
+FIELDS = ("open", "high", "low", "close", "volume")
+META_FILE = "meta.json"
+
+
+def _day(value) -> np.datetime64:
+    return np.datetime64(value, "D")
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """Trạng thái kho đã công bố; đổi cả tham chiếu một lần nên người đọc không khóa"""
+    generation: int = 0
+    capacity: int = 0
+    tickers: tuple = ()
+    columns: dict = field(default_factory=dict)  # mã -> chỉ số cột
+    coverage: dict = field(default_factory=dict)  # mã -> (ngày đầu, ngày cuối) đã nạp
+    dates: np.ndarray = field(default_factory=lambda: np.empty(0, dtype="datetime64[D]"))
+    fields: dict = field(default_factory=dict)  # trường -> memmap [ngày x cột]
+
+    @property
+    def rows(self) -> int:
+        return len(self.dates)
+
+
+class BarStore:
+    """
+    Kho nến ngày dạng cột, an toàn khi đọc từ nhiều thread
+
+    Ô không có phiên (mã chưa niêm yết, tạm ngừng giao dịch, chưa nạp) mang giá trị NaN.
+    Kho không phân biệt nguồn: nến được nạp qua source_pool (có failover) và chỉ gồm
+    các phiên đã đóng cửa.
+    """
+
+    def __init__(self, path: str = BAR_STORE_DIR, capacity: int = BAR_STORE_CAPACITY):
+        self.path = path
+        self.initial_capacity = capacity
+        self._snapshot = _Snapshot()
+        self._meta_mtime = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    # ---- Đọc ----
+
+    def _file(self, name: str, generation: int) -> str:
+        return os.path.join(self.path, f"{name}.{generation}.bin")
+
+    def _current(self) -> _Snapshot:
+        """Snapshot mới nhất; nạp lại memmap khi meta.json đổi (tiến trình ingest vừa ghi xong)"""
+        if not self.enabled:
+            return self._snapshot
+        try:
+            mtime = os.stat(os.path.join(self.path, META_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return self._snapshot
+        if mtime != self._meta_mtime:
+            with self._lock:
+                if mtime != self._meta_mtime:
+                    self._snapshot = self._open()
+                    self._meta_mtime = mtime
+        return self._snapshot
+
+    def _open(self) -> _Snapshot:
+        with open(os.path.join(self.path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        generation, capacity, rows = meta["generation"], meta["capacity"], meta["rows"]
+        tickers = tuple(meta["tickers"])
+        coverage = {t: (date.fromisoformat(s), date.fromisoformat(e)) for t, (s, e) in meta["coverage"].items()}
+        if rows:
+            dates = np.memmap(self._file("dates", generation), dtype="datetime64[D]", mode="r", shape=(rows,))
+            fields = {
+                name: np.memmap(self._file(name, generation), dtype=np.float64, mode="r", shape=(rows, capacity))
+                for name in FIELDS
+            }
+        else:
+            dates = np.empty(0, dtype="datetime64[D]")
+            fields = {name: np.empty((0, capacity)) for name in FIELDS}
+        return _Snapshot(generation, capacity, tickers, {t: i for i, t in enumerate(tickers)}, coverage, dates, fields)
+
+    @staticmethod
+    def _covered(snapshot: _Snapshot, ticker: str, start: date, end: date) -> bool:
+        span = snapshot.coverage.get(ticker)
+        return span is not None and span[0] <= start and end <= span[1]
+
+    def covers(self, ticker: str, start: date, end: date) -> bool:
+        """Kho đã nạp đủ [start, end] cho mã này chưa"""
+        return self._covered(self._current(), ticker, start, end)
+
+    @staticmethod
+    def _row_range(snapshot: _Snapshot, start: date, end: date) -> slice:
+        dates = snapshot.dates
+        return slice(int(np.searchsorted(dates, _day(start), "left")), int(np.searchsorted(dates, _day(end), "right")))
+
+    def slice(self, ticker: str, start: date, end: date):
+        """
+        Lát nến của một mã dạng view trên memmap (không copy; NaN ở phiên không giao dịch)
+
+        Returns:
+            (mảng ngày, dict trường -> mảng giá trị) hoặc None nếu kho chưa phủ khoảng ngày này
+        """
+        snapshot = self._current()
+        if not self._covered(snapshot, ticker, start, end):
+            return None
+        rows = self._row_range(snapshot, start, end)
+        column = snapshot.columns[ticker]
+        return snapshot.dates[rows], {name: snapshot.fields[name][rows, column] for name in FIELDS}
+
+    def panel(self, start: date, end: date):
+        """
+        Toàn sàn trong [start, end] dạng view 2 chiều [ngày x mã] (không copy), đọc từ cùng một snapshot
+
+        Returns:
+            (mảng ngày, tuple mã, dict trường -> mảng giá trị, dict coverage);
+            chỉ tin các ô của mã có coverage phủ khoảng ngày
+        """
+        snapshot = self._current()
+        rows = self._row_range(snapshot, start, end)
+        count = len(snapshot.tickers)
+        values = {name: snapshot.fields[name][rows, :count] if snapshot.fields else np.empty((0, 0)) for name in FIELDS}
+        return snapshot.dates[rows], snapshot.tickers, values, snapshot.coverage
+
+    def read(self, ticker: str, start: date, end: date):
+        """
+        Giá lịch sử một mã dạng DataFrame PRICE_COLUMNS (bỏ các phiên không giao dịch)
+
+        Returns:
+            DataFrame, hoặc None nếu kho chưa phủ khoảng ngày này
+        """
+        if not self.enabled:
+            return None
+        lot = self.slice(ticker, start, end)
+        if lot is None:
+            CACHE_REQUESTS.labels("bar_store", "miss").inc()
+            return None
+        CACHE_REQUESTS.labels("bar_store", "hit").inc()
+        dates, values = lot
+        traded = ~np.isnan(values["close"])
+        df = pd.DataFrame({"time": dates[traded].astype("datetime64[ns]")})
+        for name in FIELDS:
+            df[name] = values[name][traded]
+        df["volume"] = df["volume"].astype("int64")
+        return df
+
+    def missing(self, ticker: str, start: date, end: date) -> list:
+        """Các đoạn ngày còn thiếu (ở đầu/cuối coverage) cần tải để kho phủ [start, end]"""
+        span = self._current().coverage.get(ticker)
+        if span is None:
+            segments = [(start, end)]
+        else:
+            segments = []
+            if start < span[0]:
+                segments.append((start, span[0] - timedelta(days=1)))
+            if end > span[1]:
+                segments.append((span[1] + timedelta(days=1), end))
+        return [(s, e) for s, e in segments if s <= e]
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        snapshot = self._current()
+        return {
+            "enabled": True,
+            "tickers": len(snapshot.tickers),
+            "sessions": snapshot.rows,
+            "first_session": str(snapshot.dates[0]) if snapshot.rows else None,
+            "last_session": str(snapshot.dates[-1]) if snapshot.rows else None,
+            "capacity": snapshot.capacity,
+            "bytes": snapshot.rows * snapshot.capacity * 8 * len(FIELDS),
+        }
+
+    # ---- Ghi (một tiến trình ghi duy nhất) ----
+
+    def write(self, batch: dict):
+        """
+        Ghi nến cho nhiều mã rồi công bố bằng một lần đổi meta.json
+
+        Args:
+            batch: mã -> (DataFrame PRICE_COLUMNS, ngày đầu, ngày cuối đã tải).
+                   Khoảng ngày phải liền với coverage cũ của mã (xem missing()).
+        """
+        if not self.enabled:
+            raise RuntimeError("BAR_STORE_DIR chưa được cấu hình")
+        with self._write_lock:
+            os.makedirs(self.path, exist_ok=True)
+            old = self._current()
+            frames = {ticker: frame.dropna(subset=["close"]) for ticker, (frame, _, _) in batch.items()}
+            old_dates = np.asarray(old.dates)
+            new_dates = np.unique(np.concatenate(
+                [old_dates[:0]] + [frame["time"].to_numpy().astype("datetime64[D]") for frame in frames.values()]
+            ))
+            inserted = new_dates[~np.isin(new_dates, old_dates)]
+            tickers = old.tickers + tuple(t for t in batch if t not in old.columns)
+
+            if len(tickers) > old.capacity or (old.rows and len(inserted) and inserted[0] < old_dates[-1]):
+                capacity = max(old.capacity, self.initial_capacity)
+                while capacity < len(tickers):
+                    capacity *= 2
+                generation = self._rewrite(old, np.union1d(old_dates, inserted), capacity)
+            else:
+                capacity, generation = old.capacity, old.generation
+                self._append(inserted, capacity, generation)
+
+            dates = np.union1d(old_dates, inserted)
+            columns = {t: i for i, t in enumerate(tickers)}
+            arrays = {
+                name: np.memmap(self._file(name, generation), dtype=np.float64, mode="r+", shape=(len(dates), capacity))
+                for name in FIELDS
+            } if len(dates) else {}
+            for ticker, frame in frames.items():
+                if frame.empty:
+                    continue
+                rows = np.searchsorted(dates, frame["time"].to_numpy().astype("datetime64[D]"))
+                for name in FIELDS:
+                    arrays[name][rows, columns[ticker]] = frame[name].to_numpy(dtype=np.float64)
+            for array in arrays.values():
+                array.flush()
+            del arrays
+
+            coverage = dict(old.coverage)
+            for ticker, (_, start, end) in batch.items():
+                span = coverage.get(ticker)
+                coverage[ticker] = (min(start, span[0]), max(end, span[1])) if span else (start, end)
+            self._publish({
+                "generation": generation, "capacity": capacity, "rows": len(dates), "tickers": list(tickers),
+                "coverage": {t: (s.isoformat(), e.isoformat()) for t, (s, e) in coverage.items()},
+            })
+            if generation != old.generation:
+                self._remove_generation(old.generation)
+
+    def _append(self, dates: np.ndarray, capacity: int, generation: int):
+        """Nối các phiên mới (sau phiên cuối) vào cuối mọi file, ô mới mang NaN"""
+        if not len(dates):
+            return
+        with open(self._file("dates", generation), "ab") as f:
+            f.write(dates.astype("datetime64[D]").tobytes())
+        empty = np.full((len(dates), capacity), np.nan).tobytes()
+        for name in FIELDS:
+            with open(self._file(name, generation), "ab") as f:
+                f.write(empty)
+
+    def _rewrite(self, old: _Snapshot, dates: np.ndarray, capacity: int) -> int:
+        """Ghi toàn bộ sang thế hệ file mới với trục ngày và số cột mới"""
+        generation = old.generation + 1
+        positions = np.searchsorted(dates, np.asarray(old.dates))
+        dates.astype("datetime64[D]").tofile(self._file("dates", generation))
+        for name in FIELDS:
+            target = np.memmap(self._file(name, generation), dtype=np.float64, mode="w+", shape=(len(dates), capacity))
+            target[:] = np.nan
+            if old.rows:
+                target[positions, :old.capacity] = old.fields[name]
+            target.flush()
+            del target
+        logger.info("Ghi lại kho nến: %d phiên x %d cột (thế hệ %d)", len(dates), capacity, generation)
+        return generation
+
+    def _publish(self, meta: dict):
+        """Đổi meta.json (atomic) để người đọc chuyển sang dữ liệu mới"""
+        meta_path = os.path.join(self.path, META_FILE)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        with self._lock:
+            self._snapshot = self._open()
+            self._meta_mtime = os.stat(meta_path).st_mtime_ns
+
+    def _remove_generation(self, generation: int):
+        for name in ("dates",) + FIELDS:
+            try:
+                os.remove(self._file(name, generation))
+            except OSError:
+                pass  # Kho rỗng chưa có file, hoặc file còn đang được map (Windows)
+
+
+def ingest(store: BarStore, tickers, start: date, end: date, fetch, rate: float = BAR_STORE_RATE,
+           batch_size: int = BAR_STORE_BATCH, sleep=time.sleep) -> dict:
+    """
+    Backfill và nối nến ngày cho danh sách mã, chỉ tải các đoạn kho còn thiếu
+
+    Args:
+        fetch: Hàm fetch(ticker, start_date, end_date) -> DataFrame gọi nguồn thật
+        end: Ngày cuối (được cắt về phiên gần nhất đã đóng cửa)
+
+    Returns:
+        {"tickers": số mã đã ghi, "bars": số nến, "errors": {mã: lỗi}}
+    """
+    from sources import normalize_history
+
+    end = min(end, last_closed_session())
+    interval = 1.0 / rate if rate > 0 else 0.0
+    batch, errors, written, bars = {}, {}, 0, 0
+    for ticker in tickers:
+        segments = store.missing(ticker, start, end)
+        if not segments:
+            continue
+        try:
+            frames = []
+            for seg_start, seg_end in segments:
+                if has_trading_day(seg_start, seg_end):
+                    frames.append(normalize_history(fetch(ticker, seg_start.isoformat(), seg_end.isoformat())))
+                    sleep(interval)
+        except Exception as e:
+            errors[ticker] = str(e)
+            logger.warning("Không tải được nến %s: %s", ticker, e)
+            continue
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PRICE_COLUMNS)
+        batch[ticker] = (frame, min(s for s, _ in segments), max(e for _, e in segments))
+        bars += len(frame)
+        if len(batch) >= batch_size:
+            store.write(batch)
+            written += len(batch)
+            batch = {}
+    if batch:
+        store.write(batch)
+        written += len(batch)
+    return {"tickers": written, "bars": bars, "errors": errors}
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Kho nến ngày OHLCV dạng cột (memory-map) cho toàn sàn")
+    parser.add_argument("--dir", default=BAR_STORE_DIR or "bar_store", help="Thư mục kho nến")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Backfill và nối các phiên mới")
+    ingest_parser.add_argument("--tickers", default="", help="Danh sách mã cách nhau bởi dấu phẩy; mặc định toàn sàn")
+    ingest_parser.add_argument("--start", default=BAR_STORE_START, help="Ngày bắt đầu (YYYY-MM-DD)")
+    ingest_parser.add_argument("--end", default=None, help="Ngày kết thúc, mặc định phiên gần nhất đã đóng cửa")
+    ingest_parser.add_argument("--rate", type=float, default=BAR_STORE_RATE, help="Số lần gọi nguồn mỗi giây")
+    commands.add_parser("info", help="Thống kê kho nến")
+    args = parser.parse_args(argv)
+
+    store = BarStore(args.dir)
+    if args.command == "info":
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+        return 0
+
+    from sources import source_pool
+    from tickers import ticker_index
+
+    if args.tickers:
+        tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()]
+    else:
+        if not ticker_index.load():
+            print("Không tải được danh mục mã niêm yết", file=sys.stderr)
+            return 1
+        tickers = ticker_index.listed_symbols()
+    end = date.fromisoformat(args.end) if args.end else last_closed_session()
+    started = time.perf_counter()
+    report = ingest(store, tickers, date.fromisoformat(args.start), end, source_pool.history, rate=args.rate)
+    print(f"Đã ghi {report['bars']} nến của {report['tickers']} mã trong {time.perf_counter() - started:.1f}s, "
+          f"{len(report['errors'])} lỗi")
+    return 1 if report["errors"] and not report["tickers"] else 0
+
+
+# Kho nến dùng chung cho toàn bộ process (tắt khi BAR_STORE_DIR rỗng)
+bar_store = BarStore()
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
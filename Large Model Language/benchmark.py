@@ -0,0 +1,511 @@
+"""
+Benchmark tải và độ trễ offline cho Vietnamese Financial AI Agent API
+Thay Gemini bằng model giả theo kịch bản function calling và nguồn VCI bằng dữ liệu
+OHLCV sinh sẵn, chạy main.app ngay trong process với mức đồng thời tùy chọn
+
+Cách dùng:
+    python benchmark.py --requests 200 --concurrency 16
+    python benchmark.py --llm-latency-ms 300 --source-latency-ms 80 --json
+    python benchmark.py --max-p95-ms 500   # exit code 1 nếu p95 vượt ngưỡng (dùng trong CI)
+    python benchmark.py --startup --max-import-ms 1500   # thời gian import main và warmup SDK
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import google.generativeai as genai
+
+import admission
+import agent
+import answer_cache
+import main
+import market_data
+import prewarm
+import router
+import sources
+import tickers
+import tools
+import warmup
+from bar_store import BarStore
+from cache import PriceCache, TTLCache, market_now
+from indicator_state import IndicatorStateStore
+from intent import parse_intent
+
+
+# Bộ câu hỏi mặc định, trộn các loại intent thường gặp
+DEFAULT_QUESTIONS = [
+    "Thông tin về công ty FPT?",
+    "Giá cổ phiếu VCB 1 tháng gần nhất?",
+    "Tính RSI 14 ngày của HPG?",
+    "RSI và MACD và SMA50 cho HPG 6 tháng gần nhất",
+    "So sánh giá VCB, BID, CTG, TCB 3 tháng qua",
+    "Thông tin VNM?",
+    "Giá MWG năm 2024",
+    "Tính SMA 20 ngày của FPT?",
+]
+
+
+class StageTimer:
+    """Cộng dồn thời gian theo từng giai đoạn (llm, tool, source, serialization), an toàn đa luồng"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.totals[stage] += elapsed
+                self.counts[stage] += 1
+
+    def wrap(self, stage: str, func):
+        """Bọc một hàm đồng bộ để đo thời gian mỗi lần gọi"""
+        def wrapper(*args, **kwargs):
+            with self.measure(stage):
+                return func(*args, **kwargs)
+        wrapper.__name__ = getattr(func, "__name__", stage)
+        return wrapper
+
+
+# Nguồn dữ liệu giả lập (thay cho vnstock/VCI)
+def fixture_history(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """Sinh nến ngày xác định theo mã: cùng (ticker, ngày) luôn cho cùng giá"""
+    days = pd.bdate_range(start_date, end_date)
+    if len(days) == 0:
+        return pd.DataFrame(columns=["time", "open", "high", "low", "close", "volume"])
+
+    seed = zlib.crc32(ticker.encode())
+    # Giá là hàm của seed theo mã và số thứ tự ngày nên ổn định giữa các khoảng ngày khác nhau
+    day_index = (days - pd.Timestamp("2000-01-01")).days.to_numpy()
+    trend = np.sin(day_index * 0.01 + seed % 7) * 8
+    noise = np.sin(day_index * 0.37 + seed % 97) + np.cos(day_index * 0.11 + seed % 13) * 0.5
+    close = 20 + seed % 80 + trend + noise
+    return pd.DataFrame({
+        "time": days,
+        "open": close - 0.2,
+        "high": close + 0.5,
+        "low": close - 0.5,
+        "close": close.round(2),
+        "volume": (1_000_000 + (day_index * 7919 + seed) % 500_000).astype(np.int64),
+    })
+
+
+class FixtureStock:
+    """Handle stock giả có cùng giao diện .quote.history và .company.overview với vnstock"""
+
+    def __init__(self, ticker: str, latency: float, timer: StageTimer):
+        def history(start, end, **kwargs):
+            with timer.measure("source"):
+                time.sleep(latency)
+                return fixture_history(ticker, start, end)
+
+        def overview(**kwargs):
+            with timer.measure("source"):
+                time.sleep(latency)
+                return pd.DataFrame([{
+                    "symbol": ticker,
+                    "icb_name3": "Ngành giả lập",
+                    "charter_capital": 10_000_000_000,
+                    "company_profile": f"Công ty cổ phần {ticker} (dữ liệu benchmark offline)",
+                }])
+
+        self.quote = SimpleNamespace(history=history)
+        self.company = SimpleNamespace(overview=overview)
+
+
+def fixture_listing() -> list:
+    """Danh mục mã giả lập thay cho listing của vnstock"""
+    symbols = ["FPT", "VCB", "BID", "CTG", "TCB", "HPG", "VNM", "MWG", "SSI", "VIC"]
+    return [tickers.TickerInfo(symbol=s, exchange="HSX", type="STOCK", name=f"Công ty cổ phần {s}") for s in symbols]
+
+
+# Model Gemini giả lập theo kịch bản
+def _response(parts) -> genai.types.AsyncGenerateContentResponse:
+    """Đóng gói parts thành response cùng kiểu với response thật của SDK"""
+    result = genai.protos.GenerateContentResponse(candidates=[
+        genai.protos.Candidate(content=genai.protos.Content(role="model", parts=parts))
+    ])
+    return genai.types.AsyncGenerateContentResponse.from_response(result)
+
+
+def scripted_calls(question: str) -> list:
+    """
+    Kịch bản function calling cho một câu hỏi, dựa trên intent của câu hỏi
+
+    Returns:
+        Danh sách (tên function, args) model giả sẽ gọi trong lượt đầu tiên
+    """
+    intent = parse_intent(question, market_now().date())
+    tickers = list(intent.tickers) or ["FPT"]
+
+    if intent.kind == "indicator":
+        return [("calculate_technical_indicators", {
+            "ticker": ticker, "indicators": list(intent.indicators),
+            "start_date": intent.start_date, "end_date": intent.end_date,
+        }) for ticker in tickers]
+
+    if intent.kind == "price":
+        # Nhiều mã -> nhiều function call song song trong cùng một lượt
+        return [("get_historical_price", {
+            "ticker": ticker, "start_date": intent.start_date, "end_date": intent.end_date,
+        }) for ticker in tickers]
+
+    return [("get_company_info", {"ticker": ticker}) for ticker in tickers]
+
+
+class ScriptedChat:
+    """
+    Chat session giả: lượt 1 gọi tools theo kịch bản, lượt 2 trả lời bằng text
+    Giữ history như ChatSession thật (dùng cho các phiên hội thoại nhiều lượt)
+    """
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.turn = 0
+        self.history = list(history or [])
+
+    async def send_message_async(self, content, stream=False):
+        with self.model.timer.measure("llm"):
+            await asyncio.sleep(self.model.latency)
+            self.turn += 1
+            if isinstance(content, str):
+                self.history.append(genai.protos.Content(role="user", parts=[genai.protos.Part(text=content)]))
+            else:
+                self.history.append(genai.protos.Content(role="user", parts=content.parts))
+
+            if self.turn == 1:
+                parts = [
+                    genai.protos.Part(function_call=genai.protos.FunctionCall(name=name, args=args))
+                    for name, args in scripted_calls(str(content))
+                ]
+            else:
+                results = [part.function_response.response["result"] for part in content.parts]
+                text = f"Trả lời offline dựa trên {len(results)} kết quả tool ({sum(len(r) for r in results)} ký tự)"
+                parts = [genai.protos.Part(text=text)]
+            self.history.append(genai.protos.Content(role="model", parts=parts))
+            return _response(parts)
+
+
+class ScriptedModel:
+    """GenerativeModel giả, độ trễ mỗi lượt LLM cố định"""
+
+    def __init__(self, timer: StageTimer, latency: float):
+        self.timer = timer
+        self.latency = latency
+
+    def start_chat(self, history=None, **kwargs):
+        return ScriptedChat(self, history)
+
+
+@contextmanager
+def offline_environment(timer: StageTimer, llm_latency: float = 0.0, source_latency: float = 0.0,
+                        use_answer_cache: bool = False, fast_path: bool = True):
+    """
+    Thay Gemini và nguồn dữ liệu bằng bản giả lập, khôi phục lại khi thoát
+
+    Args:
+        timer: StageTimer ghi nhận thời gian từng giai đoạn
+        llm_latency: Độ trễ giả lập (giây) mỗi lượt gọi Gemini
+        source_latency: Độ trễ giả lập (giây) mỗi lần gọi nguồn dữ liệu
+        use_answer_cache: Giữ cache câu trả lời (mặc định tắt để đo toàn bộ pipeline)
+        fast_path: Cho phép câu hỏi đơn giản đi fast path (router.py) thay vì qua LLM
+    """
+    patches = []
+
+    def patch(obj, name, value):
+        patches.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    previous_key = os.environ.get("GEMINI_API_KEY")
+    os.environ["GEMINI_API_KEY"] = previous_key or "offline-benchmark"
+
+    patch(agent, "GEMINI_API_KEY", os.environ["GEMINI_API_KEY"])
+    patch(agent, "_model", ScriptedModel(timer, llm_latency))
+    patch(agent, "get_model", lambda: agent._model)
+    patch(agent, "AVAILABLE_FUNCTIONS", {
+        name: timer.wrap("tool", func) for name, func in agent.AVAILABLE_FUNCTIONS.items()
+    })
+    # Fast path gọi thẳng tools.<tên>, cũng tính vào giai đoạn tool
+    for name in agent.AVAILABLE_FUNCTIONS:
+        patch(tools, name, timer.wrap("tool", getattr(tools, name)))
+    patch(router, "FAST_PATH_ENABLED", fast_path)
+    patch(sources, "get_stock", lambda ticker, source='VCI': FixtureStock(ticker, source_latency, timer))
+    patch(market_data, "price_cache", PriceCache())
+    patch(market_data, "company_cache", TTLCache("company", max_entries=0, ttl=0))
+    patch(market_data, "bar_store", BarStore(""))
+    # Không làm nóng cache trong lúc đo (lifespan của main)
+    patch(prewarm, "PREWARM_ENABLED", False)
+    patch(warmup, "WARMUP_ENABLED", False)
+    patch(main, "admission", admission.AdmissionController())
+    patch(tools, "indicator_states", IndicatorStateStore())
+    patch(tools, "shape_price_payload", timer.wrap("serialization", tools.shape_price_payload))
+    index = tickers.TickerIndex(path="", fetch=fixture_listing)
+    patch(market_data, "ticker_index", index)
+    patch(main, "ticker_index", index)
+    if not use_answer_cache:
+        patch(main, "answer_cache", answer_cache.AnswerCache(max_entries=0))
+
+    try:
+        yield
+    finally:
+        for obj, name, value in reversed(patches):
+            setattr(obj, name, value)
+        if previous_key is None:
+            os.environ.pop("GEMINI_API_KEY", None)
+
+
+async def asgi_request(app, method: str, path: str, body: dict = None, client: str = "127.0.0.1") -> tuple:
+    """
+    Gửi một request HTTP trực tiếp vào ứng dụng ASGI (không qua mạng)
+
+    Returns:
+        Tuple (status code, body bytes)
+    """
+    payload = json.dumps(body or {}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": (client, 50000), "server": ("benchmark", 80),
+    }
+    received = False
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def percentile(values, pct: float) -> float:
+    return float(np.percentile(values, pct)) if len(values) else 0.0
+
+
+async def run_benchmark(questions=None, total_requests: int = 100, concurrency: int = 8,
+                        llm_latency_ms: float = 0.0, source_latency_ms: float = 0.0,
+                        use_answer_cache: bool = False, fast_path: bool = True, path: str = "/query") -> dict:
+    """
+    Chạy benchmark và trả về báo cáo
+
+    Returns:
+        Dict gồm số request, lỗi, throughput, p50/p95/p99 (ms) và thời gian theo giai đoạn
+    """
+    questions = questions or DEFAULT_QUESTIONS
+    timer = StageTimer()
+    latencies = []
+    errors = []
+
+    with offline_environment(timer, llm_latency_ms / 1000, source_latency_ms / 1000, use_answer_cache, fast_path):
+        async with main.app.router.lifespan_context(main.app):
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(i):
+                async with semaphore:
+                    started = time.perf_counter()
+                    # Mỗi request giả lập một người dùng khác nhau (giới hạn theo client của admission control)
+                    status, body = await asgi_request(main.app, "POST", path, {"question": questions[i % len(questions)]},
+                                                      client=f"10.0.{i // 250 % 250}.{i % 250 + 1}")
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if status != 200:
+                        errors.append({"status": status, "body": body.decode(errors="replace")[:200]})
+
+            started = time.perf_counter()
+            await asyncio.gather(*[one(i) for i in range(total_requests)])
+            wall = time.perf_counter() - started
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "fast_path": fast_path,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total_requests / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies), 2) if latencies else 0.0,
+        },
+        "stages_ms_per_request": {
+            stage: round(total * 1000 / total_requests, 3) for stage, total in sorted(timer.totals.items())
+        },
+        "stage_calls": dict(sorted(timer.counts.items())),
+    }
+
+
+# Module nặng phải được nạp lười: import main không được kéo theo các module này
+LAZY_MODULES = ("google.generativeai", "vnstock", "vnai")
+
+# Chạy trong interpreter mới: đo import main (process sẵn sàng trả lời /live) rồi warmup (sẵn sàng /ready)
+STARTUP_SCRIPT = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+eager = [name for name in {lazy!r} if name in sys.modules]
+asyncio.run(main.warmup.warmer.run())
+print(json.dumps({{"import_s": imported - started, "warmup_s": time.perf_counter() - imported,
+                  "eager_modules": eager, "warmup": main.warmup.warmer.stats()}}))
+"""
+
+
+def measure_startup(runs: int = 3) -> dict:
+    """
+    Đo chi phí khởi động, mỗi lần trong một process Python mới (không dùng lại module đã import)
+
+    Returns:
+        Dict gồm thời gian import main, thời gian warmup và từng bước (ms, trung vị và max),
+        cùng các module nặng bị import sớm
+    """
+    script = STARTUP_SCRIPT.format(lazy=LAZY_MODULES)
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        # vnstock/vnai in thông báo ra stdout khi import, kết quả là dòng cuối
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    def summary(values):
+        values = [value * 1000 for value in values]
+        return {"p50": round(percentile(values, 50), 1), "max": round(max(values), 1)}
+
+    steps = samples[0]["warmup"]["durations_s"]
+    return {
+        "runs": runs,
+        "import_ms": summary([sample["import_s"] for sample in samples]),
+        "warmup_ms": summary([sample["warmup_s"] for sample in samples]),
+        "warmup_steps_ms": {
+            step: summary([sample["warmup"]["durations_s"][step] for sample in samples]) for step in steps
+        },
+        "warmup_errors": samples[-1]["warmup"]["errors"],
+        "eager_modules": sorted({name for sample in samples for name in sample["eager_modules"]}),
+    }
+
+
+def print_startup_report(report: dict):
+    """In báo cáo thời gian khởi động dạng bảng"""
+    print("=" * 60)
+    print(" STARTUP BENCHMARK - Vietnamese Financial AI Agent")
+    print("=" * 60)
+    print(f" Runs: {report['runs']}")
+    print(f" Import main (liveness):  p50={report['import_ms']['p50']}ms  max={report['import_ms']['max']}ms")
+    print(f" Warmup (readiness):      p50={report['warmup_ms']['p50']}ms  max={report['warmup_ms']['max']}ms")
+    for step, value in report["warmup_steps_ms"].items():
+        print(f"   {step:<14} p50={value['p50']}ms")
+    if report["eager_modules"]:
+        print(f" Module nặng bị import sớm: {', '.join(report['eager_modules'])}")
+    for step, error in report["warmup_errors"].items():
+        print(f" Lỗi warmup {step}: {error}")
+    print("=" * 60)
+
+
+def print_report(report: dict):
+    """In báo cáo dạng bảng"""
+    print("=" * 60)
+    print(" OFFLINE BENCHMARK - Vietnamese Financial AI Agent")
+    print("=" * 60)
+    print(f" Requests: {report['requests']}  Concurrency: {report['concurrency']}  Errors: {report['errors']}")
+    print(f" Wall time: {report['wall_s']}s  Throughput: {report['throughput_rps']} req/s")
+    latency = report["latency_ms"]
+    print(f" Latency (ms): p50={latency['p50']}  p95={latency['p95']}  p99={latency['p99']}  max={latency['max']}")
+    print(" Thời gian theo giai đoạn (ms/request, cộng dồn các lần gọi):")
+    for stage, value in report["stages_ms_per_request"].items():
+        print(f"   {stage:<14} {value:>10}  ({report['stage_calls'][stage]} lần gọi)")
+    for sample in report["error_samples"]:
+        print(f" Lỗi: {sample}")
+    print("=" * 60)
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline cho /query (Gemini và VCI giả lập)")
+    parser.add_argument("--requests", type=int, default=100, help="Tổng số request")
+    parser.add_argument("--concurrency", type=int, default=8, help="Số request đồng thời")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi lượt Gemini")
+    parser.add_argument("--source-latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi lần gọi nguồn dữ liệu")
+    parser.add_argument("--answer-cache", action="store_true", help="Bật cache câu trả lời")
+    parser.add_argument("--no-fast-path", action="store_true", help="Tắt fast path, mọi câu hỏi đều qua LLM")
+    parser.add_argument("--json", action="store_true", help="In báo cáo dạng JSON")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Ngưỡng p95; vượt ngưỡng trả exit code 1")
+    parser.add_argument("--startup", action="store_true", help="Đo thời gian khởi động thay vì tải /query")
+    parser.add_argument("--runs", type=int, default=3, help="Số lần đo khởi động (mỗi lần một process mới)")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="Ngưỡng p50 thời gian import main; vượt ngưỡng trả exit code 1")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        return startup_cli(args)
+
+    report = asyncio.run(run_benchmark(
+        total_requests=args.requests,
+        concurrency=args.concurrency,
+        llm_latency_ms=args.llm_latency_ms,
+        source_latency_ms=args.source_latency_ms,
+        use_answer_cache=args.answer_cache,
+        fast_path=not args.no_fast_path,
+    ))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+    if report["errors"]:
+        return 1
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"p95 {report['latency_ms']['p95']}ms vượt ngưỡng {args.max_p95_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+def startup_cli(args) -> int:
+    report = measure_startup(args.runs)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_startup_report(report)
+
+    if report["eager_modules"]:
+        print(f"import main kéo theo {', '.join(report['eager_modules'])}", file=sys.stderr)
+        return 1
+    if args.max_import_ms is not None and report["import_ms"]["p50"] > args.max_import_ms:
+        print(f"import main {report['import_ms']['p50']}ms vượt ngưỡng {args.max_import_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,368 @@
+"""
+Cache nhiều tầng cho dữ liệu giá lịch sử (OHLCV)
+Tầng 1: LRU trong bộ nhớ theo (ticker, source, khoảng ngày)
+Tầng 2: kho nến ngày SQLite theo (ticker, source), lưu trên đĩa nếu cấu hình PRICE_CACHE_DB
+(dùng chung giữa các worker khi chạy nhiều process, xem shared_state.py)
+Kèm cache TTL cho thông tin tổng quan công ty
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from observability import CACHE_REQUESTS
+from shared_state import SHARED_STATE_DB, connect, shared_state
+
+
+# Cấu hình cache (có thể thay đổi qua biến môi trường)
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "256"))  # Số khoảng ngày giữ trong LRU
+# Đường dẫn file SQLite, rỗng = chỉ giữ trong bộ nhớ (nhiều worker: mặc định dùng chung file SHARED_STATE_DB)
+PRICE_CACHE_DB = os.getenv("PRICE_CACHE_DB", "") or SHARED_STATE_DB
+OPEN_SESSION_TTL = float(os.getenv("PRICE_CACHE_OPEN_TTL", "60"))  # TTL (giây) khi khoảng ngày chứa phiên đang mở
+COMPANY_CACHE_SIZE = int(os.getenv("COMPANY_CACHE_SIZE", "1024"))  # Số công ty giữ thông tin tổng quan
+COMPANY_CACHE_TTL = float(os.getenv("COMPANY_CACHE_TTL", "86400"))  # TTL (giây) của thông tin tổng quan
+
+# Lịch giao dịch HOSE/HNX: thứ 2 - thứ 6, 9:00 - 15:00 giờ Việt Nam
+MARKET_TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+SESSION_OPEN = dt_time(9, 0)
+SESSION_CLOSE = dt_time(15, 0)
+# Ngày nghỉ lễ, định dạng 'YYYY-MM-DD' cách nhau bởi dấu phẩy
+MARKET_HOLIDAYS = {d.strip() for d in os.getenv("MARKET_HOLIDAYS", "").split(",") if d.strip()}
+
+PRICE_COLUMNS = ["time", "open", "high", "low", "close", "volume"]
+
+
+def market_now() -> datetime:
+    """Thời điểm hiện tại theo giờ Việt Nam"""
+    return datetime.now(MARKET_TZ)
+
+
+def is_trading_day(day: date) -> bool:
+    """Ngày có phiên giao dịch hay không (bỏ qua cuối tuần và ngày lễ)"""
+    return day.weekday() < 5 and day.isoformat() not in MARKET_HOLIDAYS
+
+
+def has_trading_day(start: date, end: date) -> bool:
+    """Khoảng [start, end] có chứa ít nhất một ngày giao dịch không"""
+    day = start
+    while day <= end:
+        if is_trading_day(day):
+            return True
+        day += timedelta(days=1)
+    return False
+
+
+def last_closed_session(now: datetime = None) -> date:
+    """
+    Ngày giao dịch gần nhất đã đóng cửa
+
+    Dữ liệu nến của các phiên này không còn thay đổi nên có thể cache vĩnh viễn.
+    """
+    now = now or market_now()
+    day = now.date()
+    if not (is_trading_day(day) and now.time() >= SESSION_CLOSE):
+        day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def is_session_open(now: datetime = None) -> bool:
+    """Thị trường có đang trong phiên giao dịch không"""
+    now = now or market_now()
+    return is_trading_day(now.date()) and SESSION_OPEN <= now.time() < SESSION_CLOSE
+
+
+def next_session_open(now: datetime = None) -> datetime:
+    """Thời điểm mở cửa của phiên giao dịch kế tiếp (sau thời điểm now)"""
+    now = now or market_now()
+    day = now.date()
+    if not (is_trading_day(day) and now.time() < SESSION_OPEN):
+        day += timedelta(days=1)
+        while not is_trading_day(day):
+            day += timedelta(days=1)
+    return datetime.combine(day, SESSION_OPEN, tzinfo=now.tzinfo or MARKET_TZ)
+
+
+class PriceCache:
+    """
+    Cache giá lịch sử hai tầng, an toàn khi dùng từ nhiều thread
+
+    - Các phiên đã đóng cửa được lưu vào kho nến và không bao giờ tải lại;
+      khi khoảng ngày mở rộng chỉ tải phần còn thiếu ở đầu/cuối.
+    - Phiên đang mở (hôm nay, trước giờ đóng cửa) luôn tải trực tiếp và chỉ
+      được giữ trong LRU với TTL ngắn.
+    """
+
+    def __init__(self, max_entries: int = PRICE_CACHE_SIZE, db_path: str = PRICE_CACHE_DB,
+                 open_ttl: float = OPEN_SESSION_TTL, clock=market_now, shared=shared_state):
+        self.max_entries = max_entries
+        self.open_ttl = open_ttl
+        self.clock = clock
+        self.shared = shared  # Khóa liên process khi nhiều worker dùng chung file kho nến
+        self._memory = OrderedDict()  # key -> (DataFrame, hạn dùng theo time.monotonic hoặc None)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = connect(db_path) if db_path else sqlite3.connect(":memory:", check_same_thread=False)
+        self._init_db()
+
+    def _init_db(self):
+        """Tạo bảng nến ngày và bảng đánh dấu khoảng ngày đã tải"""
+        with self._db_lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS bars ("
+                "ticker TEXT, source TEXT, time TEXT, open REAL, high REAL, low REAL, close REAL, volume REAL, "
+                "PRIMARY KEY (ticker, source, time))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS coverage ("
+                "ticker TEXT, source TEXT, start TEXT, end TEXT, PRIMARY KEY (ticker, source))"
+            )
+
+    def get_history(self, ticker: str, start_date: str, end_date: str, source: str, fetch) -> pd.DataFrame:
+        """
+        Lấy giá lịch sử qua cache
+
+        Args:
+            ticker: Mã chứng khoán (đã viết hoa)
+            start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
+            end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
+            source: Nguồn dữ liệu vnstock (ví dụ: 'VCI')
+            fetch: Hàm fetch(ticker, start_date, end_date) -> DataFrame gọi nguồn thật
+
+        Returns:
+            DataFrame các cột PRICE_COLUMNS (bản sao, có thể chỉnh sửa tự do)
+        """
+        key = (ticker, source, start_date, end_date)
+        cached = self._memory_get(key)
+        if cached is not None:
+            CACHE_REQUESTS.labels("price", "hit").inc()
+            return cached.copy()
+        CACHE_REQUESTS.labels("price", "miss").inc()
+
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+        closed = last_closed_session(self.clock())
+
+        # Phần đã đóng cửa: đọc từ kho nến, chỉ tải các đoạn còn thiếu
+        frames = []
+        closed_end = min(end, closed)
+        if start <= closed_end:
+            self._fill_closed_range(ticker, source, start, closed_end, fetch)
+            frames.append(self._load_bars(ticker, source, start, closed_end))
+
+        # Phần phiên đang mở: tải trực tiếp, không lưu vào kho nến
+        open_start = max(start, closed + timedelta(days=1))
+        if open_start <= end and has_trading_day(open_start, end):
+            frames.append(self._normalize(fetch(ticker, open_start.isoformat(), end.isoformat())))
+
+        frames = [f for f in frames if not f.empty]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PRICE_COLUMNS)
+
+        expires_at = None if end <= closed else time.monotonic() + self.open_ttl
+        self._memory_put(key, df, expires_at)
+        return df.copy()
+
+    def clear(self):
+        """Xóa toàn bộ cache (cả bộ nhớ và kho nến)"""
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM bars")
+            self._db.execute("DELETE FROM coverage")
+
+    def _memory_get(self, key):
+        """Đọc LRU, bỏ qua entry đã hết hạn"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            df, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return df
+
+    def _memory_put(self, key, df: pd.DataFrame, expires_at):
+        """Ghi LRU và loại bỏ entry cũ nhất khi vượt quá max_entries"""
+        with self._lock:
+            self._memory[key] = (df, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _fill_closed_range(self, ticker: str, source: str, start: date, end: date, fetch):
+        """
+        Đảm bảo kho nến đã có đủ [start, end] của các phiên đã đóng cửa
+
+        Mỗi (ticker, source) giữ một khoảng liên tục đã tải; chỉ tải phần thiếu
+        ở đầu hoặc cuối và bỏ qua đoạn không có ngày giao dịch nào. Khoảng đã tải chỉ mở rộng
+        tới nến thực sự nhận được (nguồn lỗi tạm thời hoặc cắt bớt dữ liệu thì phần thiếu
+        được tải lại ở lần sau). Khi nhiều worker dùng chung kho nến, chỉ một worker tải
+        phần thiếu, các worker khác chờ rồi đọc lại.
+        """
+        if not self._missing(ticker, source, start, end)[0]:
+            return
+
+        with self.shared.lock(f"price:{ticker}:{source}"):
+            missing, coverage = self._missing(ticker, source, start, end)
+            fetched = []
+            for seg_start, seg_end in missing:
+                if has_trading_day(seg_start, seg_end):
+                    df = self._normalize(fetch(ticker, seg_start.isoformat(), seg_end.isoformat()))
+                    fetched.append(df)
+                    received = self._received_range(df, seg_start, seg_end)
+                else:
+                    received = (seg_start, seg_end)  # Lịch giao dịch xác nhận không có phiên nào
+                coverage = self._merge_coverage(coverage, received)
+            if missing:
+                self._store_bars(ticker, source, fetched, coverage)
+
+    def _missing(self, ticker: str, source: str, start: date, end: date) -> tuple:
+        """Các đoạn còn thiếu để kho nến phủ [start, end], kèm khoảng đã tải hiện tại (hoặc None)"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT start, end FROM coverage WHERE ticker = ? AND source = ?", (ticker, source)
+            ).fetchone()
+
+        if row is None:
+            return [(start, end)], None
+        cov_start, cov_end = date.fromisoformat(row[0]), date.fromisoformat(row[1])
+        missing = []
+        if start < cov_start:
+            missing.append((start, cov_start - timedelta(days=1)))
+        if end > cov_end:
+            missing.append((cov_end + timedelta(days=1), end))
+        return missing, (cov_start, cov_end)
+
+    @staticmethod
+    def _received_range(df: pd.DataFrame, seg_start: date, seg_end: date):
+        """
+        Phần của đoạn [seg_start, seg_end] chắc chắn đã có đủ nến: từ nến đầu tới nến cuối nhận được,
+        mở rộng ra hai đầu đoạn chỉ khi khoảng trống không chứa ngày giao dịch nào; không có nến thì None
+        """
+        if df.empty:
+            return None
+        first, last = df["time"].min().date(), df["time"].max().date()
+        low = seg_start if not has_trading_day(seg_start, first - timedelta(days=1)) else first
+        high = seg_end if not has_trading_day(last + timedelta(days=1), seg_end) else last
+        return low, high
+
+    @staticmethod
+    def _merge_coverage(coverage, received):
+        """Gộp khoảng vừa nhận vào khoảng đã tải nếu liền kề (khoảng đã tải luôn liên tục)"""
+        if received is None:
+            return coverage
+        if coverage is None:
+            return received
+        (cov_start, cov_end), (low, high) = coverage, received
+        if high < cov_start - timedelta(days=1) or low > cov_end + timedelta(days=1):
+            return coverage  # Còn lỗ ở giữa: nến vẫn được lưu, đoạn thiếu tải lại ở lần sau
+        return min(cov_start, low), max(cov_end, high)
+
+    def _store_bars(self, ticker: str, source: str, frames, coverage):
+        """Ghi nến mới và cập nhật khoảng đã tải (nếu có) trong cùng một transaction"""
+        rows = []
+        for df in frames:
+            for record in df.itertuples(index=False):
+                rows.append((ticker, source, record.time.strftime("%Y-%m-%d"), record.open,
+                             record.high, record.low, record.close, record.volume))
+
+        with self._db_lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if coverage is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)",
+                    (ticker, source, coverage[0].isoformat(), coverage[1].isoformat())
+                )
+
+    def _load_bars(self, ticker: str, source: str, start: date, end: date) -> pd.DataFrame:
+        """Đọc nến trong [start, end] từ kho nến"""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT time, open, high, low, close, volume FROM bars "
+                "WHERE ticker = ? AND source = ? AND time BETWEEN ? AND ? ORDER BY time",
+                (ticker, source, start.isoformat(), end.isoformat())
+            ).fetchall()
+        df = pd.DataFrame(rows, columns=PRICE_COLUMNS)
+        df["time"] = pd.to_datetime(df["time"])
+        df["volume"] = df["volume"].astype("int64")
+        return df
+
+    @staticmethod
+    def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+        """Chuẩn hóa DataFrame từ nguồn về đúng PRICE_COLUMNS"""
+        if df is None or df.empty:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        df = df[PRICE_COLUMNS].copy()
+        df["time"] = pd.to_datetime(df["time"])
+        return df
+
+
+class TTLCache:
+    """Cache LRU đơn giản với TTL cố định cho mỗi entry, an toàn khi dùng từ nhiều thread"""
+
+    def __init__(self, name: str, max_entries: int, ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (giá trị, hạn dùng theo time.monotonic)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Giá trị còn hạn, hoặc None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.labels(self.name, "hit").inc()
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        CACHE_REQUESTS.labels(self.name, "miss").inc()
+        return None
+
+    def put(self, key, value, ttl: float = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedTTLCache(TTLCache):
+    """TTLCache trong process, phía sau là bảng kv của shared_state để các worker dùng chung"""
+
+    def __init__(self, name: str, max_entries: int, ttl: float, shared=shared_state):
+        super().__init__(name, max_entries, ttl)
+        self.shared = shared
+
+    def get(self, key):
+        value = super().get(key)
+        if value is None and self.shared.enabled:
+            entry = self.shared.get(self.name, repr(key))
+            if entry is not None:
+                value, expires_at = entry
+                super().put(key, value, ttl=expires_at - self.shared.clock())
+        return value
+
+    def put(self, key, value, ttl: float = None):
+        super().put(key, value, ttl)
+        ttl = self.ttl if ttl is None else ttl
+        self.shared.put(self.name, repr(key), (value, self.shared.clock() + ttl), ttl)
+
+
+# Cache dùng chung cho toàn bộ process (và các worker khác khi bật SHARED_STATE_DB)
+price_cache = PriceCache()
+company_cache = SharedTTLCache("company", COMPANY_CACHE_SIZE, COMPANY_CACHE_TTL)
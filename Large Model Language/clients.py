@@ -0,0 +1,142 @@
+"""
+Lớp quản lý client dùng chung cho toàn bộ process
+- Pool các đối tượng stock của vnstock theo (ticker, source), loại bỏ theo LRU
+- Session HTTP dùng chung để tái sử dụng kết nối TLS tới nguồn dữ liệu
+Được khởi tạo/giải phóng trong lifespan của FastAPI (xem main.py)
+vnstock (kèm vnai) import mất hơn một giây nên chỉ nạp ở lần dùng đầu tiên hoặc khi warmup (warmup.py)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Cấu hình pool (có thể thay đổi qua biến môi trường)
+STOCK_POOL_SIZE = int(os.getenv("STOCK_POOL_SIZE", "128"))  # Số handle stock giữ lại
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))  # Số kết nối giữ mở mỗi host
+
+
+_vnstock_class = None
+_import_lock = threading.Lock()
+_vnstock = None
+_stock_pool = OrderedDict()  # (ticker, source) -> StockComponents
+_pool_lock = threading.Lock()
+
+_http_session = None
+_original_requests = None
+
+
+class _PooledRequests:
+    """
+    Thay thế module `requests` bên trong vnstock
+
+    vnstock gọi thẳng requests.get/requests.post nên mỗi lần gọi mở kết nối
+    TLS mới; lớp này chuyển các lời gọi đó sang một Session dùng chung.
+    """
+
+    def __init__(self, session: requests.Session):
+        self._session = session
+
+    def get(self, *args, **kwargs):
+        return self._session.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self._session.post(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def get_stock(ticker: str, source: str = 'VCI'):
+    """
+    Lấy handle stock của vnstock cho một mã, tái sử dụng nếu đã có trong pool
+
+    Args:
+        ticker: Mã chứng khoán (đã viết hoa)
+        source: Nguồn dữ liệu vnstock (ví dụ: 'VCI')
+
+    Returns:
+        Đối tượng StockComponents (có .quote, .company, ...)
+    """
+    global _vnstock
+    key = (ticker, source)
+    with _pool_lock:
+        stock = _stock_pool.get(key)
+        if stock is not None:
+            _stock_pool.move_to_end(key)
+            return stock
+        if _vnstock is None:
+            _vnstock = load_vnstock()()
+
+    # Khởi tạo ngoài lock vì vnstock có thể gọi mạng khi tạo handle
+    stock = _vnstock.stock(symbol=ticker, source=source)
+
+    with _pool_lock:
+        _stock_pool[key] = stock
+        _stock_pool.move_to_end(key)
+        while len(_stock_pool) > STOCK_POOL_SIZE:
+            _stock_pool.popitem(last=False)
+    return stock
+
+
+def load_vnstock():
+    """
+    Import vnstock ở lần gọi đầu tiên (an toàn đa luồng) và gắn session HTTP dùng chung nếu đã mở
+
+    Returns:
+        Lớp Vnstock
+    """
+    global _vnstock_class
+    with _import_lock:
+        if _vnstock_class is None:
+            from vnstock import Vnstock
+            _vnstock_class = Vnstock
+            _attach_session()
+    return _vnstock_class
+
+
+def startup():
+    """Mở session HTTP dùng chung (gắn vào vnstock ngay nếu đã import, nếu không thì khi import)"""
+    global _http_session
+    if _http_session is not None:
+        return
+
+    _http_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    _http_session.mount("https://", adapter)
+    _http_session.mount("http://", adapter)
+    with _import_lock:
+        _attach_session()
+
+
+def _attach_session():
+    """Chuyển các lời gọi requests bên trong vnstock sang session dùng chung (gọi khi giữ _import_lock)"""
+    global _original_requests
+    if _http_session is None or _vnstock_class is None or _original_requests is not None:
+        return
+    try:
+        from vnstock.core.utils import client as vnstock_client
+        _original_requests = vnstock_client.requests
+        vnstock_client.requests = _PooledRequests(_http_session)
+    except (ImportError, AttributeError):
+        # Phiên bản vnstock khác cấu trúc: vẫn chạy được, chỉ không có connection pooling
+        _original_requests = None
+
+
+def shutdown():
+    """Trả vnstock về trạng thái ban đầu, đóng session và xóa pool"""
+    global _http_session, _original_requests
+    if _original_requests is not None:
+        from vnstock.core.utils import client as vnstock_client
+        vnstock_client.requests = _original_requests
+        _original_requests = None
+
+    if _http_session is not None:
+        _http_session.close()
+        _http_session = None
+
+    with _pool_lock:
+        _stock_pool.clear()
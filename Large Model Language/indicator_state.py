@@ -0,0 +1,363 @@
+"""
+Tính chỉ báo kỹ thuật tăng dần trên giá lịch sử đã cache
+Mỗi (mã, nguồn, ngày bắt đầu) giữ trạng thái của các chỉ báo (tổng trượt, trung bình Wilder/EMA, ...)
+tới phiên đã đóng cửa gần nhất; lần gọi sau chỉ đưa thêm các nến mới vào trạng thái
+thay vì tính lại từ đầu toàn bộ chuỗi
+"""
+
+import copy
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import date, timedelta
+
+import numpy as np
+
+from cache import has_trading_day, last_closed_session, market_now
+from indicators import IndicatorError, indicator_label, latest_value, parse_indicator
+
+
+# Số chuỗi trạng thái (mã, nguồn, ngày bắt đầu) giữ trong bộ nhớ
+INDICATOR_STATE_SIZE = int(os.getenv("INDICATOR_STATE_SIZE", "4096"))
+
+_NAN = float("nan")
+
+
+class _Smoother:
+    """Làm trơn hàm mũ khởi tạo bằng SMA của `window` giá trị đầu tiên (khớp indicators._seeded_smoothing)"""
+
+    def __init__(self, window, alpha):
+        self.window = window
+        self.alpha = alpha
+        self.count = 0
+        self.total = 0.0
+        self.value = _NAN
+
+    def update(self, x):
+        if math.isnan(x):
+            return self.value
+        if self.count < self.window:
+            self.count += 1
+            self.total += x
+            if self.count == self.window:
+                self.value = self.total / self.window
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class _SMAState:
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+
+    def update(self, bar):
+        self.values.append(bar.close)
+        self.total += bar.close
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+
+    def value(self):
+        return self.total / self.window if len(self.values) == self.window else _NAN
+
+
+class _EMAState:
+    def __init__(self, window):
+        self.ema = _Smoother(window, 2.0 / (window + 1))
+
+    def update(self, bar):
+        self.ema.update(bar.close)
+
+    def value(self):
+        return self.ema.value
+
+
+class _RSIState:
+    def __init__(self, window):
+        self.prev_close = None
+        self.gain = _Smoother(window, 1.0 / window)
+        self.loss = _Smoother(window, 1.0 / window)
+
+    def update(self, bar):
+        if self.prev_close is not None:
+            delta = bar.close - self.prev_close
+            self.gain.update(max(delta, 0.0))
+            self.loss.update(max(-delta, 0.0))
+        self.prev_close = bar.close
+
+    def value(self):
+        avg_gain, avg_loss = self.gain.value, self.loss.value
+        if math.isnan(avg_gain) or math.isnan(avg_loss):
+            return _NAN
+        if avg_loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+class _ATRState:
+    def __init__(self, window):
+        self.prev_close = None
+        self.atr = _Smoother(window, 1.0 / window)
+
+    def update(self, bar):
+        true_range = bar.high - bar.low
+        if self.prev_close is not None:
+            true_range = max(true_range, abs(bar.high - self.prev_close), abs(bar.low - self.prev_close))
+        self.atr.update(true_range)
+        self.prev_close = bar.close
+
+    def value(self):
+        return self.atr.value
+
+
+class _MACDState:
+    def __init__(self, fast, slow, signal):
+        self.fast = _Smoother(fast, 2.0 / (fast + 1))
+        self.slow = _Smoother(slow, 2.0 / (slow + 1))
+        self.signal = _Smoother(signal, 2.0 / (signal + 1))
+        self.macd = _NAN
+
+    def update(self, bar):
+        self.macd = self.fast.update(bar.close) - self.slow.update(bar.close)
+        self.signal.update(self.macd)
+
+    def value(self):
+        return {'macd': self.macd, 'signal': self.signal.value, 'histogram': self.macd - self.signal.value}
+
+
+class _BBState:
+    def __init__(self, window, num_std):
+        self.window = window
+        self.num_std = num_std
+        self.values = deque(maxlen=window)
+
+    def update(self, bar):
+        self.values.append(bar.close)
+
+    def value(self):
+        if len(self.values) < self.window:
+            return {'upper': _NAN, 'middle': _NAN, 'lower': _NAN}
+        values = np.fromiter(self.values, dtype=np.float64)
+        middle, std = values.mean(), values.std()
+        return {'upper': middle + self.num_std * std, 'middle': middle, 'lower': middle - self.num_std * std}
+
+
+class _OBVState:
+    def __init__(self):
+        self.prev_close = None
+        self.obv = 0.0
+
+    def update(self, bar):
+        if self.prev_close is not None:
+            self.obv += np.sign(bar.close - self.prev_close) * bar.volume
+        self.prev_close = bar.close
+
+    def value(self):
+        return self.obv
+
+
+class _VWAPState:
+    def __init__(self):
+        self.price_volume = 0.0
+        self.volume = 0.0
+
+    def update(self, bar):
+        self.price_volume += (bar.high + bar.low + bar.close) / 3.0 * bar.volume
+        self.volume += bar.volume
+
+    def value(self):
+        return self.price_volume / self.volume if self.volume else _NAN
+
+
+class _ROCState:
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window + 1)
+
+    def update(self, bar):
+        self.values.append(bar.close)
+
+    def value(self):
+        if len(self.values) <= self.window:
+            return _NAN
+        return (self.values[-1] / self.values[0] - 1.0) * 100.0
+
+
+class _StochState:
+    def __init__(self, window, smooth):
+        self.window = window
+        self.smooth = smooth
+        self.highs = deque(maxlen=window)
+        self.lows = deque(maxlen=window)
+        self.ks = deque(maxlen=smooth)
+
+    def update(self, bar):
+        self.highs.append(bar.high)
+        self.lows.append(bar.low)
+        k = _NAN
+        if len(self.highs) == self.window:
+            highest, lowest = max(self.highs), min(self.lows)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                k = float(np.float64(bar.close - lowest) / np.float64(highest - lowest) * 100.0)
+        self.ks.append(k)
+
+    def value(self):
+        k = self.ks[-1] if self.ks else _NAN
+        d = sum(self.ks) / self.smooth if len(self.ks) == self.smooth else _NAN
+        return {'k': k, 'd': d}
+
+
+_STATE_TYPES = {
+    'SMA': _SMAState, 'EMA': _EMAState, 'RSI': _RSIState, 'ATR': _ATRState, 'MACD': _MACDState,
+    'BB': _BBState, 'OBV': lambda: _OBVState(), 'VWAP': lambda: _VWAPState(), 'ROC': _ROCState, 'STOCH': _StochState,
+}
+
+
+def new_state(name, params):
+    """Trạng thái rỗng của một chỉ báo (name, params đã qua parse_indicator)"""
+    if name not in _STATE_TYPES:
+        raise IndicatorError(f"Chỉ báo '{name}' không được hỗ trợ")
+    return _STATE_TYPES[name](*params)
+
+
+def state_value(state):
+    """Giá trị hiện tại của trạng thái, cùng định dạng với indicators.latest_value"""
+    value = state.value()
+    if isinstance(value, dict):
+        return latest_value({key: np.array([v]) for key, v in value.items()})
+    return latest_value(np.array([value]))
+
+
+class _Series:
+    """Trạng thái các chỉ báo của một (mã, nguồn, ngày bắt đầu), đã cập nhật tới last_time"""
+
+    def __init__(self):
+        self.states = {}  # nhãn chỉ báo -> trạng thái
+        self.last_time = None  # ngày của nến đã đóng cửa cuối cùng đã đưa vào trạng thái
+        self.last_close = None
+        self.lock = threading.Lock()
+
+    def feed(self, frame):
+        """Đưa các nến đã đóng cửa vào trạng thái"""
+        _apply(self.states, frame)
+        if len(frame):
+            self.last_time = frame['time'].iloc[-1].date()
+            self.last_close = float(frame['close'].iloc[-1])
+
+
+def _apply(states: dict, frame):
+    for bar in frame.itertuples(index=False):
+        for state in states.values():
+            state.update(bar)
+
+
+class IndicatorStateStore:
+    """
+    Kho trạng thái chỉ báo, cập nhật tăng dần theo nến mới
+
+    - Chỉ nến của các phiên đã đóng cửa được ghi vào trạng thái; phần phiên đang mở
+      được áp dụng trên bản sao nên không làm sai trạng thái khi nến hôm nay còn đổi.
+    - Kết quả khớp với tính lại từ đầu bằng IndicatorEngine trên cùng khoảng ngày.
+    """
+
+    def __init__(self, max_entries: int = INDICATOR_STATE_SIZE, clock=market_now):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._series = OrderedDict()  # (ticker, source, start_date) -> _Series
+        self._lock = threading.Lock()
+
+    def snapshot(self, ticker: str, specs, start_date: str, end_date: str, source: str, load_frame) -> dict:
+        """
+        Giá trị mới nhất của các chỉ báo cho một mã
+
+        Args:
+            ticker: Mã chứng khoán
+            specs: Danh sách chuỗi mô tả chỉ báo (xem indicators.parse_indicator)
+            start_date, end_date: Khoảng ngày 'YYYY-MM-DD'
+            source: Nguồn dữ liệu
+            load_frame: Hàm load_frame(ticker, start_date, end_date) -> DataFrame (có thể rỗng)
+
+        Returns:
+            Dict gồm ticker, as_of, close, indicators (nhãn -> giá trị) và errors nếu có;
+            as_of là None khi khoảng ngày không có dữ liệu
+        """
+        ticker = ticker.upper()
+        wanted, errors = {}, {}
+        for spec in specs:
+            try:
+                name, params = parse_indicator(spec)
+                wanted[indicator_label(name, params)] = (name, params)
+            except IndicatorError as e:
+                errors[str(spec)] = str(e)
+
+        end = date.fromisoformat(end_date)
+        closed_end = min(end, last_closed_session(self.clock()))
+        series = self._get((ticker, source, start_date))
+
+        with series.lock:
+            missing = [label for label in wanted if label not in series.states]
+            if series.last_time is not None and series.last_time > closed_end:
+                # Hỏi về quá khứ so với trạng thái đã có: tính riêng, không ghi đè trạng thái
+                series = _Series()
+                missing = list(wanted)
+            if missing and series.states:
+                # Chỉ báo mới cho chuỗi đã có: dựng lại toàn bộ trạng thái từ đầu
+                missing = list(set(series.states) | set(wanted))
+                series.states, series.last_time, series.last_close = {}, None, None
+
+            for label in missing:
+                series.states[label] = new_state(*wanted.get(label) or parse_indicator(label))
+
+            # Chỉ tải phần nến sau lần cập nhật trước
+            fetch_start = start_date if series.last_time is None else (series.last_time + timedelta(days=1)).isoformat()
+            frame = None
+            if fetch_start <= end_date and has_trading_day(date.fromisoformat(fetch_start), end):
+                frame = load_frame(ticker, fetch_start, end_date)
+
+            live = frame.iloc[:0] if frame is not None else None
+            if frame is not None and len(frame):
+                dates = frame['time'].dt.date
+                series.feed(frame[dates <= closed_end])
+                live = frame[dates > closed_end]
+
+            states, last_time, last_close = series.states, series.last_time, series.last_close
+            if live is not None and len(live):
+                # Phiên đang mở: áp dụng trên bản sao để nến hôm nay còn thay đổi không ghi vào trạng thái
+                states = copy.deepcopy(series.states)
+                _apply(states, live)
+                last_time, last_close = live['time'].iloc[-1].date(), float(live['close'].iloc[-1])
+
+            values = {label: state_value(states[label]) for label in wanted}
+
+        snapshot = {
+            "ticker": ticker,
+            "as_of": None if last_time is None else last_time.isoformat(),
+            "close": None if last_close is None else round(last_close, 2),
+            "indicators": values,
+        }
+        if errors:
+            snapshot["errors"] = errors
+        return snapshot
+
+    def _get(self, key) -> _Series:
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_entries:
+                self._series.popitem(last=False)
+            return series
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+
+# Kho trạng thái dùng chung cho toàn bộ process
+indicator_states = IndicatorStateStore()
@@ -0,0 +1,274 @@
+"""
+Engine tính chỉ báo kỹ thuật dạng vector hóa (NumPy/pandas)
+Tính nhiều chỉ báo trong một lượt trên cùng một mảng giá, dùng chung các
+kết quả trung gian (EMA, SMA, biến động giá, true range) giữa các chỉ báo
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Tham số mặc định của từng chỉ báo khi người dùng không chỉ định
+DEFAULT_PARAMS = {
+    'SMA': (20,),
+    'EMA': (20,),
+    'RSI': (14,),
+    'MACD': (12, 26, 9),
+    'BB': (20, 2),
+    'ATR': (14,),
+    'OBV': (),
+    'VWAP': (),
+    'ROC': (12,),
+    'STOCH': (14, 3),
+}
+
+# Tên gọi khác mà LLM/người dùng hay dùng
+ALIASES = {
+    'BBANDS': 'BB',
+    'BOLLINGER': 'BB',
+    'STOCHASTIC': 'STOCH',
+}
+
+SUPPORTED_INDICATORS = tuple(DEFAULT_PARAMS)
+
+_SPEC_PATTERN = re.compile(r'^([A-Z]+)[\s_\-]*\(?\s*([\d\s,\._]*?)\s*\)?$')
+
+
+class IndicatorError(ValueError):
+    """Tên chỉ báo hoặc tham số không hợp lệ"""
+
+
+def parse_indicator(spec, window_size=None):
+    """
+    Phân tích chuỗi mô tả chỉ báo thành (tên, tham số)
+
+    Hỗ trợ các dạng: 'RSI', 'RSI14', 'RSI_14', 'SMA 50', 'MACD(12,26,9)', 'BB_20_2'
+
+    Args:
+        spec: Chuỗi mô tả chỉ báo
+        window_size: Chu kỳ dùng khi spec không kèm tham số (tùy chọn)
+
+    Returns:
+        Tuple (tên chỉ báo, tuple tham số)
+
+    Raises:
+        IndicatorError: Khi chỉ báo không được hỗ trợ hoặc tham số sai
+    """
+    match = _SPEC_PATTERN.match(str(spec).strip().upper())
+    if not match:
+        raise IndicatorError(f"Không hiểu chỉ báo '{spec}'")
+
+    name = ALIASES.get(match.group(1), match.group(1))
+    if name not in DEFAULT_PARAMS:
+        raise IndicatorError(
+            f"Chỉ báo '{spec}' không được hỗ trợ. Chỉ hỗ trợ: {', '.join(SUPPORTED_INDICATORS)}"
+        )
+
+    defaults = DEFAULT_PARAMS[name]
+    raw = [p for p in re.split(r'[\s,_]+', match.group(2)) if p]
+    params = [float(p) for p in raw]
+    if not params and window_size is not None and defaults:
+        params = [float(window_size)]
+
+    # Bổ sung tham số còn thiếu bằng giá trị mặc định
+    params = params[:len(defaults)] + list(defaults[len(params):])
+    # Mọi tham số là chu kỳ (số nguyên) trừ độ lệch chuẩn của Bollinger Bands
+    params = tuple(p if (name == 'BB' and i == 1) else int(p) for i, p in enumerate(params))
+
+    if any(p <= 0 for p in params):
+        raise IndicatorError(f"Tham số của chỉ báo '{spec}' phải lớn hơn 0")
+
+    return name, params
+
+
+def indicator_label(name, params):
+    """Tên hiển thị của chỉ báo, ví dụ 'RSI_14', 'MACD_12_26_9', 'OBV'"""
+    return '_'.join([name] + [f"{p:g}" for p in params])
+
+
+def _seeded_smoothing(values, window, alpha):
+    """
+    Làm trơn hàm mũ được khởi tạo bằng SMA của `window` giá trị hợp lệ đầu tiên
+
+    Dùng cho EMA (alpha = 2/(n+1)) và Wilder (alpha = 1/n); các vị trí chưa đủ
+    dữ liệu là NaN.
+    """
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) < window:
+        return out
+
+    first = valid[0]
+    seed_at = first + window - 1
+    seeded = np.full(len(values) - seed_at, np.nan)
+    seeded[0] = values[first:seed_at + 1].mean()
+    seeded[1:] = values[seed_at + 1:]
+    out[seed_at:] = pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out
+
+
+def _rolling_sum(values, window):
+    """Tổng trượt qua cumsum, NaN khi chưa đủ `window` phần tử"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.cumsum(np.insert(values, 0, 0.0))
+        out[window - 1:] = csum[window:] - csum[:-window]
+    return out
+
+
+class IndicatorEngine:
+    """
+    Tính nhiều chỉ báo trên cùng một chuỗi giá
+
+    Các mảng giá được đọc một lần; kết quả trung gian được ghi nhớ nên yêu cầu
+    'SMA20, BB20, MACD, EMA12' chỉ tính mỗi SMA/EMA một lần.
+    """
+
+    def __init__(self, close, high=None, low=None, volume=None):
+        self.close = np.asarray(close, dtype=np.float64)
+        self.high = self.close if high is None else np.asarray(high, dtype=np.float64)
+        self.low = self.close if low is None else np.asarray(low, dtype=np.float64)
+        self.volume = None if volume is None else np.asarray(volume, dtype=np.float64)
+        self._memo = {}
+
+    @classmethod
+    def from_history(cls, history):
+        """Tạo engine từ market_data.PriceHistory"""
+        return cls(history.close, history.high, history.low, history.volume)
+
+    def _cached(self, key, func):
+        if key not in self._memo:
+            self._memo[key] = func()
+        return self._memo[key]
+
+    # Các khối tính toán dùng chung
+    def sma(self, window, values_key='close'):
+        values = getattr(self, values_key)
+        return self._cached(('sma', values_key, window), lambda: _rolling_sum(values, window) / window)
+
+    def ema(self, window):
+        return self._cached(('ema', window), lambda: _seeded_smoothing(self.close, window, 2.0 / (window + 1)))
+
+    def delta(self):
+        return self._cached('delta', lambda: np.diff(self.close, prepend=np.nan))
+
+    def true_range(self):
+        def compute():
+            prev_close = np.roll(self.close, 1)
+            ranges = np.vstack([
+                self.high - self.low,
+                np.abs(self.high - prev_close),
+                np.abs(self.low - prev_close),
+            ])
+            tr = ranges.max(axis=0)
+            if len(tr):
+                tr[0] = self.high[0] - self.low[0]
+            return tr
+        return self._cached('true_range', compute)
+
+    # Các chỉ báo
+    def compute_one(self, name, params):
+        """Tính một chỉ báo, trả về mảng hoặc dict các mảng (chỉ báo nhiều đường)"""
+        if name == 'SMA':
+            return self.sma(params[0])
+
+        if name == 'EMA':
+            return self.ema(params[0])
+
+        if name == 'RSI':
+            window = params[0]
+            delta = self.delta()
+            gain = np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None))
+            loss = np.where(np.isnan(delta), np.nan, np.clip(-delta, 0, None))
+            avg_gain = _seeded_smoothing(gain, window, 1.0 / window)
+            avg_loss = _seeded_smoothing(loss, window, 1.0 / window)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+            # Không có phiên giảm nào trong chu kỳ -> RSI = 100
+            return np.where((avg_loss == 0) & ~np.isnan(avg_gain), 100.0, rsi)
+
+        if name == 'MACD':
+            fast, slow, signal = params
+            macd = self.ema(fast) - self.ema(slow)
+            signal_line = _seeded_smoothing(macd, signal, 2.0 / (signal + 1))
+            return {'macd': macd, 'signal': signal_line, 'histogram': macd - signal_line}
+
+        if name == 'BB':
+            window, num_std = params
+            middle = self.sma(window)
+            std = pd.Series(self.close).rolling(window).std(ddof=0).to_numpy()
+            return {'upper': middle + num_std * std, 'middle': middle, 'lower': middle - num_std * std}
+
+        if name == 'ATR':
+            window = params[0]
+            return _seeded_smoothing(self.true_range(), window, 1.0 / window)
+
+        if name == 'OBV':
+            self._require_volume(name)
+            direction = np.sign(np.nan_to_num(self.delta()))
+            return np.cumsum(direction * self.volume)
+
+        if name == 'VWAP':
+            # VWAP tích lũy trên toàn khoảng thời gian (nến ngày)
+            self._require_volume(name)
+            typical = (self.high + self.low + self.close) / 3.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.cumsum(typical * self.volume) / np.cumsum(self.volume)
+
+        if name == 'ROC':
+            window = params[0]
+            out = np.full(len(self.close), np.nan)
+            out[window:] = (self.close[window:] / self.close[:-window] - 1.0) * 100.0
+            return out
+
+        if name == 'STOCH':
+            window, smooth = params
+            highest = pd.Series(self.high).rolling(window).max().to_numpy()
+            lowest = pd.Series(self.low).rolling(window).min().to_numpy()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                k = (self.close - lowest) / (highest - lowest) * 100.0
+            d = pd.Series(k).rolling(smooth).mean().to_numpy()
+            return {'k': k, 'd': d}
+
+        raise IndicatorError(f"Chỉ báo '{name}' không được hỗ trợ")
+
+    def compute(self, specs, window_size=None):
+        """
+        Tính một tập chỉ báo trong một lượt
+
+        Args:
+            specs: Danh sách chuỗi mô tả chỉ báo (xem parse_indicator)
+            window_size: Chu kỳ mặc định cho các spec không kèm tham số
+
+        Returns:
+            Tuple (dict nhãn -> kết quả, dict spec -> thông báo lỗi)
+        """
+        results, errors = {}, {}
+        for spec in specs:
+            try:
+                name, params = parse_indicator(spec, window_size)
+                results[indicator_label(name, params)] = self.compute_one(name, params)
+            except IndicatorError as e:
+                errors[str(spec)] = str(e)
+        return results, errors
+
+    def _require_volume(self, name):
+        if self.volume is None:
+            raise IndicatorError(f"Chỉ báo '{name}' cần dữ liệu khối lượng")
+
+
+def latest_value(result):
+    """
+    Giá trị mới nhất của một kết quả chỉ báo, làm tròn 2 chữ số
+
+    Trả về None nếu chưa đủ dữ liệu để tính.
+    """
+    if isinstance(result, dict):
+        values = {key: latest_value(series) for key, series in result.items()}
+        return None if any(v is None for v in values.values()) else values
+
+    if len(result) == 0 or np.isnan(result[-1]):
+        return None
+    return round(float(result[-1]), 2)
@@ -0,0 +1,280 @@
+"""
+Phân tích ý định (intent) từ câu hỏi tiếng Việt
+Chuẩn hóa văn bản (bỏ dấu, chữ thường), nhận diện mã chứng khoán, chỉ báo kỹ thuật
+và quy đổi các cụm thời gian tương đối ("3 tháng gần nhất") thành khoảng ngày cụ thể
+"""
+
+import calendar
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+
+# Khoảng thời gian mặc định khi câu hỏi không nói rõ (khớp với SYSTEM_PROMPT của agent)
+DEFAULT_LOOKBACK_MONTHS = 3
+
+# Các từ viết hoa 3 ký tự thường gặp nhưng không phải mã chứng khoán
+TICKER_STOPWORDS = {
+    "SMA", "EMA", "RSI", "ATR", "OBV", "ROC", "MACD", "VWAP", "STOCH",
+    "USD", "VND", "ETF", "CEO", "CFO", "IPO", "EPS", "ROE", "ROA", "GDP", "HNX", "TOP", "API",
+    # Từ tiếng Việt 3 chữ cái khi người dùng gõ toàn chữ hoa
+    "GIA", "CHO", "CUA", "NAM", "TIN", "LAI", "VON", "MUA", "BAN", "CON", "HAY", "NAO", "QUA", "THE",
+}
+
+INDICATOR_NAMES = ("SMA", "EMA", "RSI", "MACD", "BB", "BOLLINGER", "ATR", "OBV", "VWAP", "ROC", "STOCH")
+
+_TICKER_PATTERN = re.compile(r"\b[A-Z][A-Z0-9]{2}\b")
+_INDICATOR_PATTERN = re.compile(
+    r"\b(" + "|".join(INDICATOR_NAMES) + r")(?![A-Za-z])(?:[\s_\-]*\(?\s*(\d+(?:\s*,\s*[\d.]+)*)\s*\)?)?(?:\s*(?:ngay|phien))?",
+    re.IGNORECASE
+)
+
+_COMPANY_KEYWORDS = ("thong tin", "cong ty", "gioi thieu", "tong quan", "nganh", "linh vuc", "von dieu le", "lich su")
+_PRICE_KEYWORDS = ("gia", "so sanh", "bien dong", "dong cua", "mo cua", "khoi luong", "tang", "giam", "xu huong")
+
+_UNIT_DAYS = {"ngay": 1, "phien": 1, "tuan": 7}
+
+
+def strip_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Thông tin giá' -> 'Thong tin gia'"""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def normalize_text(text: str) -> str:
+    """Bỏ dấu, chữ thường, bỏ dấu câu và gộp khoảng trắng"""
+    text = strip_diacritics(text).lower()
+    text = re.sub(r"[^\w\s/\-.,()]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def extract_tickers(text: str) -> tuple:
+    """
+    Nhận diện mã chứng khoán (3 ký tự viết hoa) trong câu hỏi
+
+    Returns:
+        Tuple mã theo thứ tự xuất hiện, không trùng lặp
+    """
+    tickers = []
+    for token in _TICKER_PATTERN.findall(strip_diacritics(text)):
+        if token not in TICKER_STOPWORDS and token not in tickers:
+            tickers.append(token)
+    return tuple(tickers)
+
+
+def extract_indicators(text: str) -> tuple:
+    """
+    Nhận diện chỉ báo kỹ thuật và chu kỳ đi kèm
+
+    Returns:
+        Tuple các spec dạng 'RSI14', 'MACD(12,26,9)', hoặc 'MACD' khi không có tham số
+    """
+    specs = []
+    for name, params in _INDICATOR_PATTERN.findall(strip_diacritics(text)):
+        name = name.upper()
+        name = "BB" if name == "BOLLINGER" else name
+        params = re.sub(r"\s+", "", params)
+        spec = f"{name}({params})" if "," in params else f"{name}{params}"
+        if spec not in specs:
+            specs.append(spec)
+    return tuple(specs)
+
+
+def _shift_months(day: date, months: int) -> date:
+    """Cộng/trừ số tháng, giữ ngày trong tháng hợp lệ"""
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _month_range(year: int, month: int) -> tuple:
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _parse_explicit_dates(text: str) -> list:
+    """Các ngày viết tường minh: 'YYYY-MM-DD' hoặc 'DD/MM/YYYY'"""
+    found = []
+    for match in re.finditer(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b|\b(\d{1,2})/(\d{1,2})/(\d{4})\b", text):
+        try:
+            if match.group(1):
+                found.append(date(int(match.group(1)), int(match.group(2)), int(match.group(3))))
+            else:
+                found.append(date(int(match.group(6)), int(match.group(5)), int(match.group(4))))
+        except ValueError:
+            continue
+    return found
+
+
+def resolve_date_range(text: str, today: date) -> tuple:
+    """
+    Quy đổi cụm thời gian trong câu hỏi thành khoảng ngày cụ thể
+
+    Hỗ trợ: 'N ngày/tuần/tháng/năm gần nhất', 'hôm nay', 'hôm qua', 'tuần này',
+    'tuần trước', 'tháng này', 'tháng trước', 'năm nay', 'từ đầu năm', 'năm ngoái', 'năm 2024',
+    'tháng 10 năm 2024', 'quý 3 năm 2024', ngày tường minh 'DD/MM/YYYY'.
+    'Tuần/tháng/năm trước' (hoặc 'qua', 'vừa qua') là tuần/tháng/năm lịch liền trước,
+    còn 'N tuần/tháng qua' là N tuần/tháng tính lùi từ hôm nay.
+
+    Args:
+        text: Câu hỏi (có dấu hoặc không dấu)
+        today: Ngày hiện tại theo giờ thị trường
+
+    Returns:
+        Tuple (start, end) kiểu date, hoặc None nếu câu hỏi không nhắc tới thời gian
+    """
+    text = normalize_text(text)
+    # Bỏ cụm chỉ báo để "RSI 14 ngày" không bị hiểu là "14 ngày gần nhất"
+    text = _INDICATOR_PATTERN.sub(" ", text)
+
+    explicit = _parse_explicit_dates(text)
+    if len(explicit) >= 2:
+        return min(explicit), min(max(explicit), today)
+    if len(explicit) == 1:
+        return explicit[0], today
+
+    # "N tháng gần nhất"; bỏ qua "tháng 10 năm 2024", "ngày 15 tháng 10"
+    match = re.search(r"(?<!thang )(?<!quy )(?<!ngay )\b(\d+)\s*(ngay|phien|tuan|thang|nam)\b(?!\s*\d)", text)
+    if match:
+        count, unit = int(match.group(1)), match.group(2)
+        if unit == "thang":
+            return _shift_months(today, -count), today
+        if unit == "nam":
+            return _shift_months(today, -12 * count), today
+        return today - timedelta(days=count * _UNIT_DAYS[unit]), today
+
+    if "hom nay" in text:
+        return today, today
+    if "hom qua" in text:
+        return today - timedelta(days=1), today - timedelta(days=1)
+    if "tuan nay" in text:
+        return today - timedelta(days=today.weekday()), today
+    if re.search(r"tuan (truoc|qua|vua qua)", text):
+        # Tuần lịch liền trước: thứ 2 tới chủ nhật
+        monday = today - timedelta(days=today.weekday() + 7)
+        return monday, monday + timedelta(days=6)
+    if "thang nay" in text:
+        return today.replace(day=1), today
+    if re.search(r"thang (truoc|qua|vua qua)", text):
+        previous = _shift_months(today, -1)
+        return _month_range(previous.year, previous.month)
+    if "nam nay" in text or "dau nam" in text:
+        return date(today.year, 1, 1), today
+    if re.search(r"nam (ngoai|truoc|qua)", text):
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+
+    year_match = re.search(r"\b(?:nam\s*)?(20\d{2})\b", text)
+    year = int(year_match.group(1)) if year_match else today.year
+
+    quarter = re.search(r"\bquy\s*([1-4])\b", text)
+    if quarter:
+        first_month = (int(quarter.group(1)) - 1) * 3 + 1
+        return date(year, first_month, 1), min(_month_range(year, first_month + 2)[1], today)
+
+    months = [int(m) for m in re.findall(r"\bthang\s*(\d{1,2})\b", text) if 1 <= int(m) <= 12]
+    if months:
+        return _month_range(year, min(months))[0], min(_month_range(year, max(months))[1], today)
+
+    if year_match:
+        return date(year, 1, 1), min(date(year, 12, 31), today)
+
+    return None
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    Ý định đã chuẩn hóa của một câu hỏi
+
+    Attributes:
+        kind: 'company', 'price', 'indicator' hoặc 'other'
+        tickers: Các mã chứng khoán được nhắc tới
+        indicators: Các chỉ báo (dạng 'RSI14', 'MACD')
+        start_date, end_date: Khoảng ngày 'YYYY-MM-DD' (None với intent 'company'/'other')
+        explicit_dates: Câu hỏi có nói rõ thời gian hay dùng mặc định
+        normalized: Câu hỏi đã chuẩn hóa
+    """
+    kind: str
+    tickers: tuple
+    indicators: tuple
+    start_date: str
+    end_date: str
+    explicit_dates: bool
+    normalized: str
+
+    @property
+    def key(self) -> tuple:
+        """
+        Khóa theo ý định: các câu hỏi khác cách viết nhưng cùng ý định có cùng khóa
+
+        Chỉ đủ để phân biệt câu trả lời dựng từ tool theo route cố định (fast path);
+        câu trả lời tự do của LLM dùng question_key.
+        """
+        if self.kind == "other" or not self.tickers:
+            return ("text", self.normalized)
+        return (self.kind, tuple(sorted(self.tickers)), tuple(sorted(self.indicators)), self.start_date, self.end_date)
+
+    @property
+    def question_key(self) -> tuple:
+        """
+        Khóa theo nội dung câu hỏi: cùng ý định vẫn có thể hỏi điều khác nhau
+        ('vốn điều lệ FPT' và 'FPT thuộc ngành gì', 'giá cao nhất' và 'giá thấp nhất')
+        """
+        return ("question", self.normalized, self.start_date, self.end_date)
+
+
+def detect_kinds(normalized: str, indicators: tuple = ()) -> tuple:
+    """
+    Các loại ý định có tín hiệu trong câu hỏi đã chuẩn hóa, theo thứ tự ưu tiên
+
+    Returns:
+        Tuple con của ('indicator', 'price', 'company'); rỗng nếu không nhận ra
+    """
+    kinds = []
+    if indicators:
+        kinds.append("indicator")
+    if any(re.search(rf"\b{kw}\b", normalized) for kw in _PRICE_KEYWORDS):
+        kinds.append("price")
+    if any(re.search(rf"\b{kw}\b", normalized) for kw in _COMPANY_KEYWORDS):
+        kinds.append("company")
+    return tuple(kinds)
+
+
+def parse_intent(question: str, today: date) -> Intent:
+    """
+    Phân tích câu hỏi thành Intent
+
+    Args:
+        question: Câu hỏi của người dùng
+        today: Ngày hiện tại theo giờ thị trường
+
+    Returns:
+        Intent đã chuẩn hóa
+    """
+    normalized = normalize_text(question)
+    tickers = extract_tickers(question)
+    indicators = extract_indicators(question)
+
+    kinds = detect_kinds(normalized, indicators)
+    kind = kinds[0] if kinds else "other"
+
+    start_date = end_date = None
+    explicit = False
+    if kind in ("price", "indicator"):
+        date_range = resolve_date_range(question, today)
+        explicit = date_range is not None
+        if date_range is None:
+            date_range = (_shift_months(today, -DEFAULT_LOOKBACK_MONTHS), today)
+        start_date, end_date = date_range[0].isoformat(), date_range[1].isoformat()
+
+    return Intent(
+        kind=kind,
+        tickers=tickers,
+        indicators=indicators,
+        start_date=start_date,
+        end_date=end_date,
+        explicit_dates=explicit,
+        normalized=normalized,
+    )
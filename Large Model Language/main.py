@@ -1,21 +1,78 @@
 """
 FastAPI REST API Server cho Vietnamese Financial AI Agent
 Endpoint /query nhận câu hỏi và trả về câu trả lời từ agent
+Endpoint /query/stream trả về tiến trình xử lý dạng Server-Sent Events
+Endpoint /query/batch xử lý nhiều câu hỏi trong một request (kết quả theo thứ tự hoặc NDJSON)
+Endpoint /sessions tạo phiên hội thoại nhiều lượt, /sessions/{id}/query hỏi tiếp trong phiên
+Endpoint /metrics xuất metrics theo định dạng Prometheus
+Endpoint /live (liveness) trả lời ngay khi process chạy, /ready (readiness) trả 503 cho tới khi warmup xong
+Các endpoint /query đi qua admission control (xem admission.py): quá tải trả 429/503 kèm Retry-After
 """
 
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import List, Optional
+from pydantic import BaseModel, Field
 import uvicorn
-from agent import run_agent_query
+import clients
+from admission import AdmissionRejected, admission, client_id
+from answer_cache import answer_cache
+import prewarm
+from bar_store import bar_store
+from observability import ERRORS, registry, span
+from router import answer_fast_path, fast_path_events
+from screener import SCREEN_DEFAULT_LIMIT, SCREEN_MAX_RESULTS, ScreenerError, screen
+from sessions import SessionNotFound, session_store
+from shared_state import shared_state
+from sources import source_pool
+from tickers import refresh_periodically, ticker_index
+import warmup
+from agent import run_agent_query_async, stream_agent_query, reset_model
+
+
+# Cấu hình endpoint /query/batch (có thể thay đổi qua biến môi trường)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))  # Số câu hỏi tối đa mỗi lô
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "4"))  # Số câu hỏi của lô xử lý đồng thời
+
+# Số worker (process) uvicorn; lớn hơn 1 thì các worker dùng chung cache qua SHARED_STATE_DB
+# (mặc định file shared_state.db). MAX_CONCURRENT_QUERIES và các giới hạn admission tính theo từng worker.
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Khởi tạo các client dùng chung khi server start và giải phóng khi shutdown
+    """
+    clients.startup()
+    # Nạp SDK Gemini/vnstock và dựng model ở nền, server nhận request (/live) ngay
+    warmer = asyncio.create_task(warmup.warmer.run()) if warmup.WARMUP_ENABLED else None
+    # Nạp danh mục mã ở nền và làm mới theo chu kỳ
+    ticker_refresher = asyncio.create_task(refresh_periodically(ticker_index))
+    # Làm nóng cache cho các mã hay được hỏi theo lịch giao dịch
+    prewarmer = asyncio.create_task(prewarm.prewarmer.run_forever()) if prewarm.PREWARM_ENABLED else None
+    yield
+    if warmer is not None:
+        warmer.cancel()
+    ticker_refresher.cancel()
+    if prewarmer is not None:
+        prewarmer.cancel()
+    clients.shutdown()
+    reset_model()
 
 
 # Khởi tạo FastAPI app
 app = FastAPI(
     title="Vietnamese Financial AI Agent API",
     description="API để truy vấn thông tin chứng khoán Việt Nam sử dụng AI Agent",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Thêm CORS middleware để cho phép gọi API từ browser
@@ -53,6 +110,68 @@ class QueryResponse(BaseModel):
         }
 
 
+class BatchQueryRequest(BaseModel):
+    """Request model cho endpoint /query/batch"""
+    questions: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    stream: bool = False  # True: trả NDJSON, mỗi dòng một kết quả ngay khi xong
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "questions": ["Giá FPT?", "Giá VCB?", "RSI của HPG?"],
+                "stream": False
+            }
+        }
+
+
+class BatchItem(BaseModel):
+    """Kết quả của một câu hỏi trong lô: answer khi thành công, error và status khi lỗi"""
+    index: int
+    question: str
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    status: int = 200
+
+
+class BatchQueryResponse(BaseModel):
+    """Response model cho endpoint /query/batch (kết quả theo thứ tự câu hỏi)"""
+    results: List[BatchItem]
+    errors: int
+
+
+class ScreenRequest(BaseModel):
+    """Request model cho endpoint /screen"""
+    filter: str = Field(..., min_length=1, max_length=500)
+    sort_by: Optional[str] = None
+    ascending: Optional[bool] = None
+    limit: int = Field(SCREEN_DEFAULT_LIMIT, ge=1, le=SCREEN_MAX_RESULTS)
+    exchange: Optional[str] = None
+    tickers: Optional[List[str]] = None
+    as_of: Optional[str] = None
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filter": "RSI14 < 30 and VOLUME > VOLUME_SMA20",
+                "exchange": "HOSE",
+                "limit": 10
+            }
+        }
+
+
+class SessionResponse(BaseModel):
+    """Response model cho endpoint /sessions"""
+    session_id: str
+    expires_in: int
+
+
+class SessionQueryResponse(BaseModel):
+    """Response model cho endpoint /sessions/{session_id}/query"""
+    session_id: str
+    answer: str
+    turns: int
+
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -62,18 +181,44 @@ async def root():
     return {
         "status": "ok",
         "message": "Vietnamese Financial AI Agent API is running",
-        "api_key_configured": bool(os.getenv("GEMINI_API_KEY"))
+        "api_key_configured": bool(os.getenv("GEMINI_API_KEY")),
+        "ready": warmup.warmer.ready,
+        # Trạng thái circuit breaker của các nguồn dữ liệu (closed/open/half_open)
+        "data_sources": source_pool.stats()
     }
 
 
+# Liveness: không chạm tới SDK, cache hay nguồn dữ liệu
+@app.get("/live")
+async def live():
+    """
+    Liveness probe: process còn phản hồi (không phụ thuộc warmup)
+    """
+    return {"status": "ok"}
+
+
+# Readiness: worker đã nạp xong SDK và model
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 khi warmup xong, 503 kèm trạng thái từng bước khi chưa xong hoặc lỗi
+    """
+    stats = warmup.warmer.stats()
+    stats["tickers"] = len(ticker_index)
+    if not stats["ready"]:
+        return JSONResponse(status_code=503, content=stats)
+    return stats
+
+
 # Main query endpoint
 @app.post("/query", response_model=QueryResponse)
-async def handle_query(request: QueryRequest):
+async def handle_query(request: QueryRequest, http_request: Request):
     """
     Xử lý câu hỏi về chứng khoán Việt Nam
     
     Args:
         request: QueryRequest chứa câu hỏi của người dùng
+        http_request: Request gốc, dùng để xác định client cho admission control
     
     Returns:
         QueryResponse chứa câu trả lời từ AI agent
@@ -100,34 +245,421 @@ async def handle_query(request: QueryRequest):
                 detail="Câu hỏi không được để trống"
             )
         
-        # Gọi agent để xử lý câu hỏi
-        answer_text = run_agent_query(request.question)
-        
-        # Kiểm tra kết quả
-        if not answer_text:
-            raise HTTPException(
-                status_code=500,
-                detail="Agent không trả về kết quả"
-            )
-        
-        # Kiểm tra nếu có lỗi trong response
-        if answer_text.startswith("Lỗi:"):
-            raise HTTPException(
-                status_code=500,
-                detail=answer_text
-            )
+        # Câu hỏi cùng ý định đã được trả lời và dữ liệu chưa đổi -> trả ngay từ cache
+        intent = answer_cache.parse(request.question)
+        cached_answer = answer_cache.get(intent)
+        if cached_answer is not None:
+            return QueryResponse(answer=cached_answer)
         
+        # Giới hạn số câu hỏi xử lý đồng thời; quá tải thì từ chối nhanh (429/503)
+        async with admission.admit(client_id(http_request)):
+            answer_text = await _answer(request.question, intent)
         return QueryResponse(answer=answer_text)
     
-    except HTTPException:
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    except HTTPException as e:
+        if e.status_code >= 500:
+            ERRORS.labels("http").inc()
         raise
     except Exception as e:
+        ERRORS.labels("http").inc()
         raise HTTPException(
             status_code=500,
             detail=f"Lỗi khi xử lý câu hỏi: {str(e)}"
         )
 
 
+async def _answer(question: str, intent) -> str:
+    """
+    Trả lời một câu hỏi chưa có trong cache: fast path, nếu không được thì qua agent
+    
+    Raises:
+        HTTPException: 500 khi agent không trả về kết quả hoặc báo lỗi
+    """
+    with span("query", intent.kind):
+        # Câu hỏi đơn giản (một mã, một loại tra cứu) trả lời thẳng từ tools, không qua Gemini
+        answer_text = await answer_fast_path(intent)
+        fast_path = answer_text is not None
+        if not fast_path:
+            # Gọi agent để xử lý câu hỏi (async, không chặn event loop)
+            answer_text = await run_agent_query_async(question)
+    
+    # Kiểm tra kết quả
+    if not answer_text:
+        raise HTTPException(
+            status_code=500,
+            detail="Agent không trả về kết quả"
+        )
+    
+    # Kiểm tra nếu có lỗi trong response
+    if answer_text.startswith("Lỗi:"):
+        raise HTTPException(
+            status_code=500,
+            detail=answer_text
+        )
+    
+    # Không cache các câu trả lời báo lỗi (ví dụ "Lỗi khi chạy agent: ...")
+    if not answer_text.startswith("Lỗi"):
+        answer_cache.put(intent, answer_text, fast_path=fast_path)
+    return answer_text
+
+
+def _overloaded(e: AdmissionRejected) -> HTTPException:
+    """429/503 kèm Retry-After khi admission control từ chối câu hỏi"""
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _sse(event: str, data: dict) -> str:
+    """Định dạng một sự kiện Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Streaming query endpoint
+@app.post("/query/stream")
+async def handle_query_stream(request: QueryRequest, http_request: Request):
+    """
+    Xử lý câu hỏi và trả về tiến trình dạng Server-Sent Events
+    
+    Các sự kiện theo thứ tự phát sinh:
+        tool_call   {"name": ..., "args": {...}}   khi agent bắt đầu gọi tool
+        tool_result {"name": ..., "result": "..."} khi tool trả kết quả
+        token       {"text": "..."}                 từng đoạn text Gemini vừa sinh
+        answer      {"answer": "..."}               câu trả lời đầy đủ (sự kiện cuối)
+        error       {"message": "..."}              khi xử lý thất bại (sự kiện cuối)
+    
+    Example:
+        POST /query/stream
+        {"question": "Thông tin FPT?"}
+        
+        Response (text/event-stream):
+        event: tool_call
+        data: {"name": "get_company_info", "args": {"ticker": "FPT"}}
+        ...
+        event: answer
+        data: {"answer": "FPT là Công ty Cổ phần..."}
+    """
+    # Kiểm tra API key
+    if not os.getenv("GEMINI_API_KEY"):
+        raise HTTPException(
+            status_code=500,
+            detail="Chưa cấu hình GEMINI_API_KEY. Vui lòng thiết lập biến môi trường."
+        )
+    
+    # Kiểm tra input
+    if not request.question or len(request.question.strip()) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Câu hỏi không được để trống"
+        )
+    
+    intent = answer_cache.parse(request.question)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    
+    cached_answer = answer_cache.get(intent)
+    if cached_answer is not None:
+        async def cached_stream():
+            yield _sse("answer", {"answer": cached_answer})
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers=headers)
+    
+    # Xin chỗ xử lý trước khi bắt đầu stream để còn trả được 429/503
+    try:
+        ticket = await admission.acquire(client_id(http_request))
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    
+    async def event_stream():
+        try:
+            # Thử fast path trước, chỉ chuyển cho agent khi fast path không trả lời được
+            for fast_path, events in ((True, fast_path_events(intent)), (False, stream_agent_query(request.question))):
+                async for event in events:
+                    event_type = event.pop("event")
+                    if event_type == "answer" and not event["answer"].startswith("Lỗi"):
+                        answer_cache.put(intent, event["answer"], fast_path=fast_path)
+                    yield _sse(event_type, event)
+                    if event_type in ("answer", "error"):
+                        return
+        finally:
+            ticket.release()
+    
+    # BackgroundTask trả chỗ cả khi client ngắt kết nối trước lúc stream bắt đầu
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=headers,
+        background=BackgroundTask(ticket.release)
+    )
+
+
+# Batch query endpoint
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def handle_query_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Xử lý nhiều câu hỏi trong một request (ví dụ một câu hỏi cho mỗi mã VN30)
+    
+    Các câu hỏi chạy đồng thời tối đa BATCH_QUERY_CONCURRENCY; câu hỏi cùng ý định trong lô
+    chỉ xử lý một lần, dữ liệu dùng chung qua cache và single-flight của market_data.
+    Lỗi của từng câu hỏi được trả riêng trong kết quả, không làm hỏng cả lô.
+    
+    Example:
+        POST /query/batch
+        {"questions": ["Giá FPT?", "Giá VCB?"]}
+        
+        Response:
+        {"results": [{"index": 0, "question": "Giá FPT?", "answer": "...", "status": 200}, ...], "errors": 0}
+        
+        Với "stream": true, response là application/x-ndjson, mỗi dòng một BatchItem theo thứ tự hoàn thành
+    """
+    # Kiểm tra API key
+    if not os.getenv("GEMINI_API_KEY"):
+        raise HTTPException(
+            status_code=500,
+            detail="Chưa cấu hình GEMINI_API_KEY. Vui lòng thiết lập biến môi trường."
+        )
+    
+    # Cả lô chiếm một chỗ của admission control, bên trong tự giới hạn đồng thời
+    try:
+        ticket = await admission.acquire(client_id(http_request))
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    
+    items, answers = _batch_items(request.questions)
+    if not request.stream:
+        try:
+            results = await asyncio.gather(*items)
+        finally:
+            ticket.release()
+        return BatchQueryResponse(results=results, errors=sum(1 for item in results if item.error))
+    
+    async def ndjson_stream():
+        pending = [asyncio.ensure_future(item) for item in items]
+        try:
+            for finished in asyncio.as_completed(pending):
+                item = await finished
+                yield item.model_dump_json() + "\n"
+        finally:
+            # Client ngắt kết nối giữa chừng: dừng các câu hỏi chưa xong
+            for task in pending + answers:
+                task.cancel()
+            ticket.release()
+    
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(ticket.release)
+    )
+
+
+def _batch_items(questions: list) -> list:
+    """
+    Coroutine cho từng câu hỏi của lô, mỗi coroutine trả về một BatchItem
+    
+    Câu hỏi có cùng Intent.key dùng chung một task nên chỉ được trả lời một lần.
+    
+    Returns:
+        Tuple (danh sách coroutine theo thứ tự câu hỏi, danh sách task trả lời dùng chung)
+    """
+    semaphore = asyncio.Semaphore(BATCH_QUERY_CONCURRENCY)
+    shared = {}  # Intent.key -> task trả lời
+    
+    async def answer(question: str, intent) -> str:
+        cached_answer = answer_cache.get(intent)
+        if cached_answer is not None:
+            return cached_answer
+        async with semaphore:
+            return await _answer(question, intent)
+    
+    async def item(index: int, question: str, task) -> BatchItem:
+        if task is None:
+            return BatchItem(index=index, question=question, error="Câu hỏi không được để trống", status=400)
+        try:
+            return BatchItem(index=index, question=question, answer=await task)
+        except HTTPException as e:
+            if e.status_code >= 500:
+                ERRORS.labels("http").inc()
+            return BatchItem(index=index, question=question, error=str(e.detail), status=e.status_code)
+        except Exception as e:
+            ERRORS.labels("http").inc()
+            return BatchItem(index=index, question=question, error=f"Lỗi khi xử lý câu hỏi: {str(e)}", status=500)
+    
+    items = []
+    for index, question in enumerate(questions):
+        task = None
+        if question and question.strip():
+            intent = answer_cache.parse(question)
+            task = shared.get(intent.key)
+            if task is None:
+                task = shared[intent.key] = asyncio.ensure_future(answer(question, intent))
+        items.append(item(index, question, task))
+    return items, list(shared.values())
+
+
+def _get_session(session_id: str):
+    try:
+        return session_store.get(session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Phiên hội thoại không tồn tại hoặc đã hết hạn")
+
+
+# Tạo phiên hội thoại nhiều lượt
+@app.post("/sessions", response_model=SessionResponse, status_code=201)
+async def create_session():
+    """
+    Tạo phiên hội thoại; các câu hỏi gửi tới /sessions/{session_id}/query dùng chung ngữ cảnh
+    
+    Example:
+        POST /sessions
+        
+        Response:
+        {"session_id": "3f2a...", "expires_in": 1800}
+    """
+    session = session_store.create()
+    return SessionResponse(session_id=session.id, expires_in=session.info()["expires_in"])
+
+
+# Hỏi tiếp trong phiên hội thoại
+@app.post("/sessions/{session_id}/query", response_model=SessionQueryResponse)
+async def handle_session_query(session_id: str, request: QueryRequest, http_request: Request):
+    """
+    Xử lý câu hỏi trong một phiên: dùng lại lịch sử chat, các mã vừa nhắc tới và kết quả tool đã lấy
+    
+    Example:
+        POST /sessions/3f2a.../query
+        {"question": "Thông tin FPT?"}
+        
+        POST /sessions/3f2a.../query
+        {"question": "Còn RSI của nó?"}
+        
+        Response:
+        {"session_id": "3f2a...", "answer": "Chỉ báo kỹ thuật của FPT ...", "turns": 2}
+    """
+    session = _get_session(session_id)
+    
+    if not os.getenv("GEMINI_API_KEY"):
+        raise HTTPException(
+            status_code=500,
+            detail="Chưa cấu hình GEMINI_API_KEY. Vui lòng thiết lập biến môi trường."
+        )
+    if not request.question or len(request.question.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Câu hỏi không được để trống")
+    
+    try:
+        # Các câu hỏi của cùng một phiên xử lý tuần tự để lịch sử không bị xen kẽ
+        async with session.lock, admission.admit(client_id(http_request)):
+            # Câu hỏi không nêu mã ("còn RSI của nó?") dùng các mã của lượt trước
+            intent = session.resolve(answer_cache.parse(request.question))
+            session.remember_tickers(intent.tickers)
+            with span("query", intent.kind):
+                answer_text = await _session_fast_path(session, intent)
+                if answer_text is not None:
+                    session.add_turn(request.question, answer_text)
+                else:
+                    answer_text = await run_agent_query_async(request.question, session=session)
+            session_store.save(session)
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    except Exception as e:
+        ERRORS.labels("http").inc()
+        raise HTTPException(status_code=500, detail=f"Lỗi khi xử lý câu hỏi: {str(e)}")
+    
+    if not answer_text or answer_text.startswith("Lỗi:"):
+        ERRORS.labels("http").inc()
+        raise HTTPException(status_code=500, detail=answer_text or "Agent không trả về kết quả")
+    return SessionQueryResponse(session_id=session.id, answer=answer_text, turns=session.turns)
+
+
+async def _session_fast_path(session, intent):
+    """Fast path trong phiên: kết quả tool được lưu vào phiên để LLM dùng lại ở lượt sau"""
+    call = None
+    async for event in fast_path_events(intent):
+        if event["event"] == "tool_call":
+            call = (event["name"], event["args"])
+        elif event["event"] == "tool_result" and call is not None:
+            session.remember_result(call[0], call[1], event["result"])
+        elif event["event"] == "answer":
+            return event["answer"]
+    return None
+
+
+# Xóa phiên hội thoại
+@app.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    """Kết thúc phiên hội thoại và giải phóng lịch sử"""
+    try:
+        session_store.delete(session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Phiên hội thoại không tồn tại hoặc đã hết hạn")
+
+
+# Thống kê cache câu trả lời
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Bộ đếm hit/miss của cache câu trả lời, trạng thái làm nóng cache, hàng đợi admission control, kho nến, kho dùng chung giữa các worker và warmup
+    """
+    return {
+        "answer_cache": answer_cache.stats(),
+        "prewarm": prewarm.prewarmer.stats(),
+        "admission": admission.stats(),
+        "bar_store": bar_store.stats(),
+        "shared_state": shared_state.stats(),
+        "warmup": warmup.warmer.stats(),
+    }
+
+
+# Tìm mã chứng khoán (autocomplete)
+@app.get("/tickers/search")
+async def search_tickers(
+    q: str = Query(..., min_length=1, max_length=64, description="Mã hoặc tên công ty, có dấu hoặc không dấu"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Gợi ý mã chứng khoán theo mã hoặc tên công ty
+    
+    Example:
+        GET /tickers/search?q=vinam
+        
+        Response:
+        {"query": "vinam", "results": [{"symbol": "VNM", "exchange": "HSX", ...}], "index_size": 1600}
+    """
+    return {"query": q, "results": ticker_index.search(q, limit), "index_size": len(ticker_index)}
+
+
+# Sàng lọc cổ phiếu toàn sàn
+@app.post("/screen")
+async def handle_screen(request: ScreenRequest, http_request: Request):
+    """
+    Sàng lọc cổ phiếu theo điều kiện chỉ báo, không qua LLM
+    
+    Example:
+        POST /screen
+        {"filter": "RSI14 < 30 and VOLUME > VOLUME_SMA20", "exchange": "HOSE", "limit": 10}
+        
+        Response:
+        {"as_of": "2024-05-31", "universe": 400, "matched": 12, "results": [{"ticker": "...", "RSI14": 24.1, ...}]}
+    """
+    try:
+        async with admission.admit(client_id(http_request)):
+            return await asyncio.to_thread(
+                screen, request.filter, request.sort_by or "", request.ascending, request.limit,
+                request.exchange or "", request.tickers, request.as_of or ""
+            )
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    except ScreenerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Metrics cho Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Metrics định dạng text của Prometheus: độ trễ LLM/tool, kích thước payload,
+    số lượt gọi LLM mỗi câu hỏi, hit/miss của cache và số lỗi
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Chạy server
 if __name__ == "__main__":
     # Kiểm tra API key trước khi chạy
@@ -146,9 +678,15 @@ if __name__ == "__main__":
     print(" ReDoc: http://127.0.0.1:8000/redoc")
     print("="*60 + "\n")
     
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        log_level="info"
-    )
+    if WORKERS > 1:
+        # Worker là process mới import lại main:app, nhận đường dẫn kho dùng chung qua biến môi trường
+        os.environ.setdefault("SHARED_STATE_DB", "shared_state.db")
+        print(f" Workers: {WORKERS}, cache dùng chung: {os.environ['SHARED_STATE_DB']}\n")
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, log_level="info", workers=WORKERS)
+    else:
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=8000,
+            log_level="info"
+        )
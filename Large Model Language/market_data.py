@@ -0,0 +1,196 @@
+"""
+Lớp dữ liệu nội bộ dùng chung giữa các tools
+Giữ giá lịch sử ở dạng DataFrame/mảng cột NumPy; chỉ serialize sang JSON
+một lần tại biên giao tiếp với LLM (các hàm trong tools.py)
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from bar_store import bar_store
+from cache import company_cache, last_closed_session, price_cache
+from shared_state import shared_state
+from singleflight import SingleFlight
+from sources import DATA_SOURCES, source_pool
+from tickers import TickerError, ticker_index
+
+
+# Nguồn chính (dùng làm khóa cache); khi lỗi source_pool tự chuyển sang nguồn dự phòng
+DEFAULT_SOURCE = DATA_SOURCES[0] if DATA_SOURCES else 'VCI'
+
+# Gộp các request đồng thời cùng mã, cùng khoảng ngày (hoặc cùng thông tin công ty) thành một lần gọi nguồn
+_history_flight = SingleFlight("price")
+_company_flight = SingleFlight("company")
+
+
+class MarketDataError(Exception):
+    """Lỗi khi lấy dữ liệu thị trường; message được trả nguyên văn cho LLM"""
+
+
+@dataclass(frozen=True)
+class PriceHistory:
+    """
+    Giá lịch sử OHLCV của một mã trong một khoảng thời gian
+
+    Attributes:
+        ticker: Mã chứng khoán (viết hoa)
+        source: Nguồn dữ liệu vnstock
+        frame: DataFrame các cột time, open, high, low, close, volume
+    """
+    ticker: str
+    source: str
+    frame: pd.DataFrame
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.frame['time'].to_numpy()
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.frame['open'].to_numpy(dtype=np.float64)
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.frame['high'].to_numpy(dtype=np.float64)
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.frame['low'].to_numpy(dtype=np.float64)
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.frame['close'].to_numpy(dtype=np.float64)
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.frame['volume'].to_numpy(dtype=np.float64)
+
+    def to_json(self) -> str:
+        """Serialize sang JSON records (chỉ dùng tại biên trả kết quả cho LLM)"""
+        return self.frame.to_json(orient='records', force_ascii=False)
+
+
+def resolve_ticker(ticker: str) -> str:
+    """Kiểm tra mã với danh mục niêm yết trước khi gọi nguồn dữ liệu"""
+    try:
+        return ticker_index.validate(ticker)
+    except TickerError as e:
+        raise MarketDataError(str(e)) from e
+
+
+def _fetch_history(ticker: str, start_date: str, end_date: str, source: str = DEFAULT_SOURCE) -> pd.DataFrame:
+    """Gọi nguồn vnstock để lấy giá lịch sử (không qua cache; có deadline, retry và failover)"""
+    return source_pool.history(ticker, start_date, end_date, preferred=source)
+
+
+def load_price_frame(ticker: str, start_date: str, end_date: str, source: str = DEFAULT_SOURCE) -> pd.DataFrame:
+    """
+    Lấy giá lịch sử dạng DataFrame qua cache, có thể rỗng (ví dụ khoảng ngày không có phiên nào)
+
+    Các phiên đã đóng cửa đọc từ kho nến toàn sàn (bar_store.py) nếu kho đã nạp đủ khoảng ngày;
+    còn lại đi qua PriceCache.
+
+    Raises:
+        MarketDataError: Khi mã không tồn tại hoặc nguồn dữ liệu lỗi
+    """
+    ticker = resolve_ticker(ticker)
+    stored = _load_from_store(ticker, start_date, end_date, source)
+    if stored is not None:
+        return stored
+    return _load_cached(ticker, start_date, end_date, source)
+
+
+def _load_cached(ticker: str, start_date: str, end_date: str, source: str) -> pd.DataFrame:
+    """Đọc qua PriceCache, gộp các request đồng thời giống nhau"""
+    try:
+        df, _ = _history_flight.do((ticker, source, start_date, end_date), lambda: price_cache.get_history(
+            ticker, start_date, end_date,
+            source=source,
+            fetch=lambda t, s, e: _fetch_history(t, s, e, source)
+        ))
+    except Exception as e:
+        raise MarketDataError(f"Lỗi khi lấy giá lịch sử {ticker}: {str(e)}") from e
+    # Kết quả có thể dùng chung giữa các request được gộp: mỗi request nhận bản sao riêng
+    return df.copy()
+
+
+def _load_from_store(ticker: str, start_date: str, end_date: str, source: str):
+    """Ghép phần đã đóng cửa từ kho nến với phiên đang mở (qua cache); None nếu kho chưa phủ khoảng ngày"""
+    if not bar_store.enabled:
+        return None
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        return None  # Để PriceCache báo lỗi như cũ
+    closed = last_closed_session(price_cache.clock())
+    stored = bar_store.read(ticker, start, min(end, closed))
+    if stored is None or end <= closed:
+        return stored
+    recent = _load_cached(ticker, (closed + timedelta(days=1)).isoformat(), end_date, source)
+    return pd.concat([stored, recent], ignore_index=True) if not recent.empty else stored
+
+
+def load_price_history(ticker: str, start_date: str, end_date: str, source: str = DEFAULT_SOURCE) -> PriceHistory:
+    """
+    Lấy giá lịch sử dạng cột qua cache
+
+    Args:
+        ticker: Mã chứng khoán (ví dụ: 'FPT', 'VCB', 'HPG')
+        start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
+        end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
+        source: Nguồn dữ liệu vnstock
+
+    Returns:
+        PriceHistory có ít nhất một phiên
+
+    Raises:
+        MarketDataError: Khi mã không tồn tại, không có dữ liệu hoặc nguồn dữ liệu lỗi
+    """
+    ticker = resolve_ticker(ticker)
+    df = load_price_frame(ticker, start_date, end_date, source)
+
+    if df is None or df.empty:
+        raise MarketDataError(f"Không có dữ liệu giá cho mã {ticker} trong khoảng thời gian này")
+
+    return PriceHistory(ticker=ticker, source=source, frame=df)
+
+
+def load_company_overview(ticker: str, source: str = DEFAULT_SOURCE) -> pd.DataFrame:
+    """
+    Lấy thông tin tổng quan công ty dạng DataFrame (qua cache TTL, mặc định một ngày)
+
+    Raises:
+        MarketDataError: Khi mã không tồn tại, không có dữ liệu hoặc nguồn dữ liệu lỗi
+    """
+    ticker = resolve_ticker(ticker)
+    cached = company_cache.get((ticker, source))
+    if cached is not None:
+        return cached.copy()
+
+    df, _ = _company_flight.do((ticker, source), lambda: _fetch_company_overview(ticker, source))
+    return df.copy()
+
+
+def _fetch_company_overview(ticker: str, source: str) -> pd.DataFrame:
+    """Gọi nguồn vnstock lấy thông tin công ty và lưu vào cache (một worker gọi, các worker khác chờ rồi đọc cache)"""
+    with shared_state.lock(f"company:{ticker}:{source}") as locked:
+        cached = company_cache.get((ticker, source)) if locked else None
+        if cached is not None:
+            return cached
+
+        try:
+            df = source_pool.company(ticker, preferred=source)
+        except Exception as e:
+            raise MarketDataError(f"Lỗi khi lấy thông tin công ty {ticker}: {str(e)}") from e
+
+        if df is None or df.empty:
+            raise MarketDataError(f"Không tìm thấy thông tin cho mã {ticker}")
+
+        company_cache.put((ticker, source), df)
+        return df
@@ -0,0 +1,296 @@
+"""
+Quan sát hệ thống: span theo từng giai đoạn, metrics định dạng Prometheus và logging không chặn
+Metrics được giữ trong bộ nhớ process và xuất qua endpoint /metrics của main.py
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+LOG_LEVEL = os.getenv("AGENT_LOG_LEVEL", "INFO").upper()
+
+# Bucket mặc định (giây) cho độ trễ LLM/tool
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bucket (byte) cho kích thước payload tool gửi lại LLM
+PAYLOAD_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 7, 10)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Metric có nhãn; mỗi tổ hợp giá trị nhãn là một chuỗi số liệu riêng"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """Chuỗi số liệu ứng với giá trị nhãn (theo thứ tự labelnames hoặc theo tên)"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} cần nhãn {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = self._new_series()
+            return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for key, series in items:
+            lines.extend(self._render_series(key, series))
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Bộ đếm chỉ tăng"""
+
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_series(self, key, series):
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(series.value)}"]
+
+
+class Gauge(_Metric):
+    """Giá trị tức thời, có thể tăng hoặc giảm (ví dụ độ dài hàng đợi)"""
+
+    kind = "gauge"
+
+    def _new_series(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().inc(-amount)
+
+    def set(self, value: float):
+        series = self.labels()
+        with series._lock:
+            series.value = value
+
+    def _render_series(self, key, series):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series.value)}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+
+class Histogram(_Metric):
+    """Histogram theo bucket cố định (đếm tích lũy khi xuất)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_series(self, key, series):
+        with series._lock:
+            counts, total, count = list(series.counts), series.sum, series.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts + [count - sum(counts)]):
+            cumulative += bucket_count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Tập metrics của process, xuất theo định dạng text của Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} đã được đăng ký")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Xóa mọi số liệu (giữ định nghĩa metric)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+# Độ trễ LLM và tool: agent_span_seconds{span="llm"} và agent_span_seconds{span="tool",name="<tool>"}
+SPAN_SECONDS = registry.register(Histogram(
+    "agent_span_seconds", "Thời gian mỗi span (llm, tool, query)", ("span", "name")))
+TOOL_PAYLOAD_BYTES = registry.register(Histogram(
+    "agent_tool_payload_bytes", "Kích thước kết quả tool gửi lại LLM (byte UTF-8)", ("tool",), PAYLOAD_BUCKETS))
+QUERY_ITERATIONS = registry.register(Histogram(
+    "agent_query_iterations", "Số lượt gọi LLM cho mỗi câu hỏi", (), ITERATION_BUCKETS))
+CACHE_REQUESTS = registry.register(Counter(
+    "agent_cache_requests", "Số lần tra cache theo kết quả hit/miss", ("cache", "result")))
+ROUTES = registry.register(Counter(
+    "agent_routes", "Số câu hỏi theo đường xử lý (fast_path hoặc llm)", ("route",)))
+ERRORS = registry.register(Counter(
+    "agent_errors", "Số lỗi theo giai đoạn", ("stage",)))
+SOURCE_REQUESTS = registry.register(Counter(
+    "agent_source_requests", "Số lần gọi nguồn dữ liệu theo kết quả (ok, error, timeout, circuit_open)",
+    ("source", "kind", "result")))
+QUERIES_ACTIVE = registry.register(Gauge(
+    "agent_queries_active", "Số câu hỏi đang được xử lý (đã qua admission control)"))
+QUERY_QUEUE_DEPTH = registry.register(Gauge(
+    "agent_query_queue_depth", "Số câu hỏi đang chờ trong hàng đợi admission control"))
+QUERY_QUEUE_SECONDS = registry.register(Histogram(
+    "agent_query_queue_seconds", "Thời gian chờ trong hàng đợi trước khi được xử lý"))
+ADMISSION_REJECTED = registry.register(Counter(
+    "agent_admission_rejected", "Số câu hỏi bị từ chối theo lý do (client_limit, queue_full, queue_timeout)",
+    ("reason",)))
+COALESCED = registry.register(Counter(
+    "agent_coalesced_requests", "Số lần gọi nguồn dữ liệu được gộp vào một lần gọi đang chạy", ("name",)))
+
+
+# Logging không chặn: handler chỉ đưa record vào hàng đợi, một thread nền ghi ra stdout
+logger = logging.getLogger("financial_agent")
+_log_queue = queue.SimpleQueue()
+_listener = None
+
+
+def start_logging():
+    """Bật thread ghi log nền (idempotent, tự chạy khi import module)"""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    _listener = logging.handlers.QueueListener(_log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Dừng thread ghi log nền, ghi nốt các record còn trong hàng đợi"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+start_logging()
+atexit.register(stop_logging)
+
+
+@contextmanager
+def span(kind: str, name: str = "", **attributes):
+    """
+    Đo một giai đoạn và ghi vào agent_span_seconds
+
+    Args:
+        kind: Loại span ('llm', 'tool', 'query', ...)
+        name: Tên cụ thể (ví dụ tên tool)
+        attributes: Thông tin thêm ghi vào log debug
+
+    Yields:
+        Dict attributes, có thể bổ sung trong lúc chạy; 'duration' được điền khi span kết thúc
+    """
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException:
+        attributes["error"] = True
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        attributes["duration"] = duration
+        SPAN_SECONDS.labels(kind, name).observe(duration)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span=%s name=%s duration_ms=%.1f %s", kind, name, duration * 1000,
+                         " ".join(f"{k}={v}" for k, v in attributes.items() if k != "duration"))
@@ -0,0 +1,142 @@
+"""
+Định dạng payload giá lịch sử gửi cho LLM theo ngân sách token
+Tính sẵn thống kê tóm tắt, gộp nến theo tuần/tháng khi chuỗi ngày quá dài
+và mã hóa dạng cột (mỗi cột một mảng) thay cho JSON records
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Ngân sách token cho payload giá lịch sử (có thể thay đổi qua biến môi trường)
+PRICE_PAYLOAD_TOKEN_BUDGET = int(os.getenv("PRICE_PAYLOAD_TOKEN_BUDGET", "1500"))
+# Ước lượng thô: JSON toàn số trung bình khoảng 3 ký tự mỗi token
+CHARS_PER_TOKEN = 3
+
+TRADING_DAYS_PER_YEAR = 252
+RECENT_SESSIONS = 5  # Số phiên gần nhất dùng để đánh giá xu hướng khối lượng
+
+# Các mức gộp nến, thử lần lượt cho tới khi vừa ngân sách
+_RESAMPLE_RULES = [("weekly", "W-FRI"), ("monthly", "ME")]
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token của một chuỗi"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _dumps(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def price_summary(history) -> dict:
+    """
+    Thống kê tóm tắt của một chuỗi giá
+
+    Args:
+        history: market_data.PriceHistory
+
+    Returns:
+        Dict gồm khoảng thời gian, giá đầu/cuối kỳ, % thay đổi, đỉnh/đáy (kèm ngày),
+        biến động năm hóa, khối lượng trung bình và xu hướng khối lượng
+    """
+    frame = history.frame
+    close, high, low, volume = history.close, history.high, history.low, history.volume
+    dates = frame['time'].dt.strftime('%Y-%m-%d').to_numpy()
+
+    returns = np.diff(close) / close[:-1] if len(close) > 1 else np.array([])
+    volatility = float(returns.std(ddof=1) * math.sqrt(TRADING_DAYS_PER_YEAR) * 100) if len(returns) > 1 else None
+    avg_volume = float(volume.mean())
+    recent_volume = float(volume[-RECENT_SESSIONS:].mean())
+
+    return {
+        "from": dates[0],
+        "to": dates[-1],
+        "sessions": len(close),
+        "first_close": round(float(close[0]), 2),
+        "last_close": round(float(close[-1]), 2),
+        "change_pct": round(float((close[-1] / close[0] - 1) * 100), 2),
+        "high": round(float(high.max()), 2),
+        "high_date": dates[int(high.argmax())],
+        "low": round(float(low.min()), 2),
+        "low_date": dates[int(low.argmin())],
+        "volatility_pct": None if volatility is None else round(volatility, 2),
+        "avg_volume": int(avg_volume),
+        "volume_trend_pct": round((recent_volume / avg_volume - 1) * 100, 2) if avg_volume else None,
+    }
+
+
+def columnar(frame: pd.DataFrame) -> dict:
+    """Mã hóa dạng cột: {"time": [...], "open": [...], ...}, giá làm tròn 2 chữ số"""
+    return {
+        "time": frame['time'].dt.strftime('%Y-%m-%d').tolist(),
+        "open": frame['open'].round(2).tolist(),
+        "high": frame['high'].round(2).tolist(),
+        "low": frame['low'].round(2).tolist(),
+        "close": frame['close'].round(2).tolist(),
+        "volume": frame['volume'].astype('int64').tolist(),
+    }
+
+
+def resample_bars(frame: pd.DataFrame, rule: str) -> pd.DataFrame:
+    """Gộp nến ngày thành nến tuần/tháng (open đầu kỳ, close cuối kỳ, tổng khối lượng)"""
+    bars = (
+        frame.set_index('time')
+        .resample(rule)
+        .agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+        .dropna(subset=['close'])
+        .reset_index()
+    )
+    return bars
+
+
+def shape_price_payload(history, token_budget: int = None, full_series: bool = False) -> str:
+    """
+    Tạo payload JSON giá lịch sử vừa với ngân sách token
+
+    Luôn có phần tóm tắt; nến ngày được giữ nguyên nếu vừa ngân sách, nếu không
+    thì gộp theo tuần rồi theo tháng, cuối cùng chỉ giữ các nến tháng gần nhất.
+
+    Args:
+        history: market_data.PriceHistory
+        token_budget: Ngân sách token (mặc định PRICE_PAYLOAD_TOKEN_BUDGET)
+        full_series: True để trả toàn bộ nến ngày, bỏ qua ngân sách
+
+    Returns:
+        JSON string gọn (dạng cột)
+    """
+    token_budget = token_budget or PRICE_PAYLOAD_TOKEN_BUDGET
+    payload = {
+        "ticker": history.ticker,
+        "summary": price_summary(history),
+        "granularity": "daily",
+        "bars": columnar(history.frame),
+    }
+    text = _dumps(payload)
+    if full_series or estimate_tokens(text) <= token_budget:
+        return text
+
+    for granularity, rule in _RESAMPLE_RULES:
+        bars = resample_bars(history.frame, rule)
+        payload["granularity"] = granularity
+        payload["bars"] = columnar(bars)
+        text = _dumps(payload)
+        if estimate_tokens(text) <= token_budget:
+            return text
+
+    # Vẫn quá dài: bỏ dần các nến tháng cũ nhất
+    while len(bars) > 1:
+        bars = bars.iloc[len(bars) // 2:]
+        payload["bars"] = columnar(bars)
+        payload["truncated"] = True
+        text = _dumps(payload)
+        if estimate_tokens(text) <= token_budget:
+            return text
+
+    del payload["bars"]
+    payload["granularity"] = "summary"
+    return _dumps(payload)
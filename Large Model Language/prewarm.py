@@ -0,0 +1,158 @@
+"""
+Làm nóng cache cho các mã được hỏi nhiều (mặc định rổ VN30)
+Chạy nền trong lifespan của FastAPI: tải trước giá lịch sử, thông tin công ty và các chỉ báo
+thông dụng theo lịch giao dịch, giới hạn tốc độ gọi nguồn dữ liệu
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+import tools
+from cache import MARKET_TZ, SESSION_CLOSE, is_trading_day, market_now
+from intent import parse_intent
+from market_data import MarketDataError, load_price_frame
+from observability import ERRORS, logger, span
+from router import plan_route
+from shared_state import shared_state
+
+
+# Rổ VN30 (cập nhật theo kỳ review của HOSE; có thể thay qua PREWARM_WATCHLIST)
+VN30 = (
+    "ACB", "BCM", "BID", "BVH", "CTG", "FPT", "GAS", "GVR", "HDB", "HPG",
+    "LPB", "MBB", "MSN", "MWG", "PLX", "SAB", "SHB", "SSB", "SSI", "STB",
+    "TCB", "TPB", "VCB", "VHM", "VIB", "VIC", "VJC", "VNM", "VPB", "VRE",
+)
+
+# Cấu hình (có thể thay đổi qua biến môi trường)
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") != "0"
+PREWARM_WATCHLIST = tuple(
+    t.strip().upper() for t in os.getenv("PREWARM_WATCHLIST", ",".join(VN30)).split(",") if t.strip()
+)
+PREWARM_INDICATORS = tuple(
+    s.strip() for s in os.getenv("PREWARM_INDICATORS", "RSI14,MACD,SMA20,SMA50").split(",") if s.strip()
+)
+PREWARM_HISTORY_DAYS = int(os.getenv("PREWARM_HISTORY_DAYS", "365"))  # Số ngày giá lịch sử tải trước vào kho nến
+PREWARM_RATE = float(os.getenv("PREWARM_RATE", "2"))  # Số lần gọi nguồn dữ liệu tối đa mỗi giây
+# Các mốc chạy trong ngày giao dịch: trước giờ mở cửa (khóa cache theo ngày mới) và sau khi đóng cửa (nến cuối ngày)
+PREWARM_TIMES = (dt_time(8, 45), (datetime.combine(datetime.min, SESSION_CLOSE) + timedelta(minutes=5)).time())
+# Nhiều worker: chỉ worker nhận lượt trước làm nóng các tầng cache dùng chung trong khoảng này (giây)
+PREWARM_CLAIM_TTL = 600
+
+
+class RateLimiter:
+    """Giới hạn số lần gọi mỗi giây (khoảng cách tối thiểu giữa hai lần gọi)"""
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=asyncio.sleep):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = self.clock()
+            if self._next > now:
+                await self.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+def next_run(now: datetime) -> datetime:
+    """Mốc làm nóng kế tiếp sau thời điểm now (chỉ vào ngày giao dịch)"""
+    day = now.date()
+    while True:
+        if is_trading_day(day):
+            for run_time in PREWARM_TIMES:
+                candidate = datetime.combine(day, run_time, tzinfo=now.tzinfo or MARKET_TZ)
+                if candidate > now:
+                    return candidate
+        day += timedelta(days=1)
+
+
+def warm_tasks(ticker: str, today) -> list:
+    """
+    Các lần gọi cần làm nóng cho một mã
+
+    Dùng đúng khoảng ngày mà fast path (router.py) sẽ dùng cho câu hỏi mặc định,
+    để khóa cache và trạng thái chỉ báo trùng với câu hỏi thật.
+
+    Returns:
+        Danh sách (mô tả, hàm không tham số)
+    """
+    start = (today - timedelta(days=PREWARM_HISTORY_DAYS)).isoformat()
+    tasks = [("history", lambda: load_price_frame(ticker, start, today.isoformat()))]
+
+    questions = [f"Thông tin {ticker}", f"Giá {ticker}"]
+    if PREWARM_INDICATORS:
+        questions.append(f"{' '.join(PREWARM_INDICATORS)} {ticker}")
+    for question in questions:
+        route = plan_route(parse_intent(question, today))
+        if route is not None:
+            tasks.append((route.tool, lambda route=route: getattr(tools, route.tool)(**route.args)))
+    return tasks
+
+
+class Prewarmer:
+    """Bộ làm nóng cache theo lịch giao dịch, có giới hạn tốc độ"""
+
+    def __init__(self, watchlist=PREWARM_WATCHLIST, rate: float = PREWARM_RATE, clock=market_now):
+        self.watchlist = tuple(watchlist)
+        self.limiter = RateLimiter(rate)
+        self.clock = clock
+        self.last_run = None
+        self.last_duration = None
+        self.next_run = None
+        self.errors = {}
+        self.skipped = 0
+
+    async def run_once(self):
+        """Làm nóng toàn bộ watchlist một lượt (tuần tự, mỗi lần gọi chờ rate limiter)"""
+        if not shared_state.claim("prewarm", PREWARM_CLAIM_TTL):
+            self.skipped += 1
+            logger.info("Worker khác đã nhận lượt làm nóng cache, bỏ qua")
+            return
+        started = time.perf_counter()
+        today = self.clock().date()
+        errors = {}
+        with span("prewarm", tickers=len(self.watchlist)):
+            for ticker in self.watchlist:
+                for name, func in warm_tasks(ticker, today):
+                    await self.limiter.acquire()
+                    try:
+                        await asyncio.to_thread(func)
+                    except MarketDataError as e:
+                        errors[ticker] = str(e)
+                    except Exception as e:
+                        ERRORS.labels("prewarm").inc()
+                        errors[ticker] = f"{name}: {e}"
+        self.errors = errors
+        self.last_run = self.clock().isoformat()
+        self.last_duration = round(time.perf_counter() - started, 3)
+        logger.info("Làm nóng %d mã trong %.1fs, %d lỗi", len(self.watchlist), self.last_duration, len(errors))
+
+    async def run_forever(self):
+        """Chạy một lượt khi khởi động, sau đó theo các mốc PREWARM_TIMES của ngày giao dịch"""
+        while True:
+            await self.run_once()
+            now = self.clock()
+            run_at = next_run(now)
+            self.next_run = run_at.isoformat()
+            await asyncio.sleep((run_at - now).total_seconds())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PREWARM_ENABLED,
+            "tickers": len(self.watchlist),
+            "last_run": self.last_run,
+            "last_duration_s": self.last_duration,
+            "next_run": self.next_run,
+            "errors": self.errors,
+            "skipped": self.skipped,
+        }
+
+
+# Bộ làm nóng dùng chung cho toàn bộ process
+prewarmer = Prewarmer()
@@ -0,0 +1,205 @@
+"""
+Fast path cho các câu hỏi đơn giản: gọi thẳng tools.py và trả lời theo mẫu, không qua Gemini
+Chỉ áp dụng khi ý định rõ ràng (một mã, một loại câu hỏi); các trường hợp còn lại
+trả về None để main.py chuyển cho LLM agent như trước
+"""
+
+import asyncio
+import json
+import math
+import os
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import tools
+from indicators import IndicatorError, parse_indicator
+from intent import Intent, detect_kinds
+from observability import ROUTES, span
+
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") != "0"
+# Câu hỏi dài hơn số từ này thường cần LLM diễn giải
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "14"))
+
+# Cụm từ cho thấy người dùng cần phân tích/nhận định, không chỉ là tra cứu số liệu
+_ANALYSIS_PHRASES = (
+    "so sanh", "tai sao", "vi sao", "nguyen nhan", "nen mua", "nen ban", "co nen", "du doan", "du bao",
+    "nhan dinh", "danh gia", "phan tich", "khuyen nghi", "tu van", "giai thich", "y nghia", "chien luoc",
+)
+
+_COMPANY_FIELDS = (
+    ("icb_name3", "Ngành"),
+    ("icb_name2", "Nhóm ngành"),
+    ("charter_capital", "Vốn điều lệ"),
+    ("issue_share", "Số cổ phiếu lưu hành"),
+)
+
+
+@dataclass(frozen=True)
+class Route:
+    """Một lần gọi tool thay cho vòng function calling của LLM"""
+    tool: str
+    args: dict
+    kind: str
+
+
+def plan_route(intent: Intent):
+    """
+    Chọn tool cho câu hỏi nếu đủ tin cậy để trả lời không cần LLM
+
+    Args:
+        intent: Intent đã phân tích (xem intent.parse_intent)
+
+    Returns:
+        Route hoặc None nếu nên chuyển cho LLM agent
+    """
+    if not FAST_PATH_ENABLED or intent.kind == "other" or len(intent.tickers) != 1:
+        return None
+    if len(intent.normalized.split()) > FAST_PATH_MAX_WORDS:
+        return None
+    if any(phrase in intent.normalized for phrase in _ANALYSIS_PHRASES):
+        return None
+    # Câu hỏi gộp nhiều loại (ví dụ "thông tin và giá FPT") để LLM xử lý
+    if len(detect_kinds(intent.normalized, intent.indicators)) > 1:
+        return None
+
+    ticker = intent.tickers[0]
+    if intent.kind == "company":
+        return Route("get_company_info", {"ticker": ticker}, intent.kind)
+
+    if intent.kind == "price":
+        return Route("get_historical_price", {
+            "ticker": ticker, "start_date": intent.start_date, "end_date": intent.end_date,
+        }, intent.kind)
+
+    try:
+        specs = [parse_indicator(spec) for spec in intent.indicators]
+    except IndicatorError:
+        return None
+    # Lấy thêm dữ liệu trước khoảng được hỏi để chỉ báo chu kỳ dài có giá trị tại end_date
+    start_date = min(intent.start_date, _warmup_start(specs, date.fromisoformat(intent.end_date)))
+    return Route("calculate_technical_indicators", {
+        "ticker": ticker, "indicators": list(intent.indicators),
+        "start_date": start_date, "end_date": intent.end_date,
+    }, intent.kind)
+
+
+def _warmup_start(specs: list, end: date) -> str:
+    """Ngày bắt đầu đủ số phiên để các chỉ báo có giá trị (chu kỳ dài như SMA200)"""
+    sessions = max((sum(int(p) for p in params) for _, params in specs), default=0) + 5
+    # ~5 phiên mỗi 7 ngày lịch, cộng thêm cho ngày nghỉ lễ
+    return (end - timedelta(days=math.ceil(sessions * 7 / 5) + 15)).isoformat()
+
+
+def execute_route(route: Route):
+    """
+    Gọi tool và dựng câu trả lời theo mẫu
+
+    Returns:
+        Tuple (kết quả tool, câu trả lời); câu trả lời là None khi tool báo lỗi
+        hoặc kết quả không đủ để trả lời theo mẫu (nên chuyển cho LLM)
+    """
+    with span("tool", route.tool, args=route.args, route="fast_path"):
+        result = getattr(tools, route.tool)(**route.args)
+
+    try:
+        data = json.loads(result)
+    except ValueError:
+        return result, None
+    if isinstance(data, dict) and "error" in data:
+        return result, None
+
+    render = {"company": render_company, "price": render_price, "indicator": render_indicators}[route.kind]
+    return result, render(data)
+
+
+async def fast_path_events(intent: Intent):
+    """
+    Chạy fast path và phát sự kiện cùng định dạng với agent.stream_agent_query
+
+    Yields:
+        "tool_call", "tool_result" rồi "answer"; không có "answer" nghĩa là
+        câu hỏi cần chuyển cho LLM agent
+    """
+    route = plan_route(intent)
+    if route is None:
+        ROUTES.labels("llm").inc()
+        return
+
+    yield {"event": "tool_call", "name": route.tool, "args": route.args}
+    # Tool đồng bộ (vnstock, pandas) chạy ngoài event loop
+    result, answer = await asyncio.to_thread(execute_route, route)
+    yield {"event": "tool_result", "name": route.tool, "result": result}
+
+    ROUTES.labels("fast_path" if answer else "llm").inc()
+    if answer:
+        yield {"event": "answer", "answer": answer}
+
+
+async def answer_fast_path(intent: Intent):
+    """
+    Trả lời câu hỏi qua fast path
+
+    Returns:
+        Câu trả lời, hoặc None nếu cần chuyển cho LLM agent
+    """
+    async for event in fast_path_events(intent):
+        if event["event"] == "answer":
+            return event["answer"]
+    return None
+
+
+def _number(value) -> str:
+    return f"{value:,.0f}" if isinstance(value, (int, float)) and abs(value) >= 1000 else f"{value:.2f}"
+
+
+def render_company(data) -> str:
+    """Câu trả lời mẫu từ kết quả get_company_info"""
+    if not data:
+        return None
+    record = data[0]
+    lines = [f"Thông tin công ty {record.get('symbol') or ''}".rstrip() + ":"]
+    for field, label in _COMPANY_FIELDS:
+        value = record.get(field)
+        if value not in (None, ""):
+            lines.append(f"- {label}: {_number(value) if isinstance(value, (int, float)) else value}")
+    profile = record.get("company_profile")
+    if profile:
+        lines.append(f"- Giới thiệu: {profile}")
+    return "\n".join(lines) if len(lines) > 1 else None
+
+
+def render_price(data) -> str:
+    """Câu trả lời mẫu từ phần tóm tắt của get_historical_price"""
+    summary = data.get("summary") if isinstance(data, dict) else None
+    if not summary:
+        return None
+    lines = [
+        f"Giá cổ phiếu {data['ticker']} từ {summary['from']} đến {summary['to']} ({summary['sessions']} phiên):",
+        f"- Giá đóng cửa đầu kỳ {summary['first_close']:.2f}, cuối kỳ {summary['last_close']:.2f} "
+        f"({summary['change_pct']:+.2f}%)",
+        f"- Cao nhất {summary['high']:.2f} (ngày {summary['high_date']}), "
+        f"thấp nhất {summary['low']:.2f} (ngày {summary['low_date']})",
+        f"- Khối lượng trung bình {summary['avg_volume']:,} cổ phiếu/phiên",
+    ]
+    if summary.get("volume_trend_pct") is not None:
+        lines.append(f"- Khối lượng 5 phiên gần nhất {summary['volume_trend_pct']:+.2f}% so với trung bình kỳ")
+    if summary.get("volatility_pct") is not None:
+        lines.append(f"- Biến động năm hóa {summary['volatility_pct']:.2f}%")
+    return "\n".join(lines)
+
+
+def render_indicators(data) -> str:
+    """Câu trả lời mẫu từ kết quả calculate_technical_indicators"""
+    if not isinstance(data, dict) or data.get("errors") or not data.get("indicators"):
+        return None
+    lines = [f"Chỉ báo kỹ thuật của {data['ticker']} (dữ liệu đến {data['as_of']}, giá đóng cửa {data['close']:.2f}):"]
+    for label, value in data["indicators"].items():
+        if value is None:
+            lines.append(f"- {label}: không đủ dữ liệu để tính")
+        elif isinstance(value, dict):
+            details = ", ".join(f"{key}=n/a" if v is None else f"{key}={v:.2f}" for key, v in value.items())
+            lines.append(f"- {label}: {details}")
+        else:
+            lines.append(f"- {label}: {value:.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,467 @@
+"""
+Sàng lọc cổ phiếu toàn sàn (cross-sectional screener)
+Biểu thức lọc như "RSI14 < 30 and VOLUME > VOLUME_SMA20" được tính trên ma trận
+[phiên x mã]: mỗi chỉ báo là một phép toán NumPy 2 chiều cho tất cả các mã cùng lúc,
+dữ liệu đọc thẳng từ kho nến (bar_store.py) nên không gọi nguồn dữ liệu theo từng mã
+"""
+
+import ast
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+
+from bar_store import bar_store
+from cache import last_closed_session
+from market_data import MarketDataError, load_price_frame
+from observability import span
+from tickers import ticker_index
+
+
+# Cấu hình (có thể thay đổi qua biến môi trường)
+SCREEN_DEFAULT_LIMIT = 20  # Số mã trả về mặc định
+SCREEN_MAX_RESULTS = int(os.getenv("SCREEN_MAX_RESULTS", "100"))
+SCREEN_MAX_TICKERS = int(os.getenv("SCREEN_MAX_TICKERS", "50"))  # Số mã tối đa khi không có kho nến (tải từng mã)
+SCREEN_MAX_WINDOW = 250  # Chu kỳ chỉ báo lớn nhất được phép
+
+# Sàn theo tên thường gọi -> mã sàn trong danh mục niêm yết
+EXCHANGES = {"HOSE": "HSX", "HSX": "HSX", "HNX": "HNX", "UPCOM": "UPCOM"}
+SERIES = {"CLOSE": "close", "PRICE": "close", "OPEN": "open", "HIGH": "high", "LOW": "low", "VOLUME": "volume", "VOL": "volume"}
+# Hàm được phép: tên -> chuỗi tính mặc định (ATR luôn dùng HIGH/LOW/CLOSE)
+FUNCTIONS = {"SMA": "CLOSE", "EMA": "CLOSE", "RSI": "CLOSE", "ROC": "CLOSE", "MAX": "HIGH", "MIN": "LOW", "ATR": None}
+_SHORTHAND = re.compile(r"^(?:(VOLUME|VOL)_)?(SMA|EMA|RSI|ROC|MAX|MIN|ATR)_?(\d+)$")
+_KEYWORDS = re.compile(r"\b(AND|OR|NOT)\b", re.IGNORECASE)
+_COMPARISONS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+class ScreenerError(ValueError):
+    """Biểu thức lọc không hợp lệ hoặc không có dữ liệu để sàng lọc"""
+
+
+@dataclass
+class Panel:
+    """
+    Giá toàn sàn dạng ma trận
+
+    Attributes:
+        dates: Mảng ngày giao dịch (datetime64[D]) theo thứ tự tăng dần
+        tickers: Danh sách mã, theo thứ tự cột
+        fields: Trường -> ma trận [phiên x mã]; giá đã forward-fill qua phiên tạm ngừng
+        traded: Mảng bool theo mã, có giao dịch ở phiên cuối không
+    """
+    dates: np.ndarray
+    tickers: list
+    fields: dict
+    traded: np.ndarray
+
+
+# ---- Phép tính 2 chiều (trục 0 là thời gian, mỗi cột một mã) ----
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    """Forward-fill NaN theo trục thời gian; NaN trước phiên đầu tiên của mã giữ nguyên"""
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trung bình trượt qua cumsum; NaN khi cửa sổ chưa đủ `window` giá trị (mã mới niêm yết)"""
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        zeros = np.zeros((1, values.shape[1]))
+        csum = np.vstack([zeros, np.nancumsum(values, axis=0)])
+        count = np.vstack([zeros, np.cumsum(~np.isnan(values), axis=0)])
+        full = count[window:] - count[:-window] == window
+        out[window - 1:] = np.where(full, (csum[window:] - csum[:-window]) / window, np.nan)
+    return out
+
+
+def _rolling_extreme(values: np.ndarray, window: int, func) -> np.ndarray:
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        out[window - 1:] = func(np.lib.stride_tricks.sliding_window_view(values, window, axis=0), axis=-1)
+    return out
+
+
+def _seeded_smoothing(values: np.ndarray, window: int, alpha: float) -> np.ndarray:
+    """
+    Bản 2 chiều của indicators._seeded_smoothing: mỗi cột khởi tạo bằng SMA của
+    `window` giá trị hợp lệ đầu tiên của cột đó, sau đó làm trơn hàm mũ theo từng phiên
+    """
+    valid = ~np.isnan(values)
+    count = np.cumsum(valid, axis=0)
+    seed = np.nancumsum(values, axis=0) / window
+    seeding = valid & (count == window)
+    out = np.full(values.shape, np.nan)
+    state = np.full(values.shape[1], np.nan)
+    for t in range(len(values)):
+        updated = state + alpha * (values[t] - state)
+        state = np.where(seeding[t], seed[t], np.where(valid[t] & (count[t] > window), updated, state))
+        out[t] = state
+    return out
+
+
+def _rsi(close: np.ndarray, window: int) -> np.ndarray:
+    delta = np.vstack([np.full((1, close.shape[1]), np.nan), np.diff(close, axis=0)])
+    avg_gain = _seeded_smoothing(np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None)), window, 1.0 / window)
+    avg_loss = _seeded_smoothing(np.where(np.isnan(delta), np.nan, np.clip(-delta, 0, None)), window, 1.0 / window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return np.where((avg_loss == 0) & ~np.isnan(avg_gain), 100.0, rsi)
+
+
+def _atr(panel: Panel, window: int) -> np.ndarray:
+    high, low, close = panel.fields["high"], panel.fields["low"], panel.fields["close"]
+    prev_close = np.vstack([close[:1], close[:-1]])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return _seeded_smoothing(true_range, window, 1.0 / window)
+
+
+def _roc(values: np.ndarray, window: int) -> np.ndarray:
+    out = np.full(values.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[window:] = (values[window:] / values[:-window] - 1.0) * 100.0
+    return out
+
+
+# ---- Biểu thức lọc ----
+
+class Expression:
+    """
+    Biểu thức lọc/xếp hạng đã kiểm tra cú pháp
+
+    Hỗ trợ: CLOSE, OPEN, HIGH, LOW, VOLUME; chỉ báo viết gọn (RSI14, SMA50, EMA20, ROC12,
+    ATR14, MAX20, MIN20, VOLUME_SMA20) hoặc dạng hàm (SMA(VOLUME, 20), RSI(14));
+    số, + - * /, so sánh, and/or/not (không phân biệt hoa thường) và ngoặc.
+    """
+
+    def __init__(self, text: str):
+        self.text = str(text or "").strip()
+        if not self.text:
+            raise ScreenerError("Biểu thức lọc không được để trống")
+        source = _KEYWORDS.sub(lambda m: m.group(1).lower(), self.text)
+        try:
+            self.tree = ast.parse(source, mode="eval")
+        except SyntaxError:
+            raise ScreenerError(f"Biểu thức không hợp lệ: {self.text}") from None
+        self.source = source
+        self.windows = []
+        self._check(self.tree.body)
+
+    def _check(self, node):
+        """Chỉ cho phép các nút an toàn, thu thập chu kỳ để biết cần bao nhiêu phiên"""
+        if isinstance(node, ast.BoolOp) or isinstance(node, ast.Compare) and all(isinstance(op, _COMPARISONS) for op in node.ops):
+            for child in node.values if isinstance(node, ast.BoolOp) else [node.left] + node.comparators:
+                self._check(child)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+            self._check(node.operand)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            pass
+        elif isinstance(node, ast.Name):
+            self._term(node.id)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            self._call(node)
+        else:
+            raise ScreenerError(f"Biểu thức không được hỗ trợ: {ast.get_source_segment(self.source, node) or self.text}")
+
+    def _term(self, name: str):
+        """Chuẩn hóa một tên: ('series', trường) hoặc ('func', hàm, trường, chu kỳ)"""
+        name = name.upper()
+        if name in SERIES:
+            return "series", SERIES[name]
+        match = _SHORTHAND.match(name)
+        if match is None:
+            raise ScreenerError(f"Không hiểu '{name}'. Dùng CLOSE, VOLUME, RSI14, SMA50, VOLUME_SMA20, ...")
+        series = "volume" if match.group(1) else SERIES[FUNCTIONS[match.group(2)] or "CLOSE"]
+        return "func", match.group(2), series, self._window(int(match.group(3)))
+
+    def _call(self, node: ast.Call):
+        func = node.func.id.upper()
+        if func not in FUNCTIONS:
+            raise ScreenerError(f"Hàm '{func}' không được hỗ trợ, chỉ có: {', '.join(FUNCTIONS)}")
+        args = node.args
+        if len(args) == 2 and isinstance(args[0], ast.Name) and args[0].id.upper() in SERIES and func != "ATR":
+            series, period = SERIES[args[0].id.upper()], args[1]
+        elif len(args) == 1:
+            series, period = SERIES[FUNCTIONS[func] or "CLOSE"], args[0]
+        else:
+            raise ScreenerError(f"Cú pháp: {func}(chu kỳ) hoặc {func}(CLOSE|VOLUME|..., chu kỳ)")
+        if not (isinstance(period, ast.Constant) and isinstance(period.value, int)):
+            raise ScreenerError(f"Chu kỳ của {func} phải là số nguyên")
+        return "func", func, series, self._window(period.value)
+
+    def _window(self, window: int) -> int:
+        if not 1 <= window <= SCREEN_MAX_WINDOW:
+            raise ScreenerError(f"Chu kỳ phải trong khoảng 1-{SCREEN_MAX_WINDOW}")
+        self.windows.append(window)
+        return window
+
+    @property
+    def is_condition(self) -> bool:
+        body = self.tree.body
+        return isinstance(body, (ast.BoolOp, ast.Compare)) or isinstance(body, ast.UnaryOp) and isinstance(body.op, ast.Not)
+
+    @property
+    def sessions_needed(self) -> int:
+        """Số phiên cần tải: chỉ báo làm trơn (EMA, RSI, ATR) cần thêm phiên để hội tụ"""
+        return max([30] + [3 * w + 10 for w in self.windows])
+
+    def terms(self) -> list:
+        """Các vế không phải hằng số của phép so sánh (để hiển thị giá trị trong kết quả)"""
+        found = []
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Compare):
+                for side in [node.left] + node.comparators:
+                    if not isinstance(side, ast.Constant):
+                        found.append(ast.get_source_segment(self.source, side))
+        return list(dict.fromkeys(found))
+
+    def default_order(self):
+        """Xếp hạng mặc định theo vế trái của phép so sánh đầu tiên: '<' xếp tăng dần, còn lại giảm dần"""
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Compare) and not isinstance(node.left, ast.Constant):
+                return ast.get_source_segment(self.source, node.left), isinstance(node.ops[0], (ast.Lt, ast.LtE))
+        return None, False
+
+    def evaluate(self, panel: Panel, memo: dict = None) -> np.ndarray:
+        """Tính biểu thức trên toàn ma trận, trả về ma trận [phiên x mã]"""
+        return _Evaluator(self, panel, {} if memo is None else memo).visit(self.tree.body)
+
+
+class _Evaluator:
+    def __init__(self, expression: Expression, panel: Panel, memo: dict):
+        self.expression = expression
+        self.panel = panel
+        self.memo = memo  # Dùng chung giữa biểu thức lọc và xếp hạng: mỗi chỉ báo tính một lần
+
+    def visit(self, node):
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = self.visit(node.values[0])
+            for value in node.values[1:]:
+                result = combine(result, self.visit(value))
+            return result
+        if isinstance(node, ast.Compare):
+            result, left = None, self.visit(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.visit(comparator)
+                with np.errstate(invalid="ignore"):
+                    current = _compare(op, left, right)
+                result = current if result is None else result & current
+                left = right
+            return result
+        if isinstance(node, ast.UnaryOp):
+            operand = self.visit(node.operand)
+            return np.logical_not(operand) if isinstance(node.op, ast.Not) else -operand
+        if isinstance(node, ast.BinOp):
+            left, right = self.visit(node.left), self.visit(node.right)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if isinstance(node.op, ast.Add):
+                    return left + right
+                if isinstance(node.op, ast.Sub):
+                    return left - right
+                if isinstance(node.op, ast.Mult):
+                    return left * right
+                return left / right
+        if isinstance(node, ast.Constant):
+            return float(node.value)
+        term = self.expression._term(node.id) if isinstance(node, ast.Name) else self.expression._call(node)
+        return self.compute(term)
+
+    def compute(self, term: tuple) -> np.ndarray:
+        if term not in self.memo:
+            fields = self.panel.fields
+            if term[0] == "series":
+                self.memo[term] = fields[term[1]]
+            else:
+                _, func, series, window = term
+                values = fields[series]
+                if func == "SMA":
+                    result = _rolling_mean(values, window)
+                elif func == "EMA":
+                    result = _seeded_smoothing(values, window, 2.0 / (window + 1))
+                elif func == "RSI":
+                    result = _rsi(values, window)
+                elif func == "ROC":
+                    result = _roc(values, window)
+                elif func == "MAX":
+                    result = _rolling_extreme(values, window, np.max)
+                elif func == "MIN":
+                    result = _rolling_extreme(values, window, np.min)
+                else:
+                    result = _atr(self.panel, window)
+                self.memo[term] = result
+        return self.memo[term]
+
+
+def _compare(op, left, right):
+    if isinstance(op, ast.Lt):
+        return left < right
+    if isinstance(op, ast.LtE):
+        return left <= right
+    if isinstance(op, ast.Gt):
+        return left > right
+    if isinstance(op, ast.GtE):
+        return left >= right
+    if isinstance(op, ast.Eq):
+        return left == right
+    return left != right
+
+
+# ---- Dữ liệu ----
+
+def _universe(exchange: str = "", tickers=None) -> list:
+    """Danh sách mã cần sàng lọc; None = mọi mã trong kho nến"""
+    if tickers:
+        return list(dict.fromkeys(str(t).strip().upper() for t in tickers if str(t).strip()))
+    if not exchange:
+        return None
+    code = EXCHANGES.get(str(exchange).strip().upper())
+    if code is None:
+        raise ScreenerError(f"Sàn '{exchange}' không hợp lệ, chỉ có: HOSE, HNX, UPCOM")
+    if not len(ticker_index):
+        raise ScreenerError("Chưa tải được danh mục mã niêm yết để lọc theo sàn")
+    return [s for s in ticker_index.listed_symbols() if ticker_index.get(s).exchange.upper() == code]
+
+
+def _build_panel(dates: np.ndarray, tickers: list, raw: dict) -> Panel:
+    close = raw["close"]
+    traded = ~np.isnan(close[-1]) if len(close) else np.zeros(len(tickers), dtype=bool)
+    filled = _ffill(close)
+    fields = {name: _ffill(values) for name, values in raw.items() if name not in ("close", "volume")}
+    fields["close"] = filled
+    # Phiên tạm ngừng giao dịch: giá giữ nguyên, khối lượng bằng 0
+    fields["volume"] = np.where(np.isnan(raw["volume"]) & ~np.isnan(filled), 0.0, raw["volume"])
+    return Panel(dates, tickers, fields, traded)
+
+
+def load_panel(start: date, end: date, universe=None, mapper=map) -> tuple:
+    """
+    Dựng ma trận giá cho khoảng [start, end]
+
+    Ưu tiên kho nến (view trên memmap, chỉ copy các cột được chọn). Khi kho chưa bật hoặc
+    chưa có phiên `end` của các mã được yêu cầu, tải từng mã qua market_data (chỉ cho danh sách mã nhỏ).
+
+    Returns:
+        (Panel, dict mã -> lỗi)
+    """
+    if bar_store.enabled:
+        dates, stored, values, coverage = bar_store.panel(start, end)
+        wanted = set(stored if universe is None else universe)
+        # Chỉ cần kho có phiên sàng lọc; mã có lịch sử ngắn hơn khoảng tải thì chỉ báo dài là NaN
+        columns = [i for i, t in enumerate(stored) if t in wanted and coverage[t][0] <= end <= coverage[t][1]]
+        if universe is None or len(columns) == len(wanted):
+            raw = {name: values[name][:, columns] for name in values}
+            return _build_panel(np.asarray(dates), [stored[i] for i in columns], raw), {}
+
+    if universe is None:
+        raise ScreenerError("Sàng lọc toàn sàn cần kho nến (BAR_STORE_DIR, xem bar_store.py); "
+                            "hoặc truyền danh sách mã cần lọc")
+    if len(universe) > SCREEN_MAX_TICKERS:
+        raise ScreenerError(f"Khi chưa có kho nến chỉ lọc được tối đa {SCREEN_MAX_TICKERS} mã, nhận được {len(universe)} mã")
+
+    def load(ticker):
+        try:
+            return ticker, load_price_frame(ticker, start.isoformat(), end.isoformat()), None
+        except MarketDataError as e:
+            return ticker, None, str(e)
+
+    frames, errors = {}, {}
+    for ticker, frame, error in mapper(load, universe):
+        if error is not None:
+            errors[ticker] = error
+        elif frame is not None and not frame.empty:
+            frames[ticker] = frame
+    dates = np.unique(np.concatenate([np.empty(0, dtype="datetime64[D]")] + [
+        frame["time"].to_numpy().astype("datetime64[D]") for frame in frames.values()
+    ]))
+    raw = {name: np.full((len(dates), len(frames)), np.nan) for name in ("open", "high", "low", "close", "volume")}
+    for column, frame in enumerate(frames.values()):
+        rows = np.searchsorted(dates, frame["time"].to_numpy().astype("datetime64[D]"))
+        for name in raw:
+            raw[name][rows, column] = frame[name].to_numpy(dtype=np.float64)
+    return _build_panel(dates, list(frames), raw), errors
+
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 2)
+
+
+def screen(expression: str, sort_by: str = "", ascending: bool = None, limit: int = SCREEN_DEFAULT_LIMIT,
+           exchange: str = "", tickers=None, as_of: str = "", mapper=map) -> dict:
+    """
+    Sàng lọc cổ phiếu theo biểu thức tại một phiên
+
+    Args:
+        expression: Biểu thức lọc, ví dụ "RSI14 < 30 and VOLUME > VOLUME_SMA20"
+        sort_by: Biểu thức xếp hạng; mặc định theo vế trái của phép so sánh đầu tiên
+        ascending: Chiều xếp hạng; mặc định tăng dần nếu phép so sánh đầu tiên là '<'
+        limit: Số mã trả về
+        exchange: Giới hạn theo sàn (HOSE, HNX, UPCOM)
+        tickers: Giới hạn theo danh sách mã
+        as_of: Phiên sàng lọc 'YYYY-MM-DD'; mặc định phiên gần nhất đã đóng cửa
+        mapper: Hàm map dùng khi phải tải từng mã (ví dụ executor.map)
+
+    Returns:
+        Dict {"as_of", "universe", "matched", "results": [{"ticker", "close", "volume", <vế>: giá trị}], ...}
+
+    Raises:
+        ScreenerError: Biểu thức, sàn hoặc tham số không hợp lệ, hoặc không có dữ liệu
+    """
+    condition = Expression(expression)
+    if not condition.is_condition:
+        raise ScreenerError(f"Biểu thức lọc phải là điều kiện so sánh, ví dụ 'RSI14 < 30', nhận được: {condition.text}")
+    default_sort, default_ascending = condition.default_order()
+    ranking = Expression(sort_by or default_sort or "VOLUME")
+    ascending = default_ascending if ascending is None and not sort_by else bool(ascending)
+    limit = max(1, min(int(limit), SCREEN_MAX_RESULTS))
+
+    try:
+        end = date.fromisoformat(as_of) if as_of else last_closed_session()
+    except ValueError:
+        raise ScreenerError(f"Ngày '{as_of}' không hợp lệ, dùng định dạng 'YYYY-MM-DD'") from None
+    sessions = max(condition.sessions_needed, ranking.sessions_needed)
+    start = end - timedelta(days=sessions * 7 // 5 + 14)  # Cộng dư cho cuối tuần và ngày lễ
+
+    with span("screen", "", expression=condition.text) as attributes:
+        panel, errors = load_panel(start, end, _universe(exchange, tickers), mapper)
+        if not len(panel.dates) or not panel.tickers:
+            raise ScreenerError("Không có dữ liệu giá để sàng lọc trong khoảng thời gian này")
+
+        memo = {}
+        matched = np.asarray(condition.evaluate(panel, memo), dtype=bool)[-1] & panel.traded
+        score = np.broadcast_to(ranking.evaluate(panel, memo), panel.fields["close"].shape)[-1]
+        order = np.flatnonzero(matched)
+        order = order[np.argsort(np.where(np.isnan(score[order]), np.inf if ascending else -np.inf, score[order]), kind="stable")]
+        if not ascending:
+            order = order[::-1]
+
+        terms = {term: np.broadcast_to(Expression(term).evaluate(panel, memo), panel.fields["close"].shape)[-1]
+                 for term in dict.fromkeys(condition.terms() + [ranking.text])}
+        results = []
+        for column in order[:limit]:
+            row = {"ticker": panel.tickers[column],
+                   "close": _number(panel.fields["close"][-1, column]),
+                   "volume": int(panel.fields["volume"][-1, column])}
+            row.update({term: _number(values[column]) for term, values in terms.items()})
+            results.append(row)
+        attributes.update(universe=len(panel.tickers), matched=int(matched.sum()))
+
+    report = {
+        "as_of": str(panel.dates[-1]),
+        "filter": condition.text,
+        "sort_by": ranking.text,
+        "ascending": ascending,
+        "universe": len(panel.tickers),
+        "matched": int(matched.sum()),
+        "results": results,
+    }
+    if errors:
+        report["errors"] = errors
+    return report
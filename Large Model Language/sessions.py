@@ -0,0 +1,260 @@
+"""
+Phiên hội thoại nhiều lượt (multi-turn) cho các endpoint /sessions
+Mỗi phiên giữ lịch sử chat với Gemini (đã rút gọn để prompt không phình ra),
+kết quả tool đã lấy và các mã vừa được nhắc tới để câu hỏi tiếp theo
+("còn RSI của nó?") dùng lại ngữ cảnh và dữ liệu thay vì hỏi lại từ đầu
+Khi bật SHARED_STATE_DB, trạng thái phiên được lưu vào bảng dùng chung nên câu hỏi
+tiếp theo có thể tới bất kỳ worker nào
+"""
+
+import asyncio
+import dataclasses
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from intent import Intent
+from observability import CACHE_REQUESTS
+from shared_state import shared_state
+
+
+# Cấu hình phiên (có thể thay đổi qua biến môi trường)
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))  # Số phiên giữ trong bộ nhớ (LRU)
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))  # Phiên không hoạt động quá số giây này sẽ bị xóa
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "10"))  # Số lượt hỏi đáp giữ trong lịch sử
+SESSION_FULL_TURNS = int(os.getenv("SESSION_FULL_TURNS", "2"))  # Số lượt gần nhất giữ nguyên cả lời gọi tool
+SESSION_MAX_HISTORY_BYTES = int(os.getenv("SESSION_MAX_HISTORY_BYTES", "65536"))  # Ngân sách kích thước lịch sử
+SESSION_TOOL_RESULTS = 32  # Số kết quả tool giữ lại mỗi phiên
+SESSION_TOOL_TTL = float(os.getenv("SESSION_TOOL_TTL", "300"))  # Thời gian (giây) dùng lại kết quả tool
+
+
+class SessionNotFound(KeyError):
+    """Phiên không tồn tại hoặc đã hết hạn"""
+
+
+def _content(role: str, text: str):
+    from google.generativeai import protos  # SDK nạp lười (xem warmup.py)
+    return protos.Content(role=role, parts=[protos.Part(text=text)])
+
+
+def _is_question(content) -> bool:
+    """Lượt mới bắt đầu bằng nội dung của người dùng có text (không phải kết quả tool)"""
+    return content.role == "user" and any(part.text for part in content.parts)
+
+
+def _size(content) -> int:
+    return len(type(content).serialize(content))
+
+
+def compact_history(history: list, max_turns: int = SESSION_MAX_TURNS, full_turns: int = SESSION_FULL_TURNS,
+                    max_bytes: int = SESSION_MAX_HISTORY_BYTES) -> list:
+    """
+    Rút gọn lịch sử chat để prompt có kích thước giới hạn
+
+    - Giữ tối đa max_turns lượt gần nhất
+    - Các lượt cũ hơn full_turns chỉ giữ câu hỏi và câu trả lời cuối (bỏ function call/kết quả tool;
+      dữ liệu vẫn còn trong kết quả tool của phiên nếu model gọi lại)
+    - Bỏ tiếp các lượt cũ nhất khi tổng kích thước vượt max_bytes
+
+    Args:
+        history: Danh sách genai.protos.Content (chat.history)
+
+    Returns:
+        Danh sách Content mới, luân phiên user/model
+    """
+    turns = []
+    for content in history:
+        if _is_question(content) or not turns:
+            turns.append([])
+        turns[-1].append(content)
+    turns = turns[-max_turns:] if max_turns > 0 else []
+
+    compacted = []
+    for index, turn in enumerate(turns):
+        if index < len(turns) - full_turns:
+            answers = [c for c in turn[1:] if c.role == "model" and any(part.text for part in c.parts)]
+            if not answers:
+                continue
+            answer = "".join(part.text for part in answers[-1].parts if part.text)
+            turn = [turn[0], _content("model", answer)]
+        compacted.append(turn)
+
+    while len(compacted) > 1 and sum(_size(c) for turn in compacted for c in turn) > max_bytes:
+        compacted.pop(0)
+    return [content for turn in compacted for content in turn]
+
+
+class Session:
+    """
+    Một phiên hội thoại
+
+    Attributes:
+        id: Mã phiên
+        history: Lịch sử chat đã rút gọn (genai.protos.Content)
+        tickers: Các mã được nhắc tới ở lượt gần nhất (để hiểu "nó", "mã này")
+        turns: Số lượt hỏi đáp đã xử lý
+        version: Tăng mỗi lần lưu vào kho dùng chung (worker giữ bản cũ hơn sẽ nạp lại)
+        lock: Các câu hỏi trong cùng một phiên được xử lý tuần tự (trong một worker)
+    """
+
+    def __init__(self, session_id: str, clock=time.monotonic):
+        self.id = session_id
+        self.clock = clock
+        self.history = []
+        self.tickers = ()
+        self.turns = 0
+        self.version = 0
+        self.created_at = self.last_used = clock()
+        self.lock = asyncio.Lock()
+        self._tool_results = OrderedDict()  # (tên tool, tham số JSON) -> (kết quả, thời điểm)
+
+    def resolve(self, intent: Intent) -> Intent:
+        """Câu hỏi tiếp theo không nêu mã: dùng các mã của lượt trước"""
+        if intent.tickers or not self.tickers or intent.kind == "other":
+            return intent
+        return dataclasses.replace(intent, tickers=self.tickers)
+
+    def remember_tickers(self, tickers):
+        if tickers:
+            self.tickers = tuple(dict.fromkeys(str(t).upper() for t in tickers))
+
+    @staticmethod
+    def _tool_key(name: str, args: dict) -> tuple:
+        return name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+    def cached_result(self, name: str, args: dict):
+        """Kết quả tool đã lấy trong phiên với cùng tham số (còn trong SESSION_TOOL_TTL), hoặc None"""
+        key = self._tool_key(name, args)
+        entry = self._tool_results.get(key)
+        if entry is not None and self.clock() - entry[1] < SESSION_TOOL_TTL:
+            self._tool_results.move_to_end(key)
+            CACHE_REQUESTS.labels("session_tool", "hit").inc()
+            return entry[0]
+        CACHE_REQUESTS.labels("session_tool", "miss").inc()
+        return None
+
+    def remember_result(self, name: str, args: dict, result: str):
+        """Lưu kết quả tool thành công (không lưu lỗi để lượt sau còn thử lại)"""
+        if result.startswith("Lỗi") or result.startswith('{"error"'):
+            return
+        self._tool_results[self._tool_key(name, args)] = (result, self.clock())
+        self._tool_results.move_to_end(self._tool_key(name, args))
+        while len(self._tool_results) > SESSION_TOOL_RESULTS:
+            self._tool_results.popitem(last=False)
+        for key in ("ticker", "tickers"):
+            value = args.get(key)
+            if value:
+                self.remember_tickers([value] if isinstance(value, str) else value)
+
+    def update_history(self, history: list):
+        """Thay lịch sử bằng lịch sử chat mới nhất (đã rút gọn)"""
+        self.history = compact_history(list(history))
+        self.turns += 1
+
+    def add_turn(self, question: str, answer: str):
+        """Ghi lượt được trả lời không qua LLM (fast path, cache) để các lượt sau vẫn có ngữ cảnh"""
+        self.update_history(self.history + [_content("user", question), _content("model", answer)])
+
+    def state(self) -> dict:
+        """Trạng thái phiên để lưu vào kho dùng chung (lịch sử serialize dạng protobuf)"""
+        return {
+            "history": [type(content).serialize(content) for content in self.history],
+            "tickers": self.tickers,
+            "turns": self.turns,
+            "version": self.version,
+            "created_at": self.created_at,
+            "tool_results": list(self._tool_results.items()),
+        }
+
+    def load_state(self, state: dict):
+        """Nạp trạng thái do worker khác lưu (giữ nguyên lock của phiên trong worker này)"""
+        from google.generativeai import protos
+        self.history = [protos.Content.deserialize(blob) for blob in state["history"]]
+        self.tickers = tuple(state["tickers"])
+        self.turns = state["turns"]
+        self.version = state["version"]
+        self.created_at = state["created_at"]
+        self._tool_results = OrderedDict(state["tool_results"])
+
+    def info(self) -> dict:
+        return {
+            "session_id": self.id,
+            "turns": self.turns,
+            "tickers": list(self.tickers),
+            "history_messages": len(self.history),
+            "tool_results": len(self._tool_results),
+            "expires_in": max(0, round(SESSION_TTL - (self.clock() - self.last_used))),
+        }
+
+
+class SessionStore:
+    """Kho phiên trong bộ nhớ, loại bỏ theo LRU và TTL kể từ lần dùng cuối; có thể dùng chung giữa các worker"""
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, ttl: float = SESSION_TTL, clock=time.monotonic,
+                 shared=shared_state):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.shared = shared
+        self._sessions = OrderedDict()  # id -> Session
+
+    def create(self) -> Session:
+        self._expire()
+        session = Session(uuid.uuid4().hex, self.clock)
+        self._sessions[session.id] = session
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+        self.save(session)
+        return session
+
+    def get(self, session_id: str) -> Session:
+        """
+        Raises:
+            SessionNotFound: Phiên không tồn tại hoặc đã hết hạn
+        """
+        self._expire()
+        session = self._sessions.get(session_id)
+        if self.shared.enabled:
+            state = self.shared.get("session", session_id)
+            if state is None:
+                # Đã bị xóa hoặc hết hạn ở worker khác
+                self._sessions.pop(session_id, None)
+                raise SessionNotFound(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(session_id, self.clock)
+            if state["version"] > session.version:
+                session.load_state(state)
+        if session is None:
+            raise SessionNotFound(session_id)
+        session.last_used = self.clock()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def save(self, session: Session):
+        """Lưu phiên vào kho dùng chung sau mỗi lượt (không làm gì khi chỉ có một process)"""
+        if self.shared.enabled:
+            session.version += 1
+            self.shared.put("session", session.id, session.state(), self.ttl)
+
+    def delete(self, session_id: str):
+        removed = self._sessions.pop(session_id, None) is not None
+        if self.shared.delete("session", session_id) or removed:
+            return
+        raise SessionNotFound(session_id)
+
+    def _expire(self):
+        now = self.clock()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# Kho phiên dùng chung cho toàn bộ process
+session_store = SessionStore()
@@ -0,0 +1,161 @@
+"""
+Trạng thái dùng chung giữa các worker (process) uvicorn, không cần dịch vụ ngoài
+Một file SQLite ở chế độ WAL (nhiều process đọc đồng thời, ghi tuần tự):
+- Bảng kv có TTL: thông tin công ty, câu trả lời, phiên hội thoại
+- Bảng leases: khóa liên process có hạn dùng (worker giữ khóa bị chết thì khóa tự hết hạn),
+  dùng cho single-flight giữa các worker và để chỉ một worker làm nóng cache
+
+Kho nến giá lịch sử (cache.py) và danh mục mã (tickers.py) dùng chung cùng file/thư mục.
+SHARED_STATE_DB rỗng thì mọi thứ giữ trong từng process như trước.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from observability import CACHE_REQUESTS, logger
+
+
+# Cấu hình (có thể thay đổi qua biến môi trường)
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "")  # Đường dẫn file SQLite dùng chung, rỗng = tắt
+SHARED_LOCK_TTL = float(os.getenv("SHARED_LOCK_TTL", "60"))  # Hạn dùng (giây) của khóa liên process
+SHARED_LOCK_WAIT = float(os.getenv("SHARED_LOCK_WAIT", "30"))  # Thời gian chờ khóa tối đa (giây)
+SHARED_LOCK_POLL = 0.05  # Chu kỳ thử lại khi khóa đang bị giữ (giây)
+SQLITE_BUSY_TIMEOUT = 10.0  # Thời gian chờ (giây) khi process khác đang ghi
+PURGE_EVERY = 500  # Dọn các entry hết hạn sau mỗi số lần ghi này
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Kết nối SQLite dùng được từ nhiều thread và nhiều process (WAL, chờ khi file đang bị ghi)"""
+    db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # Đủ an toàn với WAL, commit không phải fsync mỗi lần
+    return db
+
+
+class SharedState:
+    """
+    Cache key-value có TTL và khóa liên process trên một file SQLite
+
+    Giá trị được pickle: file chỉ do các worker của chính server này ghi.
+    """
+
+    def __init__(self, path: str = SHARED_STATE_DB, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._db = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path:
+            self._db = connect(path)
+            with self._lock, self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS kv ("
+                    "namespace TEXT, key TEXT, value BLOB, expires_at REAL, PRIMARY KEY (namespace, key))"
+                )
+                self._db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    # ---- Key-value có TTL ----
+
+    def get(self, namespace: str, key: str):
+        """Giá trị còn hạn, hoặc None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?", (namespace, key, self.clock())
+            ).fetchone()
+        CACHE_REQUESTS.labels(f"shared_{namespace}", "hit" if row else "miss").inc()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, namespace: str, key: str, value, ttl: float):
+        if not self.enabled or ttl <= 0:
+            return
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)", (namespace, key, blob, self.clock() + ttl))
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM kv WHERE expires_at <= ?", (self.clock(),))
+                self._db.execute("DELETE FROM leases WHERE expires_at <= ?", (self.clock(),))
+
+    def delete(self, namespace: str, key: str) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).rowcount > 0
+
+    # ---- Khóa liên process ----
+
+    def try_acquire(self, name: str, ttl: float = SHARED_LOCK_TTL):
+        """
+        Giữ khóa `name` nếu chưa ai giữ hoặc khóa cũ đã hết hạn (một câu lệnh, atomic giữa các process)
+
+        Returns:
+            Token để release, hoặc None nếu process khác đang giữ
+        """
+        token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        now = self.clock()
+        with self._lock, self._db:
+            acquired = self._db.execute(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                "owner = excluded.owner, expires_at = excluded.expires_at WHERE leases.expires_at <= ?",
+                (name, token, now + ttl, now)
+            ).rowcount
+        return token if acquired else None
+
+    def release(self, name: str, token: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, token))
+
+    def claim(self, name: str, ttl: float) -> bool:
+        """Đánh dấu việc `name` do process này làm trong ttl giây tới (không release); tắt thì luôn True"""
+        return not self.enabled or self.try_acquire(f"claim:{name}", ttl) is not None
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = SHARED_LOCK_TTL, wait: float = SHARED_LOCK_WAIT, sleep=time.sleep):
+        """
+        Khóa liên process trong khối with (chặn thread hiện tại trong lúc chờ)
+
+        Tắt hoặc chờ quá `wait` thì vẫn chạy khối with mà không giữ khóa: tải trùng
+        giữa các worker tốt hơn là báo lỗi cho người dùng.
+
+        Yields:
+            True nếu đang giữ khóa
+        """
+        if not self.enabled:
+            yield False
+            return
+        deadline = time.monotonic() + wait
+        token = self.try_acquire(name, ttl)
+        while token is None and time.monotonic() < deadline:
+            sleep(SHARED_LOCK_POLL)
+            token = self.try_acquire(name, ttl)
+        if token is None:
+            logger.warning("Chờ khóa %s quá %.0fs, tiếp tục không giữ khóa", name, wait)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self.release(name, token)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT namespace, COUNT(*) FROM kv WHERE expires_at > ? GROUP BY namespace", (self.clock(),)
+            ).fetchall()
+        return {"enabled": True, "path": self.path, "entries": dict(rows)}
+
+
+# Trạng thái dùng chung cho toàn bộ process (và các worker khác cùng SHARED_STATE_DB)
+shared_state = SharedState()
@@ -0,0 +1,70 @@
+"""
+Gộp các lần gọi đồng thời giống nhau (single-flight)
+Khi nhiều thread cùng cần một kết quả (ví dụ giá lịch sử của cùng mã, cùng khoảng ngày),
+chỉ thread đầu tiên gọi nguồn dữ liệu; các thread còn lại chờ và dùng chung kết quả hoặc lỗi
+Khác với cache: không giữ kết quả sau khi lần gọi kết thúc, nên giúp cả khi cache đang trống
+"""
+
+import threading
+
+from observability import COALESCED
+
+
+class _Call:
+    """Một lần gọi đang chạy"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Nhóm các lần gọi theo khóa; mỗi khóa có tối đa một lần gọi đang chạy"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}  # khóa -> _Call đang chạy
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Gọi func() hoặc chờ lần gọi đang chạy với cùng khóa
+
+        Args:
+            key: Khóa hashable xác định kết quả (ví dụ (ticker, source, start_date, end_date))
+            func: Hàm không tham số gọi nguồn thật
+
+        Returns:
+            Tuple (kết quả, shared); shared là True khi kết quả dùng chung với lần gọi khác,
+            người gọi cần sao chép nếu định chỉnh sửa
+
+        Raises:
+            Lỗi của func, cho mọi lần gọi đang chờ
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED.labels(self.name).inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def __len__(self) -> int:
+        return len(self._calls)
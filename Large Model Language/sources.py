@@ -0,0 +1,243 @@
+"""
+Lớp nguồn dữ liệu có khả năng chịu lỗi
+- Giới hạn thời gian cho mỗi lần gọi vnstock (deadline), thử lại với backoff ngẫu nhiên (tenacity)
+- Circuit breaker cho từng nguồn: nguồn lỗi liên tục bị bỏ qua một thời gian
+- Tự chuyển sang nguồn dự phòng (VCI -> TCBS) và chuẩn hóa dữ liệu về một schema chung
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import pandas as pd
+import requests
+from tenacity import (
+    Retrying, retry_if_exception_type, stop_after_attempt, stop_after_delay, wait_random_exponential,
+)
+
+from cache import MARKET_TZ, PRICE_COLUMNS
+from clients import get_stock
+from observability import SOURCE_REQUESTS, logger
+
+
+# Cấu hình (có thể thay đổi qua biến môi trường)
+# Thứ tự ưu tiên các nguồn; nguồn đầu tiên là nguồn chính (dùng làm khóa cache)
+DATA_SOURCES = tuple(
+    s.strip().upper() for s in os.getenv("DATA_SOURCES", "VCI,TCBS").split(",") if s.strip()
+)
+SOURCE_TIMEOUT = float(os.getenv("SOURCE_TIMEOUT", "10"))  # Deadline (giây) cho mỗi lần gọi
+SOURCE_DEADLINE = float(os.getenv("SOURCE_DEADLINE", "20"))  # Tổng thời gian (giây) thử lại trên một nguồn
+SOURCE_ATTEMPTS = int(os.getenv("SOURCE_ATTEMPTS", "3"))  # Số lần gọi tối đa trên một nguồn
+SOURCE_BACKOFF = float(os.getenv("SOURCE_BACKOFF", "0.2"))  # Hệ số backoff (giây), có jitter
+SOURCE_BACKOFF_MAX = 2.0
+SOURCE_POOL_SIZE = int(os.getenv("SOURCE_POOL_SIZE", "16"))  # Số lần gọi nguồn chạy đồng thời
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))  # Số lỗi liên tiếp để ngắt mạch
+CIRCUIT_RESET = float(os.getenv("CIRCUIT_RESET", "30"))  # Thời gian (giây) ngắt trước khi thử lại
+
+# Các chức năng mỗi nguồn vnstock hỗ trợ (MSN chỉ tra được theo mã nội bộ của MSN, không dùng cho cổ phiếu VN)
+CAPABILITIES = {
+    "VCI": {"history", "company"},
+    "TCBS": {"history", "company"},
+}
+
+
+class SourceError(Exception):
+    """Mọi nguồn dữ liệu đều lỗi; message gồm lỗi của từng nguồn"""
+
+
+class SourceTimeout(SourceError):
+    """Lần gọi nguồn vượt quá deadline"""
+
+
+# Lỗi tạm thời đáng thử lại (mạng, timeout); lỗi khác chuyển thẳng sang nguồn dự phòng
+TRANSIENT_ERRORS = (SourceTimeout, ConnectionError, TimeoutError, requests.RequestException)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker theo số lỗi liên tiếp
+
+    closed: gọi bình thường; open: bỏ qua nguồn trong reset_timeout giây;
+    half_open: cho một lần gọi thử, thành công thì đóng lại, lỗi thì mở tiếp
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURES,
+                 reset_timeout: float = CIRCUIT_RESET, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        """True nếu được phép gọi nguồn (khi half_open chỉ một lần gọi thử tại một thời điểm)"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Ngắt mạch nguồn %s sau %d lỗi", self.name, self.failures)
+                self.opened_at = self.clock()
+            self._probing = False
+
+
+def normalize_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Chuẩn hóa giá lịch sử từ mọi nguồn về PRICE_COLUMNS
+
+    time là ngày giao dịch (không múi giờ, theo giờ Việt Nam), giá theo nghìn đồng,
+    volume kiểu int64, sắp xếp tăng dần và bỏ ngày trùng
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+    df = df[PRICE_COLUMNS].copy()
+    times = pd.to_datetime(df["time"])
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert(MARKET_TZ).dt.tz_localize(None)
+    df["time"] = times.dt.normalize()
+    df[["open", "high", "low", "close"]] = df[["open", "high", "low", "close"]].astype("float64")
+    df["volume"] = pd.to_numeric(df["volume"], errors="coerce").fillna(0).astype("int64")
+    return df.drop_duplicates("time", keep="last").sort_values("time", ignore_index=True)
+
+
+def normalize_company(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Chuẩn hóa thông tin tổng quan về các cột của VCI (icb_name3, issue_share, ...)"""
+    if df is None or df.empty or source != "TCBS":
+        return df
+    df = df.copy()
+    if "industry" in df.columns and "icb_name3" not in df.columns:
+        df["icb_name3"] = df["industry"]
+    if "outstanding_share" in df.columns:
+        # TCBS tính số cổ phiếu theo đơn vị triệu
+        df["issue_share"] = pd.to_numeric(df["outstanding_share"], errors="coerce") * 1_000_000
+    return df
+
+
+class SourcePool:
+    """Gọi nguồn dữ liệu theo thứ tự ưu tiên, có deadline, retry, circuit breaker và failover"""
+
+    def __init__(self, sources=DATA_SOURCES, timeout: float = SOURCE_TIMEOUT, attempts: int = SOURCE_ATTEMPTS,
+                 backoff: float = SOURCE_BACKOFF, deadline: float = SOURCE_DEADLINE, sleep=time.sleep):
+        self.sources = tuple(sources)
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff = backoff
+        self.deadline = deadline
+        self.sleep = sleep
+        self.breakers = {name: CircuitBreaker(name) for name in self.sources}
+        # Thread riêng cho lời gọi nguồn: lời gọi bị treo không giữ thread của request
+        self._executor = ThreadPoolExecutor(max_workers=SOURCE_POOL_SIZE, thread_name_prefix="source-call")
+
+    def history(self, ticker: str, start_date: str, end_date: str, preferred: str = None) -> pd.DataFrame:
+        """Giá lịch sử OHLCV đã chuẩn hóa (xem normalize_history)"""
+        return self.call("history", preferred, lambda source: normalize_history(
+            get_stock(ticker, source).quote.history(start=start_date, end=end_date)
+        ))
+
+    def company(self, ticker: str, preferred: str = None) -> pd.DataFrame:
+        """Thông tin tổng quan công ty đã chuẩn hóa (xem normalize_company)"""
+        return self.call("company", preferred, lambda source: normalize_company(
+            get_stock(ticker, source).company.overview(), source
+        ))
+
+    def call(self, kind: str, preferred, func):
+        """
+        Gọi func(source) lần lượt trên các nguồn hỗ trợ `kind` tới khi thành công
+
+        Args:
+            kind: Loại dữ liệu ('history', 'company')
+            preferred: Nguồn ưu tiên (đưa lên đầu danh sách), None = theo DATA_SOURCES
+            func: Hàm func(source) gọi vnstock
+
+        Raises:
+            SourceError: Khi mọi nguồn đều lỗi hoặc đang bị ngắt mạch
+        """
+        order = self._order(preferred)
+        errors = []
+        for source in order:
+            if kind not in CAPABILITIES.get(source, {kind}):
+                continue
+            breaker = self.breakers.setdefault(source, CircuitBreaker(source))
+            if not breaker.allow():
+                SOURCE_REQUESTS.labels(source, kind, "circuit_open").inc()
+                errors.append(f"{source}: tạm ngắt do lỗi liên tiếp")
+                continue
+            try:
+                result = self._call_with_retry(source, kind, func)
+            except Exception as e:
+                breaker.record_failure()
+                errors.append(f"{source}: {str(e) or type(e).__name__}")
+                logger.warning("Nguồn %s lỗi khi lấy %s: %s", source, kind, e)
+                continue
+            breaker.record_success()
+            return result
+        raise SourceError("; ".join(errors) or f"Không có nguồn dữ liệu hỗ trợ {kind}")
+
+    def _order(self, preferred) -> list:
+        order = list(self.sources)
+        if preferred:
+            preferred = preferred.upper()
+            order = [preferred] + [s for s in order if s != preferred]
+        return order
+
+    def _call_with_retry(self, source: str, kind: str, func):
+        retrying = Retrying(
+            stop=stop_after_attempt(self.attempts) | stop_after_delay(self.deadline),
+            wait=wait_random_exponential(multiplier=self.backoff, max=SOURCE_BACKOFF_MAX),
+            retry=retry_if_exception_type(TRANSIENT_ERRORS),
+            sleep=self.sleep,
+            reraise=True,
+        )
+        for attempt in retrying:
+            with attempt:
+                return self._call_with_deadline(source, kind, func)
+
+    def _call_with_deadline(self, source: str, kind: str, func):
+        future = self._executor.submit(func, source)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            SOURCE_REQUESTS.labels(source, kind, "timeout").inc()
+            raise SourceTimeout(f"quá {self.timeout:g}s không phản hồi") from None
+        except Exception:
+            SOURCE_REQUESTS.labels(source, kind, "error").inc()
+            raise
+        SOURCE_REQUESTS.labels(source, kind, "ok").inc()
+        return result
+
+    def stats(self) -> dict:
+        """Trạng thái circuit breaker của từng nguồn"""
+        return {
+            name: {"state": breaker.state, "failures": breaker.failures}
+            for name, breaker in self.breakers.items()
+        }
+
+
+# Các nguồn dùng chung cho toàn bộ process
+source_pool = SourcePool()
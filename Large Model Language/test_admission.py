@@ -0,0 +1,90 @@
+"""
+Pytest test suite cho admission.py
+Giới hạn đồng thời, hàng đợi có thời hạn và phản hồi 429/503 kèm Retry-After
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_per_client_limit_and_queue():
+    """
+    Test Case 1: Client vượt giới hạn riêng -> 429; câu hỏi chờ được xử lý theo thứ tự khi có chỗ
+    """
+    async def run():
+        controller = AdmissionController(max_concurrent=1, per_client=2, queue_size=4, queue_timeout=1)
+        first = await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("a"))
+        await asyncio.sleep(0)
+        assert controller.stats()["waiting"] == 1
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("a")
+        assert rejected.value.status_code == 429 and rejected.value.retry_after >= 1
+
+        first.release()
+        first.release()  # trả chỗ hai lần không làm sai bộ đếm
+        second = await waiter
+        assert controller.stats()["active"] == 1 and controller.stats()["waiting"] == 0
+        second.release()
+        assert controller.stats() == {
+            "active": 0, "waiting": 0, "rejected": 1, "clients": 0, "max_concurrent": 1, "queue_size": 4,
+        }
+
+    asyncio.run(run())
+
+
+def test_queue_full_and_timeout_return_503():
+    """
+    Test Case 2: Hàng đợi đầy bị từ chối ngay, câu hỏi chờ quá hạn bị từ chối sau queue_timeout
+    """
+    async def run():
+        controller = AdmissionController(max_concurrent=1, per_client=0, queue_size=1, queue_timeout=0.05)
+        ticket = await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire("c")
+        assert (full.value.status_code, full.value.reason) == (503, "queue_full")
+
+        with pytest.raises(AdmissionRejected) as timeout:
+            await waiter
+        assert (timeout.value.status_code, timeout.value.reason) == (503, "queue_timeout")
+
+        ticket.release()
+        async with controller.admit("c"):
+            assert controller.stats()["active"] == 1
+        assert controller.stats()["active"] == 0 and controller.stats()["clients"] == 0
+
+    asyncio.run(run())
+
+
+def test_query_endpoint_rejects_with_retry_after(monkeypatch):
+    """
+    Test Case 3: /query trả 503 kèm Retry-After khi server hết chỗ xử lý
+    """
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    request = SimpleNamespace(headers={"X-Client-Id": "client-1"}, client=None)
+
+    async def run():
+        controller = AdmissionController(max_concurrent=1, per_client=0, queue_size=0, queue_timeout=1)
+        monkeypatch.setattr(main, "admission", controller)
+        ticket = await controller.acquire("busy")
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                await main.handle_query(main.QueryRequest(question="Giá FPT hôm nay bao nhiêu?"), request)
+        finally:
+            ticket.release()
+        return rejected.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    assert "quá tải" in error.detail
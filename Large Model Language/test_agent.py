@@ -0,0 +1,245 @@
+"""
+Pytest test suite offline cho agent.py
+Dùng model Gemini giả lập nên không cần GEMINI_API_KEY thật hay kết nối mạng
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+
+
+class FakeResponse:
+    """Response giả: có candidates như response thật và lặp được theo từng chunk khi stream"""
+
+    def __init__(self, parts, chunks=None):
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=parts))]
+        self._chunks = chunks or [self]
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+def _text_part(text):
+    return SimpleNamespace(text=text, function_call=None)
+
+
+def _text_response(text, chunks=None):
+    """Tạo response giả chỉ chứa text (có thể chia thành nhiều chunk khi stream)"""
+    if chunks is None:
+        return FakeResponse([_text_part(text)])
+    return FakeResponse([_text_part(text)], [FakeResponse([_text_part(chunk)]) for chunk in chunks])
+
+
+def _call_response(name, args):
+    """Tạo response giả chứa một function_call"""
+    return _calls_response([(name, args)])
+
+
+def _calls_response(calls):
+    """Tạo response giả chứa nhiều function_call trong cùng một lượt"""
+    parts = [SimpleNamespace(text="", function_call=SimpleNamespace(name=name, args=args)) for name, args in calls]
+    return FakeResponse(parts)
+
+
+class FakeChat:
+    """Chat session giả: trả lần lượt các response trong kịch bản"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.sent = []
+
+    def send_message(self, content):
+        self.sent.append(content)
+        return self.script.pop(0)
+
+    async def send_message_async(self, content, stream=False):
+        self.sent.append(content)
+        await asyncio.sleep(0)
+        return self.script.pop(0)
+
+
+class FakeModel:
+    """GenerativeModel giả, mỗi lần start_chat tạo một kịch bản mới"""
+
+    def __init__(self, script_factory):
+        self.script_factory = script_factory
+
+    def start_chat(self, **kwargs):
+        self.last_chat = FakeChat(self.script_factory())
+        return self.last_chat
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Thay genai.GenerativeModel bằng model giả theo kịch bản"""
+    def install(script_factory):
+        monkeypatch.setattr(agent, "GEMINI_API_KEY", "test-key")
+        monkeypatch.setattr(agent, "_model", None)
+        model = FakeModel(script_factory)
+        monkeypatch.setattr(agent.load_genai(), "GenerativeModel", lambda **kwargs: model)
+        return model
+    return install
+
+
+def test_async_agent_runs_sync_tool_in_thread_pool(fake_gemini, monkeypatch):
+    """
+    Test Case 1: Tool đồng bộ được chạy trong thread pool, không chạy trên event loop
+    """
+    calls = []
+
+    def fake_tool(ticker):
+        calls.append((ticker, threading.current_thread().name))
+        return '{"ticker": "FPT"}'
+
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", fake_tool)
+    fake_gemini(lambda: [
+        _call_response("get_company_info", {"ticker": "FPT"}),
+        _text_response("FPT là Công ty Cổ phần FPT"),
+    ])
+
+    answer = asyncio.run(agent.run_agent_query_async("Thông tin FPT?"))
+
+    assert answer == "FPT là Công ty Cổ phần FPT"
+    assert calls[0][0] == "FPT"
+    assert calls[0][1].startswith("agent-tool")
+
+
+def test_async_agent_serves_questions_concurrently(fake_gemini, monkeypatch):
+    """
+    Test Case 2: Tool chậm của một câu hỏi không chặn các câu hỏi khác
+    """
+    def slow_tool(ticker):
+        time.sleep(0.2)
+        return '{"ticker": "%s"}' % ticker
+
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", slow_tool)
+    fake_gemini(lambda: [
+        _call_response("get_company_info", {"ticker": "VCB"}),
+        _text_response("OK"),
+    ])
+
+    async def run_many():
+        return await asyncio.gather(*[agent.run_agent_query_async("Thông tin VCB?") for _ in range(4)])
+
+    started = time.perf_counter()
+    answers = asyncio.run(run_many())
+    elapsed = time.perf_counter() - started
+
+    assert answers == ["OK"] * 4
+    assert elapsed < 0.6, "4 câu hỏi phải chạy song song thay vì tuần tự (0.8s)"
+
+
+def test_async_agent_unknown_function(fake_gemini):
+    """
+    Test Case 3: Function không tồn tại trả về thông báo lỗi
+    """
+    fake_gemini(lambda: [_call_response("unknown_tool", {})])
+
+    answer = asyncio.run(agent.run_agent_query_async("?"))
+
+    assert answer.startswith("Lỗi:")
+
+
+def test_parallel_function_calls_in_one_turn(fake_gemini, monkeypatch):
+    """
+    Test Case 4: Nhiều function_call trong một lượt được chạy đồng thời và trả về trong một message
+    """
+    def slow_tool(ticker):
+        time.sleep(0.2)
+        return '{"ticker": "%s"}' % ticker
+
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", slow_tool)
+    model = fake_gemini(lambda: [
+        _calls_response([("get_company_info", {"ticker": t}) for t in ["VCB", "BID", "CTG"]]),
+        _text_response("So sánh 3 ngân hàng"),
+    ])
+
+    started = time.perf_counter()
+    answer = asyncio.run(agent.run_agent_query_async("So sánh VCB, BID, CTG"))
+    elapsed = time.perf_counter() - started
+
+    assert answer == "So sánh 3 ngân hàng"
+    assert elapsed < 0.5, "3 function call phải chạy song song thay vì tuần tự (0.6s)"
+
+    function_message = model.last_chat.sent[1]
+    assert [p.function_response.name for p in function_message.parts] == ["get_company_info"] * 3
+    assert [p.function_response.response["result"] for p in function_message.parts] == [
+        '{"ticker": "VCB"}', '{"ticker": "BID"}', '{"ticker": "CTG"}'
+    ]
+
+
+def test_function_call_timeout(fake_gemini, monkeypatch):
+    """
+    Test Case 5: Tool quá thời gian chờ trả về lỗi cho model thay vì treo request
+    """
+    async def hanging_tool(ticker):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(agent, "TOOL_CALL_TIMEOUT", 0.1)
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", hanging_tool)
+    model = fake_gemini(lambda: [
+        _call_response("get_company_info", {"ticker": "FPT"}),
+        _text_response("Nguồn dữ liệu đang chậm"),
+    ])
+
+    answer = asyncio.run(agent.run_agent_query_async("Thông tin FPT?"))
+
+    assert answer == "Nguồn dữ liệu đang chậm"
+    result = model.last_chat.sent[1].parts[0].function_response.response["result"]
+    assert "vượt quá thời gian chờ" in result
+
+
+def test_stream_agent_query_events(fake_gemini, monkeypatch):
+    """
+    Test Case 6: Luồng sự kiện gồm tool_call, tool_result, các token text rồi answer
+    """
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", lambda ticker: '{"ticker": "FPT"}')
+    fake_gemini(lambda: [
+        _call_response("get_company_info", {"ticker": "FPT"}),
+        _text_response("FPT là công ty công nghệ", chunks=["FPT là ", "công ty ", "công nghệ"]),
+    ])
+
+    async def collect():
+        return [event async for event in agent.stream_agent_query("Thông tin FPT?")]
+
+    events = asyncio.run(collect())
+
+    assert [e["event"] for e in events] == ["tool_call", "tool_result", "token", "token", "token", "answer"]
+    assert events[0] == {"event": "tool_call", "name": "get_company_info", "args": {"ticker": "FPT"}}
+    assert events[1]["result"] == '{"ticker": "FPT"}'
+    assert "".join(e["text"] for e in events if e["event"] == "token") == events[-1]["answer"]
+
+
+def test_sync_agent_single_deadline_and_tool_errors(fake_gemini, monkeypatch):
+    """
+    Test Case 7: run_agent_query chờ các tool trong lượt với một hạn chung; tool lỗi trả JSON lỗi cho model
+    """
+    def tool(ticker):
+        if ticker == "ERR":
+            raise ValueError("mã không hợp lệ")
+        time.sleep(0.3)
+        return '{"ticker": "%s"}' % ticker
+
+    monkeypatch.setattr(agent, "TOOL_CALL_TIMEOUT", 0.15)
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", tool)
+    model = fake_gemini(lambda: [
+        _calls_response([("get_company_info", {"ticker": t}) for t in ["VCB", "ERR", "BID"]]),
+        _text_response("Một phần dữ liệu không lấy được"),
+    ])
+
+    started = time.perf_counter()
+    answer = agent.run_agent_query("So sánh VCB, BID")
+    elapsed = time.perf_counter() - started
+
+    assert answer == "Một phần dữ liệu không lấy được"
+    assert elapsed < 0.28, "hạn chờ chung cho cả lượt, không phải TOOL_CALL_TIMEOUT cho từng tool"
+    results = [p.function_response.response["result"] for p in model.last_chat.sent[1].parts]
+    assert "vượt quá thời gian chờ" in results[0] and "vượt quá thời gian chờ" in results[2]
+    assert "mã không hợp lệ" in results[1]
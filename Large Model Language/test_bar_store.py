@@ -0,0 +1,91 @@
+"""
+Pytest test suite offline cho bar_store.py
+Nạp nến giả lập vào kho memmap, đọc lát không copy và đọc qua market_data
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import market_data
+from bar_store import BarStore, ingest
+from cache import MARKET_TZ, PriceCache
+
+
+def make_fetch():
+    """Hàm fetch giả sinh nến cho mọi ngày trong tuần (giá đóng cửa = 100 + số ngày từ 01/01/2024)"""
+    calls = []
+
+    def fetch(ticker, start_date, end_date):
+        calls.append((ticker, start_date, end_date))
+        days = pd.bdate_range(start_date, end_date)
+        close = [100.0 + (day - pd.Timestamp("2024-01-01")).days for day in days]
+        return pd.DataFrame({"time": days, "open": close, "high": close, "low": close, "close": close,
+                             "volume": [1000] * len(days)})
+
+    return fetch, calls
+
+
+def test_ingest_backfills_then_appends_only_new_sessions(tmp_path):
+    """
+    Test Case 1: Lần đầu backfill, lần sau chỉ tải phiên mới; lát đọc là view trên memmap
+    """
+    store = BarStore(str(tmp_path))
+    fetch, calls = make_fetch()
+
+    report = ingest(store, ["FPT", "VCB"], date(2024, 1, 1), date(2024, 3, 29), fetch, rate=0)
+    assert report["tickers"] == 2 and not report["errors"]
+    calls.clear()
+    ingest(store, ["FPT", "VCB"], date(2024, 1, 1), date(2024, 4, 5), fetch, rate=0)
+    assert calls == [("FPT", "2024-03-30", "2024-04-05"), ("VCB", "2024-03-30", "2024-04-05")]
+
+    df = store.read("FPT", date(2024, 3, 25), date(2024, 4, 5))
+    assert df["time"].dt.strftime("%Y-%m-%d").tolist()[0] == "2024-03-25" and len(df) == 10
+    assert df["close"].iloc[-1] == 100.0 + 95 and df["volume"].dtype == "int64"
+    assert store.read("FPT", date(2023, 12, 1), date(2024, 1, 5)) is None  # ngoài khoảng đã nạp
+
+    dates, values = store.slice("VCB", date(2024, 1, 1), date(2024, 4, 5))
+    assert not values["close"].flags.owndata and len(dates) == len(values["close"])
+    _, tickers, panel, _ = store.panel(date(2024, 4, 1), date(2024, 4, 5))
+    assert tickers == ("FPT", "VCB") and panel["close"].shape == (5, 2)
+
+
+def test_prepend_and_new_tickers_rewrite_without_losing_data(tmp_path):
+    """
+    Test Case 2: Backfill về trước và vượt số cột dành sẵn thì ghi lại thế hệ mới, dữ liệu cũ giữ nguyên
+    """
+    store = BarStore(str(tmp_path), capacity=2)
+    fetch, _ = make_fetch()
+    ingest(store, ["FPT"], date(2024, 2, 1), date(2024, 2, 29), fetch, rate=0)
+    ingest(store, ["FPT", "HPG", "VNM"], date(2024, 1, 15), date(2024, 2, 29), fetch, rate=0)
+
+    stats = store.stats()
+    assert stats["tickers"] == 3 and stats["capacity"] == 4
+    assert stats["first_session"] == "2024-01-15" and stats["last_session"] == "2024-02-29"
+    assert sorted(p.name for p in tmp_path.glob("close.*.bin")) == ["close.2.bin"]
+
+    # Tiến trình khác mở lại kho từ đĩa
+    reopened = BarStore(str(tmp_path))
+    fpt = reopened.read("FPT", date(2024, 1, 15), date(2024, 2, 29))
+    assert len(fpt) == 34 and fpt["close"].iloc[0] == 114.0 and fpt["close"].iloc[-1] == 159.0
+    assert reopened.covers("VNM", date(2024, 1, 15), date(2024, 2, 29))
+
+
+def test_price_frame_reads_from_store_without_fetching(tmp_path, monkeypatch):
+    """
+    Test Case 3: market_data đọc phiên đã đóng cửa từ kho nến, không gọi nguồn dữ liệu
+    """
+    store = BarStore(str(tmp_path))
+    fetch, _ = make_fetch()
+    ingest(store, ["FPT"], date(2024, 1, 1), date(2024, 5, 31), fetch, rate=0)
+
+    def offline(*args, **kwargs):
+        raise AssertionError("không được gọi nguồn dữ liệu")
+
+    monkeypatch.setattr(market_data, "bar_store", store)
+    monkeypatch.setattr(market_data, "price_cache", PriceCache(clock=lambda: datetime(2024, 6, 3, 10, 0, tzinfo=MARKET_TZ)))
+    monkeypatch.setattr(market_data, "_fetch_history", offline)
+
+    history = market_data.load_price_history("FPT", "2024-05-01", "2024-05-31")
+    assert len(history) == 23 and np.all(np.diff(history.close) > 0)
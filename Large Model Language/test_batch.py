@@ -0,0 +1,61 @@
+"""
+Pytest test suite cho endpoint /query/batch
+Chạy offline (Gemini và nguồn dữ liệu giả lập qua benchmark.offline_environment)
+"""
+
+import asyncio
+import json
+
+import main
+from benchmark import StageTimer, asgi_request, offline_environment
+
+
+QUESTIONS = ["Giá cổ phiếu FPT?", "Giá cổ phiếu FPT", "", "Phân tích giá VCB", "Thông tin công ty HPG?"]
+
+
+def _fake_agent(original):
+    async def run(question, session=None):
+        if "VCB" in question:
+            return "Lỗi: Gemini vượt quota"
+        return await original(question, session=session)
+    return run
+
+
+def test_batch_results_in_order_with_item_errors(monkeypatch):
+    """
+    Test Case 1: Kết quả theo thứ tự câu hỏi, lỗi riêng từng câu, câu hỏi cùng ý định chỉ xử lý một lần
+    """
+    monkeypatch.setattr(main, "run_agent_query_async", _fake_agent(main.run_agent_query_async))
+    timer = StageTimer()
+
+    with offline_environment(timer):
+        status, body = asyncio.run(asgi_request(main.app, "POST", "/query/batch", {"questions": QUESTIONS}))
+
+    assert status == 200
+    data = json.loads(body)
+    results = data["results"]
+    assert [item["index"] for item in results] == [0, 1, 2, 3, 4]
+    assert results[0]["answer"] == results[1]["answer"] and "FPT" in results[0]["answer"]
+    assert results[2]["status"] == 400
+    assert results[3]["status"] == 500 and "quota" in results[3]["error"]
+    assert "HPG" in results[4]["answer"]
+    assert data["errors"] == 2
+    # Giá FPT chỉ lấy và serialize một lần cho hai câu hỏi cùng ý định
+    assert timer.counts["serialization"] == 1
+
+
+def test_batch_ndjson_stream(monkeypatch):
+    """
+    Test Case 2: stream=true trả NDJSON, mỗi dòng một kết quả khi xong
+    """
+    monkeypatch.setattr(main, "run_agent_query_async", _fake_agent(main.run_agent_query_async))
+
+    with offline_environment(StageTimer()):
+        status, body = asyncio.run(asgi_request(
+            main.app, "POST", "/query/batch", {"questions": QUESTIONS, "stream": True}
+        ))
+
+    assert status == 200
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    assert sorted(item["index"] for item in lines) == [0, 1, 2, 3, 4]
+    assert {item["index"]: item["status"] for item in lines}[3] == 500
@@ -0,0 +1,81 @@
+"""
+Pytest test suite cho benchmark.py
+Chạy một lượt benchmark nhỏ hoàn toàn offline (Gemini và VCI giả lập)
+"""
+
+import asyncio
+
+import agent
+import sources
+from benchmark import fixture_history, main_cli, run_benchmark, scripted_calls
+
+
+def test_fixture_history_is_deterministic():
+    """
+    Test Case 1: Cùng mã và ngày luôn cho cùng giá, kể cả khi khoảng ngày khác nhau
+    """
+    full = fixture_history("FPT", "2025-01-01", "2025-01-31")
+    tail = fixture_history("FPT", "2025-01-15", "2025-01-31")
+
+    assert list(full["close"].iloc[-len(tail):]) == list(tail["close"])
+    assert list(fixture_history("VCB", "2025-01-01", "2025-01-31")["close"]) != list(full["close"])
+
+
+def test_scripted_calls_follow_intent():
+    """
+    Test Case 2: Kịch bản function calling dựa trên intent của câu hỏi
+    """
+    assert [name for name, _ in scripted_calls("Thông tin về công ty FPT?")] == ["get_company_info"]
+
+    calls = scripted_calls("So sánh giá VCB, BID 3 tháng qua")
+    assert [(name, args["ticker"]) for name, args in calls] == [
+        ("get_historical_price", "VCB"), ("get_historical_price", "BID"),
+    ]
+
+    name, args = scripted_calls("RSI và MACD cho HPG")[0]
+    assert name == "calculate_technical_indicators"
+    assert args["indicators"] == ["RSI", "MACD"]
+
+
+def test_run_benchmark_reports_latency_and_stages():
+    """
+    Test Case 3: Benchmark chạy qua main.app không lỗi, báo cáo đủ các trường và khôi phục patch
+    """
+    original_get_stock = sources.get_stock
+    original_functions = agent.AVAILABLE_FUNCTIONS
+
+    report = asyncio.run(run_benchmark(total_requests=16, concurrency=4, fast_path=False))
+
+    assert report["errors"] == 0, report["error_samples"]
+    assert report["requests"] == 16
+    assert set(report["latency_ms"]) == {"p50", "p95", "p99", "max"}
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p95"] <= report["latency_ms"]["p99"]
+    assert {"llm", "tool", "source", "serialization"} <= set(report["stages_ms_per_request"])
+    # Mỗi request có ít nhất 2 lượt LLM (gọi tool rồi trả lời)
+    assert report["stage_calls"]["llm"] >= 32
+
+    assert sources.get_stock is original_get_stock
+    assert agent.AVAILABLE_FUNCTIONS is original_functions
+
+
+def test_fast_path_skips_llm_for_simple_questions():
+    """
+    Test Case 4: Với fast path, câu hỏi đơn giản không tốn lượt gọi LLM
+    """
+    questions = ["Thông tin VNM?", "Giá FPT 1 tháng gần nhất", "RSI 14 HPG"]
+
+    report = asyncio.run(run_benchmark(questions=questions, total_requests=6, concurrency=3))
+
+    assert report["errors"] == 0, report["error_samples"]
+    assert "llm" not in report["stage_calls"]
+    assert report["stage_calls"]["tool"] == 6
+
+
+def test_cli_fails_when_p95_exceeds_threshold(capsys):
+    """
+    Test Case 5: Exit code 1 khi p95 vượt ngưỡng, dùng làm cổng kiểm tra hồi quy
+    """
+    assert main_cli(["--requests", "4", "--concurrency", "2", "--json"]) == 0
+    assert main_cli(["--requests", "4", "--concurrency", "2", "--no-fast-path",
+                     "--llm-latency-ms", "20", "--max-p95-ms", "1"]) == 1
+    assert "vượt ngưỡng" in capsys.readouterr().err
@@ -0,0 +1,227 @@
+"""
+Pytest test suite offline cho cache.py
+Dùng hàm fetch giả lập sinh nến ngày nên không cần kết nối mạng
+"""
+
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from answer_cache import AnswerCache
+from cache import MARKET_TZ, PriceCache, last_closed_session
+
+
+def make_fetch():
+    """Tạo hàm fetch giả sinh nến cho mọi ngày trong tuần và ghi lại các lần gọi"""
+    calls = []
+
+    def fetch(ticker, start_date, end_date):
+        calls.append((ticker, start_date, end_date))
+        days = pd.bdate_range(start_date, end_date)
+        close = [100.0 + i for i in range(len(days))]
+        return pd.DataFrame({
+            "time": days,
+            "open": close,
+            "high": close,
+            "low": close,
+            "close": close,
+            "volume": [1000] * len(days),
+        })
+
+    return fetch, calls
+
+
+@pytest.fixture
+def clock():
+    """Đồng hồ có thể điều chỉnh: mặc định thứ 4 08/01/2025 lúc 10:00 (phiên đang mở)"""
+    state = {"now": datetime(2025, 1, 8, 10, 0, tzinfo=MARKET_TZ)}
+    return state
+
+
+def test_last_closed_session():
+    """
+    Test Case 1: Xác định phiên đã đóng cửa gần nhất
+    """
+    # Thứ 4 trong giờ giao dịch -> phiên thứ 3
+    assert last_closed_session(datetime(2025, 1, 8, 10, 0, tzinfo=MARKET_TZ)) == date(2025, 1, 7)
+    # Thứ 4 sau 15:00 -> chính thứ 4
+    assert last_closed_session(datetime(2025, 1, 8, 15, 30, tzinfo=MARKET_TZ)) == date(2025, 1, 8)
+    # Chủ nhật -> thứ 6 trước đó
+    assert last_closed_session(datetime(2025, 1, 12, 12, 0, tzinfo=MARKET_TZ)) == date(2025, 1, 10)
+
+
+def test_closed_range_is_fetched_once(clock):
+    """
+    Test Case 2: Khoảng ngày đã đóng cửa chỉ tải một lần, các lần sau đọc local
+    """
+    fetch, calls = make_fetch()
+    cache = PriceCache(clock=lambda: clock["now"])
+
+    first = cache.get_history("FPT", "2024-12-02", "2024-12-31", "VCI", fetch)
+    second = cache.get_history("FPT", "2024-12-02", "2024-12-31", "VCI", fetch)
+    sub_range = cache.get_history("FPT", "2024-12-09", "2024-12-20", "VCI", fetch)
+
+    assert len(calls) == 1
+    assert len(first) == len(second) == 22
+    assert len(sub_range) == 10
+    assert sub_range["time"].iloc[0] == pd.Timestamp("2024-12-09")
+
+
+def test_only_missing_tail_is_fetched(clock):
+    """
+    Test Case 3: Mở rộng khoảng ngày chỉ tải phần còn thiếu ở cuối
+    """
+    fetch, calls = make_fetch()
+    cache = PriceCache(clock=lambda: clock["now"])
+
+    cache.get_history("HPG", "2024-12-02", "2024-12-20", "VCI", fetch)
+    df = cache.get_history("HPG", "2024-12-02", "2025-01-07", "VCI", fetch)
+
+    assert calls[-1] == ("HPG", "2024-12-21", "2025-01-07")
+    assert df["time"].is_monotonic_increasing
+    assert df["time"].iloc[-1] == pd.Timestamp("2025-01-07")
+
+
+def test_weekend_gap_is_not_fetched(clock):
+    """
+    Test Case 4: Đoạn thiếu chỉ gồm cuối tuần không gọi nguồn dữ liệu
+    """
+    fetch, calls = make_fetch()
+    cache = PriceCache(clock=lambda: clock["now"])
+
+    cache.get_history("VCB", "2024-12-02", "2024-12-06", "VCI", fetch)
+    cache.get_history("VCB", "2024-12-02", "2024-12-08", "VCI", fetch)
+
+    assert len(calls) == 1
+
+
+def test_open_session_uses_short_ttl(clock, monkeypatch):
+    """
+    Test Case 5: Phiên đang mở được tải lại sau khi TTL hết hạn
+    """
+    fetch, calls = make_fetch()
+    cache = PriceCache(open_ttl=30, clock=lambda: clock["now"])
+    monotonic = {"value": 1000.0}
+    monkeypatch.setattr("cache.time.monotonic", lambda: monotonic["value"])
+
+    df = cache.get_history("FPT", "2025-01-06", "2025-01-08", "VCI", fetch)
+    assert df["time"].iloc[-1] == pd.Timestamp("2025-01-08")
+    fetches_after_first = len(calls)
+
+    cache.get_history("FPT", "2025-01-06", "2025-01-08", "VCI", fetch)
+    assert len(calls) == fetches_after_first
+
+    monotonic["value"] += 31
+    cache.get_history("FPT", "2025-01-06", "2025-01-08", "VCI", fetch)
+    # Chỉ phiên hôm nay được tải lại, các phiên đã đóng cửa vẫn đọc local
+    assert calls[-1] == ("FPT", "2025-01-08", "2025-01-08")
+    assert len(calls) == fetches_after_first + 1
+
+
+def test_disk_store_survives_restart(clock, tmp_path):
+    """
+    Test Case 6: Kho nến SQLite trên đĩa được dùng lại sau khi khởi động lại process
+    """
+    fetch, calls = make_fetch()
+    db_path = str(tmp_path / "prices.sqlite")
+
+    PriceCache(db_path=db_path, clock=lambda: clock["now"]).get_history("FPT", "2024-12-02", "2024-12-31", "VCI", fetch)
+    df = PriceCache(db_path=db_path, clock=lambda: clock["now"]).get_history("FPT", "2024-12-02", "2024-12-31", "VCI", fetch)
+
+    assert len(calls) == 1
+    assert len(df) == 22
+
+
+def test_answer_cache_hit_and_counters(clock):
+    """
+    Test Case 7: Cache câu trả lời theo intent và đếm hit/miss
+    """
+    cache = AnswerCache(clock=lambda: clock["now"])
+
+    intent = cache.parse("Thông tin FPT?")
+    assert cache.get(intent) is None
+    cache.put(intent, "FPT là Công ty Cổ phần FPT")
+
+    assert cache.get(cache.parse("thong tin FPT")) == "FPT là Công ty Cổ phần FPT"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_answer_cache_expires_with_market_data(clock):
+    """
+    Test Case 8: Câu trả lời gồm phiên đang mở hết hạn theo TTL ngắn,
+    khoảng ngày đã đóng cửa được giữ lâu
+    """
+    cache = AnswerCache(open_ttl=60, clock=lambda: clock["now"])
+
+    live = cache.parse("Giá VCB 1 tháng gần nhất")
+    closed = cache.parse("Giá VCB tháng 12 năm 2024")
+    cache.put(live, "live")
+    cache.put(closed, "closed")
+
+    clock["now"] += timedelta(seconds=61)
+    assert cache.get(live) is None
+    assert cache.get(closed) == "closed"
+
+
+def test_answer_cache_after_close_waits_for_next_session(clock):
+    """
+    Test Case 9: Ngoài giờ giao dịch câu trả lời được giữ tới phiên mở cửa kế tiếp
+    """
+    # Thứ 6 10/01/2025 lúc 8:00, trước giờ mở cửa
+    clock["now"] = datetime(2025, 1, 10, 8, 0, tzinfo=MARKET_TZ)
+    cache = AnswerCache(open_ttl=60, clock=lambda: clock["now"])
+
+    intent = cache.parse("Giá VCB hôm nay")
+    cache.put(intent, "answer")
+
+    clock["now"] = datetime(2025, 1, 10, 8, 59, tzinfo=MARKET_TZ)
+    assert cache.get(intent) == "answer"
+    clock["now"] = datetime(2025, 1, 10, 9, 0, tzinfo=MARKET_TZ)
+    assert cache.get(intent) is None
+
+
+def test_partial_or_empty_fetch_is_refetched(clock):
+    """
+    Test Case 10: Nguồn trả thiếu (cắt bớt hoặc lỗi tạm thời trả rỗng) thì phần thiếu được tải lại ở lần sau
+    """
+    fetch, calls = make_fetch()
+    responses = iter([
+        lambda t, s, e: fetch(t, s, "2024-12-13"),  # Bị cắt bớt ở cuối
+        lambda t, s, e: pd.DataFrame(),  # Nguồn lỗi tạm thời
+        fetch,
+    ])
+    cache = PriceCache(clock=lambda: clock["now"])
+
+    def flaky(ticker, start_date, end_date):
+        return next(responses)(ticker, start_date, end_date)
+
+    assert len(cache.get_history("MWG", "2024-12-02", "2024-12-20", "VCI", flaky)) == 10
+    cache._memory.clear()
+    assert len(cache.get_history("MWG", "2024-12-02", "2024-12-20", "VCI", flaky)) == 10
+    cache._memory.clear()
+    df = cache.get_history("MWG", "2024-12-02", "2024-12-20", "VCI", flaky)
+
+    assert len(df) == 15 and df["time"].is_unique
+    assert calls[1:] == [("MWG", "2024-12-14", "2024-12-20")]
+
+
+def test_llm_answers_keyed_by_question(clock):
+    """
+    Test Case 11: Câu trả lời của LLM chỉ dùng lại cho cùng câu hỏi; câu trả lời fast path dùng chung theo ý định
+    """
+    cache = AnswerCache(clock=lambda: clock["now"])
+
+    capital = cache.parse("Vốn điều lệ của FPT là bao nhiêu?")
+    sector = cache.parse("FPT thuộc ngành gì?")
+    assert capital.key == sector.key
+    cache.put(capital, "Vốn điều lệ FPT là ...")
+    assert cache.get(sector) is None
+    assert cache.get(cache.parse("von dieu le cua FPT la bao nhieu")) == "Vốn điều lệ FPT là ..."
+
+    highest = cache.parse("Giá FPT cao nhất 3 tháng gần nhất?")
+    cache.put(highest, "Cao nhất 120", fast_path=True)
+    assert cache.get(cache.parse("Giá FPT 3 tháng gần nhất")) == "Cao nhất 120"
+    # Câu hỏi cùng ý định nhưng fast path không trả lời (cần phân tích) không dùng câu trả lời theo route
+    assert cache.get(cache.parse("Phân tích xu hướng giá FPT 3 tháng gần nhất và dự báo")) is None
@@ -0,0 +1,111 @@
+"""
+Pytest test suite cho indicator_state.py
+So sánh trạng thái cập nhật tăng dần với IndicatorEngine tính lại từ đầu
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache import MARKET_TZ
+from indicator_state import IndicatorStateStore
+from indicators import IndicatorEngine, latest_value
+
+
+SPECS = ["SMA20", "EMA12", "RSI14", "ATR14", "MACD", "BB(20,2)", "OBV", "VWAP", "ROC12", "STOCH(14,3)"]
+
+
+def random_bars(start_date, end_date, seed=7):
+    """Nến ngày ngẫu nhiên cố định seed theo khoảng ngày"""
+    days = pd.bdate_range(start_date, end_date)
+    rng = np.random.default_rng(seed)
+    close = 50 + np.cumsum(rng.normal(0, 1, len(days)))
+    return pd.DataFrame({
+        "time": days,
+        "open": close,
+        "high": close + rng.uniform(0, 2, len(days)),
+        "low": close - rng.uniform(0, 2, len(days)),
+        "close": close,
+        "volume": rng.integers(1_000, 10_000, len(days)).astype(np.int64),
+    })
+
+
+class Source:
+    """Nguồn giả: cắt một chuỗi nến cố định theo khoảng ngày, ghi lại các lần tải"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.calls = []
+
+    def __call__(self, ticker, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        mask = (self.frame["time"] >= start_date) & (self.frame["time"] <= end_date)
+        return self.frame[mask].reset_index(drop=True)
+
+
+def engine_values(frame):
+    engine = IndicatorEngine(frame["close"], frame["high"], frame["low"], frame["volume"])
+    results, _ = engine.compute(SPECS)
+    return {label: latest_value(result) for label, result in results.items()}
+
+
+def test_incremental_matches_full_recompute():
+    """
+    Test Case 1: Cập nhật dần theo từng đoạn nến cho cùng kết quả với tính lại toàn bộ
+    """
+    bars = random_bars("2024-01-01", "2024-12-31")
+    source = Source(bars)
+    store = IndicatorStateStore()
+
+    for end_date in ["2024-03-29", "2024-06-28", "2024-07-01", "2024-12-31"]:
+        snapshot = store.snapshot("FPT", SPECS, "2024-01-01", end_date, "VCI", source)
+        expected = engine_values(bars[bars["time"] <= end_date])
+        for label, value in expected.items():
+            assert snapshot["indicators"][label] == pytest.approx(value, abs=0.011), label
+        assert snapshot["as_of"] == end_date
+
+    # Sau lần đầu, mỗi lần chỉ tải phần nến mới
+    assert source.calls == [
+        ("2024-01-01", "2024-03-29"), ("2024-03-30", "2024-06-28"),
+        ("2024-06-29", "2024-07-01"), ("2024-07-02", "2024-12-31"),
+    ]
+
+
+def test_repeated_poll_needs_no_fetch():
+    """
+    Test Case 2: Hỏi lại cùng khoảng ngày không cần tải thêm; hỏi về quá khứ không ghi đè trạng thái
+    """
+    source = Source(random_bars("2024-01-01", "2024-12-31"))
+    store = IndicatorStateStore()
+
+    first = store.snapshot("FPT", ["RSI14"], "2024-01-01", "2024-12-31", "VCI", source)
+    again = store.snapshot("FPT", ["RSI14"], "2024-01-01", "2024-12-31", "VCI", source)
+    assert first == again
+    assert len(source.calls) == 1
+
+    past = store.snapshot("FPT", ["RSI14"], "2024-01-01", "2024-06-28", "VCI", source)
+    assert past["as_of"] == "2024-06-28"
+    assert store.snapshot("FPT", ["RSI14"], "2024-01-01", "2024-12-31", "VCI", source) == first
+
+
+def test_open_session_bar_is_not_persisted():
+    """
+    Test Case 3: Nến của phiên đang mở chỉ áp dụng tạm, lần sau được thay bằng nến mới nhất
+    """
+    bars = random_bars("2024-12-02", "2025-01-08")
+    source = Source(bars)
+    clock = {"now": datetime(2025, 1, 8, 10, 0, tzinfo=MARKET_TZ)}
+    store = IndicatorStateStore(clock=lambda: clock["now"])
+
+    during = store.snapshot("FPT", ["SMA5"], "2024-12-02", "2025-01-08", "VCI", source)
+    assert during["as_of"] == "2025-01-08"
+
+    # Nến hôm nay thay đổi trong phiên
+    bars.loc[bars.index[-1], "close"] += 10
+    later = store.snapshot("FPT", ["SMA5"], "2024-12-02", "2025-01-08", "VCI", source)
+    assert later["indicators"]["SMA_5"] == pytest.approx(during["indicators"]["SMA_5"] + 2, abs=0.011)
+    assert later["indicators"]["SMA_5"] == pytest.approx(bars["close"].iloc[-5:].mean(), abs=0.011)
+    # Lần sau chỉ tải lại từ phiên đang mở
+    assert source.calls[-1] == ("2025-01-08", "2025-01-08")
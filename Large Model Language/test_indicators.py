@@ -0,0 +1,117 @@
+"""
+Pytest test suite offline cho indicators.py
+So sánh engine vector hóa với cách tính tuần tự theo định nghĩa
+"""
+
+import numpy as np
+import pytest
+
+from indicators import IndicatorEngine, IndicatorError, latest_value, parse_indicator
+
+
+@pytest.fixture
+def prices():
+    """Chuỗi giá ngẫu nhiên cố định seed"""
+    rng = np.random.default_rng(42)
+    close = 100 + np.cumsum(rng.normal(0, 1, 120))
+    high = close + rng.uniform(0, 2, 120)
+    low = close - rng.uniform(0, 2, 120)
+    volume = rng.integers(1_000, 10_000, 120).astype(float)
+    return close, high, low, volume
+
+
+def wilder_rsi_reference(close, window):
+    """RSI Wilder tính tuần tự theo định nghĩa gốc"""
+    deltas = np.diff(close)
+    avg_gain = np.mean(np.clip(deltas[:window], 0, None))
+    avg_loss = np.mean(np.clip(-deltas[:window], 0, None))
+    for delta in deltas[window:]:
+        avg_gain = (avg_gain * (window - 1) + max(delta, 0)) / window
+        avg_loss = (avg_loss * (window - 1) + max(-delta, 0)) / window
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+def test_parse_indicator_formats():
+    """
+    Test Case 1: Phân tích các cách viết chỉ báo thường gặp
+    """
+    assert parse_indicator("RSI") == ("RSI", (14,))
+    assert parse_indicator("rsi14") == ("RSI", (14,))
+    assert parse_indicator("SMA 50") == ("SMA", (50,))
+    assert parse_indicator("SMA", window_size=20.0) == ("SMA", (20,))
+    assert parse_indicator("MACD(12,26,9)") == ("MACD", (12, 26, 9))
+    assert parse_indicator("bollinger") == ("BB", (20, 2))
+    assert parse_indicator("BB_20_2.5") == ("BB", (20, 2.5))
+
+    with pytest.raises(IndicatorError):
+        parse_indicator("FOO")
+
+
+def test_wilder_rsi_matches_reference(prices):
+    """
+    Test Case 2: RSI dùng làm trơn Wilder, khớp với cách tính tuần tự
+    """
+    close = prices[0]
+    rsi = IndicatorEngine(close).compute_one("RSI", (14,))
+
+    assert np.isnan(rsi[13])
+    assert not np.isnan(rsi[14])
+    assert rsi[-1] == pytest.approx(wilder_rsi_reference(close, 14))
+
+
+def test_sma_ema_and_bollinger(prices):
+    """
+    Test Case 3: SMA, EMA và Bollinger Bands khớp định nghĩa
+    """
+    close = prices[0]
+    engine = IndicatorEngine(close)
+
+    assert engine.compute_one("SMA", (20,))[-1] == pytest.approx(close[-20:].mean())
+
+    ema = close[:10].mean()
+    for value in close[10:]:
+        ema = value * 2 / 11 + ema * (1 - 2 / 11)
+    assert engine.compute_one("EMA", (10,))[-1] == pytest.approx(ema)
+
+    bands = engine.compute_one("BB", (20, 2))
+    assert bands["upper"][-1] == pytest.approx(close[-20:].mean() + 2 * close[-20:].std())
+
+
+def test_volume_indicators(prices):
+    """
+    Test Case 4: OBV và VWAP tính trên cùng mảng khối lượng
+    """
+    close, high, low, volume = prices
+    engine = IndicatorEngine(close, high, low, volume)
+
+    obv = volume[1:][np.diff(close) > 0].sum() - volume[1:][np.diff(close) < 0].sum()
+    assert engine.compute_one("OBV", ())[-1] == pytest.approx(obv)
+
+    typical = (high + low + close) / 3
+    assert engine.compute_one("VWAP", ())[-1] == pytest.approx((typical * volume).sum() / volume.sum())
+
+
+def test_many_indicators_in_one_pass(prices):
+    """
+    Test Case 5: Nhiều chỉ báo trong một lượt, dùng chung kết quả trung gian
+    """
+    close, high, low, volume = prices
+    engine = IndicatorEngine(close, high, low, volume)
+
+    results, errors = engine.compute(["RSI14", "MACD", "SMA20", "BB20", "EMA12", "ATR", "STOCH", "XYZ"])
+
+    assert set(results) == {"RSI_14", "MACD_12_26_9", "SMA_20", "BB_20_2", "EMA_12", "ATR_14", "STOCH_14_3"}
+    assert "XYZ" in errors
+    # SMA20 được dùng chung giữa SMA và Bollinger Bands, EMA12 giữa EMA và MACD
+    assert results["SMA_20"] is results["BB_20_2"]["middle"]
+    assert results["MACD_12_26_9"]["macd"][-1] == pytest.approx(results["EMA_12"][-1] - engine.ema(26)[-1])
+
+
+def test_latest_value_insufficient_data():
+    """
+    Test Case 6: Chưa đủ dữ liệu trả về None
+    """
+    engine = IndicatorEngine(np.arange(10, dtype=float))
+
+    assert latest_value(engine.compute_one("SMA", (50,))) is None
+    assert latest_value(engine.compute_one("SMA", (5,))) == 7.0
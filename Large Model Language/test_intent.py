@@ -0,0 +1,64 @@
+"""
+Pytest test suite offline cho intent.py
+Kiểm tra chuẩn hóa tiếng Việt, nhận diện mã/chỉ báo và quy đổi thời gian tương đối
+"""
+
+from datetime import date
+
+import pytest
+
+from intent import extract_indicators, extract_tickers, normalize_text, parse_intent, resolve_date_range
+
+
+TODAY = date(2025, 1, 8)
+
+
+def test_normalize_vietnamese_text():
+    """
+    Test Case 1: Bỏ dấu, chữ thường, gộp khoảng trắng
+    """
+    assert normalize_text("Thông tin   về công ty ĐHG?") == "thong tin ve cong ty dhg"
+
+
+def test_extract_tickers_and_indicators():
+    """
+    Test Case 2: Nhận diện mã chứng khoán và chỉ báo, bỏ qua tên chỉ báo và từ thường
+    """
+    assert extract_tickers("So sánh VCB, BID, CTG và TCB") == ("VCB", "BID", "CTG", "TCB")
+    assert extract_tickers("RSI và MACD và SMA50 cho HPG") == ("HPG",)
+    assert extract_tickers("GIÁ VCB") == ("VCB",)
+    assert extract_indicators("RSI 14 ngày, MACD(12, 26, 9) và SMA50") == ("RSI14", "MACD(12,26,9)", "SMA50")
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Giá VCB 3 tháng gần nhất", (date(2024, 10, 8), TODAY)),
+    ("Gia VCB 1 thang qua?", (date(2024, 12, 8), TODAY)),
+    ("Giá FPT 2 tuần qua", (date(2024, 12, 25), TODAY)),
+    ("Giá FPT năm 2024", (date(2024, 1, 1), date(2024, 12, 31))),
+    ("Gia co phieu HPG tu dau thang 10 den cuoi thang 10 nam 2024?", (date(2024, 10, 1), date(2024, 10, 31))),
+    ("Giá HPG quý 3 năm 2024", (date(2024, 7, 1), date(2024, 9, 30))),
+    ("Giá VCB tháng trước", (date(2024, 12, 1), date(2024, 12, 31))),
+    ("Giá VCB tuần trước", (date(2024, 12, 30), date(2025, 1, 5))),
+    ("Giá VCB từ đầu năm", (date(2025, 1, 1), TODAY)),
+    ("Giá VCB từ 01/12/2024 đến 31/12/2024", (date(2024, 12, 1), date(2024, 12, 31))),
+    ("Tính RSI 14 ngày của HPG", None),
+])
+def test_resolve_relative_dates(question, expected):
+    """
+    Test Case 3: Quy đổi cụm thời gian tiếng Việt thành khoảng ngày cụ thể
+    """
+    assert resolve_date_range(question, TODAY) == expected
+
+
+def test_same_intent_same_key():
+    """
+    Test Case 4: Các cách viết khác nhau của cùng một ý định có cùng khóa
+    """
+    a = parse_intent("Thông tin FPT?", TODAY)
+    b = parse_intent("thong tin  FPT", TODAY)
+    c = parse_intent("Tính RSI 14 ngày của HPG?", TODAY)
+    d = parse_intent("RSI14 HPG 3 tháng gần nhất", TODAY)
+
+    assert a.kind == "company" and a.key == b.key
+    assert c.kind == "indicator" and c.key == d.key
+    assert c.start_date == "2024-10-08" and c.end_date == "2025-01-08"
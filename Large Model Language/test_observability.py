@@ -0,0 +1,78 @@
+"""
+Pytest test suite cho observability.py
+Kiểm tra định dạng Prometheus, span và metrics ghi nhận trong vòng lặp agent
+"""
+
+import asyncio
+
+import pytest
+
+import agent
+import observability
+from observability import Counter, Histogram, Registry, span
+from test_agent import _call_response, _text_response, fake_gemini  # noqa: F401
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    observability.registry.clear()
+    yield
+    observability.registry.clear()
+
+
+def test_render_prometheus_text_format():
+    """
+    Test Case 1: Counter và Histogram xuất đúng định dạng text của Prometheus
+    """
+    registry = Registry()
+    requests = registry.register(Counter("demo_requests", "Số request", ("result",)))
+    latency = registry.register(Histogram("demo_seconds", "Độ trễ", buckets=(0.1, 1)))
+
+    requests.labels("hit").inc()
+    requests.labels(result="hit").inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE demo_requests counter" in text
+    assert 'demo_requests_total{result="hit"} 3' in text
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{le="1"} 2' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 3' in text
+    assert "demo_seconds_count 3" in text
+
+    with pytest.raises(ValueError):
+        registry.register(Counter("demo_requests", "Trùng tên"))
+
+
+def test_span_records_duration_and_errors():
+    """
+    Test Case 2: Span ghi thời gian kể cả khi khối lệnh ném lỗi
+    """
+    with span("tool", "demo") as attributes:
+        pass
+    assert attributes["duration"] >= 0
+
+    with pytest.raises(RuntimeError):
+        with span("tool", "demo"):
+            raise RuntimeError("boom")
+
+    assert 'agent_span_seconds_count{span="tool",name="demo"} 2' in observability.registry.render()
+
+
+def test_agent_loop_metrics(fake_gemini, monkeypatch):
+    """
+    Test Case 3: Một câu hỏi ghi nhận span LLM/tool, payload bytes và số lượt gọi LLM
+    """
+    monkeypatch.setitem(agent.AVAILABLE_FUNCTIONS, "get_company_info", lambda ticker: "x" * 300)
+    fake_gemini(lambda: [_call_response("get_company_info", {"ticker": "FPT"}), _text_response("FPT")])
+
+    assert asyncio.run(agent.run_agent_query_async("Thông tin FPT?")) == "FPT"
+
+    text = observability.registry.render()
+    assert 'agent_span_seconds_count{span="llm",name=""} 2' in text
+    assert 'agent_span_seconds_count{span="tool",name="get_company_info"} 1' in text
+    assert 'agent_tool_payload_bytes_bucket{tool="get_company_info",le="256"} 0' in text
+    assert 'agent_tool_payload_bytes_bucket{tool="get_company_info",le="1024"} 1' in text
+    assert 'agent_query_iterations_bucket{le="2"} 1' in text
@@ -0,0 +1,72 @@
+"""
+Pytest test suite cho prewarm.py
+Lịch làm nóng theo ngày giao dịch, giới hạn tốc độ và một lượt làm nóng với tools giả lập
+"""
+
+import asyncio
+from datetime import datetime
+
+import prewarm
+from cache import MARKET_TZ
+from prewarm import Prewarmer, RateLimiter, next_run
+
+
+def test_next_run_follows_trading_calendar():
+    """
+    Test Case 1: Mốc kế tiếp là trước giờ mở cửa / sau giờ đóng cửa, bỏ qua cuối tuần
+    """
+    # Thứ Năm 2024-05-16
+    assert next_run(datetime(2024, 5, 16, 7, 0, tzinfo=MARKET_TZ)) == datetime(2024, 5, 16, 8, 45, tzinfo=MARKET_TZ)
+    assert next_run(datetime(2024, 5, 16, 10, 0, tzinfo=MARKET_TZ)) == datetime(2024, 5, 16, 15, 5, tzinfo=MARKET_TZ)
+    # Thứ Sáu sau giờ đóng cửa -> sáng Thứ Hai
+    assert next_run(datetime(2024, 5, 17, 16, 0, tzinfo=MARKET_TZ)) == datetime(2024, 5, 20, 8, 45, tzinfo=MARKET_TZ)
+
+
+def test_rate_limiter_spaces_calls():
+    """
+    Test Case 2: Các lần gọi cách nhau ít nhất 1/rate giây
+    """
+    now = [0.0]
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    async def run():
+        limiter = RateLimiter(4, clock=lambda: now[0], sleep=fake_sleep)
+        for _ in range(3):
+            await limiter.acquire()
+
+    asyncio.run(run())
+    assert sleeps == [0.25, 0.25]
+
+
+def test_run_once_warms_watchlist(monkeypatch):
+    """
+    Test Case 3: Một lượt gọi giá lịch sử, thông tin công ty, giá và chỉ báo cho từng mã; lỗi được ghi lại
+    """
+    calls = []
+
+    def fake_tool(name):
+        def call(**kwargs):
+            if kwargs.get("ticker") == "XYZ":
+                raise RuntimeError("nguồn lỗi")
+            calls.append((name, kwargs["ticker"]))
+            return "{}"
+        return call
+
+    for name in ("get_company_info", "get_historical_price", "calculate_technical_indicators"):
+        monkeypatch.setattr(prewarm.tools, name, fake_tool(name))
+    monkeypatch.setattr(prewarm, "load_price_frame", lambda ticker, start, end: calls.append(("history", ticker)))
+
+    warmer = Prewarmer(["FPT", "XYZ"], rate=0, clock=lambda: datetime(2024, 5, 16, 8, 45, tzinfo=MARKET_TZ))
+    asyncio.run(warmer.run_once())
+
+    assert calls == [
+        ("history", "FPT"), ("get_company_info", "FPT"),
+        ("get_historical_price", "FPT"), ("calculate_technical_indicators", "FPT"),
+        ("history", "XYZ"),
+    ]
+    assert "nguồn lỗi" in warmer.errors["XYZ"]
+    assert warmer.stats()["last_run"].startswith("2024-05-16")
@@ -0,0 +1,87 @@
+"""
+Pytest test suite cho router.py
+Kiểm tra quyết định fast path/LLM và câu trả lời theo mẫu (tools giả lập, không cần mạng)
+"""
+
+import asyncio
+import json
+from datetime import date
+
+import pytest
+
+import router
+import tools
+from intent import parse_intent
+
+
+TODAY = date(2025, 1, 8)
+
+
+def _route(question):
+    return router.plan_route(parse_intent(question, TODAY))
+
+
+def test_simple_questions_take_fast_path():
+    """
+    Test Case 1: Câu hỏi một mã, một loại tra cứu đi thẳng tới tool tương ứng
+    """
+    assert _route("Thông tin VCB") == router.Route("get_company_info", {"ticker": "VCB"}, "company")
+
+    route = _route("Giá FPT 1 tháng gần nhất")
+    assert route.tool == "get_historical_price"
+    assert route.args == {"ticker": "FPT", "start_date": "2024-12-08", "end_date": "2025-01-08"}
+
+    route = _route("RSI 14 HPG")
+    assert route.tool == "calculate_technical_indicators"
+    assert route.args["indicators"] == ["RSI14"]
+
+
+def test_complex_questions_fall_back_to_llm():
+    """
+    Test Case 2: Câu hỏi nhiều mã, cần phân tích hoặc gộp nhiều loại thì chuyển cho LLM
+    """
+    assert _route("Giá VCB và BID 3 tháng qua") is None
+    assert _route("Có nên mua FPT không?") is None
+    assert _route("Thông tin và giá FPT") is None
+    assert _route("Hôm nay thời tiết thế nào?") is None
+
+
+def test_long_indicator_window_extends_lookback():
+    """
+    Test Case 3: Chu kỳ dài (SMA200) tự lùi ngày bắt đầu để đủ dữ liệu tính tại ngày cuối
+    """
+    assert _route("SMA200 của FPT").args["start_date"] < "2024-04-01"
+
+    args = _route("SMA200 của FPT tháng 12 năm 2024").args
+    assert args["start_date"] < "2024-04-01"
+    assert args["end_date"] == "2024-12-31"
+    # Chu kỳ ngắn giữ nguyên khoảng mặc định 3 tháng
+    assert _route("RSI 14 HPG").args["start_date"] == "2024-10-08"
+
+
+def test_render_templates(monkeypatch):
+    """
+    Test Case 4: Dựng câu trả lời từ kết quả tool, tool báo lỗi thì trả None để chuyển cho LLM
+    """
+    monkeypatch.setattr(tools, "calculate_technical_indicators", lambda **kwargs: json.dumps({
+        "ticker": "HPG", "as_of": "2025-01-08", "close": 26.5,
+        "indicators": {"RSI_14": 55.123, "MACD_12_26_9": {"macd": 0.5, "signal": None, "histogram": 0.1}},
+    }))
+    monkeypatch.setattr(tools, "get_company_info", lambda **kwargs: json.dumps({"error": "Không có dữ liệu"}))
+
+    answer = asyncio.run(router.answer_fast_path(parse_intent("RSI 14 và MACD HPG", TODAY)))
+    assert answer.splitlines() == [
+        "Chỉ báo kỹ thuật của HPG (dữ liệu đến 2025-01-08, giá đóng cửa 26.50):",
+        "- RSI_14: 55.12",
+        "- MACD_12_26_9: macd=0.50, signal=n/a, histogram=0.10",
+    ]
+    assert asyncio.run(router.answer_fast_path(parse_intent("Thông tin VCB", TODAY))) is None
+
+
+@pytest.mark.parametrize("enabled", [False])
+def test_fast_path_can_be_disabled(monkeypatch, enabled):
+    """
+    Test Case 5: FAST_PATH_ENABLED=0 đưa mọi câu hỏi về LLM agent
+    """
+    monkeypatch.setattr(router, "FAST_PATH_ENABLED", enabled)
+    assert _route("Thông tin VCB") is None
@@ -0,0 +1,90 @@
+"""
+Pytest test suite offline cho screener.py
+Chỉ báo 2 chiều khớp với IndicatorEngine, sàng lọc toàn kho nến và lỗi biểu thức
+"""
+
+import json
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import screener
+import tools
+from bar_store import BarStore, ingest
+from indicators import IndicatorEngine
+from screener import Expression, ScreenerError, screen
+
+
+# Xu hướng giá mỗi phiên của từng mã giả lập
+TRENDS = {"AAA": -0.02, "BBB": -0.01, "CCC": 0.0, "DDD": 0.01, "EEE": 0.02}
+
+
+def fixture_fetch(ticker, start_date, end_date):
+    days = pd.bdate_range(start_date, end_date)
+    step = np.arange(len(days))
+    close = 50.0 * (1 + TRENDS[ticker]) ** step * (1 + 0.01 * np.sin(step))
+    volume = np.where(step == len(days) - 1, 5000, 1000) if ticker in ("AAA", "EEE") else np.full(len(days), 1000)
+    return pd.DataFrame({"time": days, "open": close, "high": close * 1.01, "low": close * 0.99, "close": close,
+                         "volume": volume})
+
+
+def test_matrix_indicators_match_single_ticker_engine():
+    """
+    Test Case 1: RSI/EMA/SMA/ATR tính trên ma trận khớp IndicatorEngine từng mã, kể cả mã niêm yết muộn
+    """
+    rng = np.random.default_rng(7)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.02, size=(120, 3)), axis=0)
+    close[:30, 2] = np.nan  # Mã thứ ba niêm yết sau 30 phiên
+    panel = screener._build_panel(np.arange(120).astype("datetime64[D]"), ["A", "B", "C"],
+                                  {"open": close, "high": close * 1.01, "low": close * 0.98, "close": close,
+                                   "volume": np.full(close.shape, 1000.0)})
+    expression = Expression("RSI14 + EMA20 + SMA10 + ATR14 > 0")
+    memo = {}
+    expression.evaluate(panel, memo)
+
+    for column in range(3):
+        series = close[:, column][~np.isnan(close[:, column])]
+        engine = IndicatorEngine(series, series * 1.01, series * 0.98)
+        for (_, func, _, window), values in ((k, v) for k, v in memo.items() if k[0] == "func"):
+            expected = engine.compute_one(func, (window,))
+            np.testing.assert_allclose(values[-len(series):, column], expected, rtol=1e-9, equal_nan=True)
+
+
+def test_screen_whole_store_ranked(tmp_path, monkeypatch):
+    """
+    Test Case 2: Sàng lọc toàn bộ kho nến, xếp hạng theo vế trái của điều kiện, dùng chung chỉ báo
+    """
+    store = BarStore(str(tmp_path))
+    ingest(store, list(TRENDS), date(2024, 1, 1), date(2024, 6, 28), fixture_fetch, rate=0)
+    monkeypatch.setattr(screener, "bar_store", store)
+
+    oversold = screen("RSI14 < 30", as_of="2024-06-28")
+    assert oversold["universe"] == 5 and oversold["as_of"] == "2024-06-28"
+    assert [row["ticker"] for row in oversold["results"]] == ["AAA", "BBB"]
+    assert oversold["results"][0]["RSI14"] <= oversold["results"][1]["RSI14"]
+
+    spikes = screen("volume > 2 * volume_sma20 AND close > SMA(CLOSE, 50)", as_of="2024-06-28")
+    assert [row["ticker"] for row in spikes["results"]] == ["EEE"]
+
+    top = screen("ROC20 > -100", sort_by="ROC20", limit=2, as_of="2024-06-28")
+    assert [row["ticker"] for row in top["results"]] == ["EEE", "DDD"] and top["matched"] == 5
+
+
+def test_screen_errors_and_fallback_without_store(monkeypatch):
+    """
+    Test Case 3: Biểu thức không an toàn bị từ chối; không có kho nến thì lọc danh sách mã qua market_data
+    """
+    for bad in ("__import__('os')", "RSI14", "CLOSE.real > 1", "SMA(CLOSE, 999) > 1", "FOO > 1"):
+        with pytest.raises(ScreenerError):
+            Expression(bad) if bad != "RSI14" else screen(bad, tickers=["AAA"])
+
+    monkeypatch.setattr(screener, "bar_store", BarStore(""))
+    monkeypatch.setattr(screener, "load_price_frame", fixture_fetch)
+    with pytest.raises(ScreenerError):
+        screen("RSI14 < 30")  # Toàn sàn cần kho nến
+
+    result = json.loads(tools.screen_stocks("RSI14 > 70", tickers=["AAA", "DDD", "EEE"]))
+    assert [row["ticker"] for row in result["results"]] == ["EEE", "DDD"]
+    assert "error" in json.loads(tools.screen_stocks("RSI14 >", tickers=["AAA"]))
@@ -0,0 +1,113 @@
+"""
+Pytest test suite cho sessions.py
+Rút gọn lịch sử, TTL/LRU của kho phiên và hội thoại nhiều lượt qua endpoint /sessions (offline)
+"""
+
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import google.generativeai as genai
+import pytest
+from fastapi import HTTPException
+
+import main
+from benchmark import StageTimer, offline_environment
+from intent import parse_intent
+from sessions import SessionNotFound, SessionStore, compact_history
+
+
+def _text(role, text):
+    return genai.protos.Content(role=role, parts=[genai.protos.Part(text=text)])
+
+
+def _turn(i):
+    """Một lượt có gọi tool: câu hỏi, function call, kết quả tool, câu trả lời"""
+    return [
+        _text("user", f"câu hỏi {i}"),
+        genai.protos.Content(role="model", parts=[genai.protos.Part(
+            function_call=genai.protos.FunctionCall(name="get_company_info", args={"ticker": "FPT"}))]),
+        genai.protos.Content(role="user", parts=[genai.protos.Part(
+            function_response=genai.protos.FunctionResponse(name="get_company_info", response={"result": "x" * 2000}))]),
+        _text("model", f"trả lời {i}"),
+    ]
+
+
+def test_compact_history_bounds_prompt():
+    """
+    Test Case 1: Lượt cũ chỉ giữ hỏi/đáp, giới hạn số lượt và kích thước lịch sử
+    """
+    history = [content for i in range(5) for content in _turn(i)]
+
+    compacted = compact_history(history, max_turns=4, full_turns=1, max_bytes=1_000_000)
+    assert [c.parts[0].text for c in compacted[:6]] == ["câu hỏi 1", "trả lời 1", "câu hỏi 2", "trả lời 2", "câu hỏi 3", "trả lời 3"]
+    assert len(compacted) == 6 + 4  # lượt cuối giữ nguyên function call và kết quả tool
+
+    # Vượt ngân sách: bỏ các lượt cũ nhất, luôn giữ lượt cuối
+    small = compact_history(history, max_turns=10, full_turns=1, max_bytes=1000)
+    assert small[0].parts[0].text == "câu hỏi 4" and len(small) == 4
+
+
+def test_session_store_ttl_lru_and_follow_up():
+    """
+    Test Case 2: Phiên hết hạn theo TTL, loại theo LRU; câu hỏi tiếp theo dùng mã của lượt trước
+    """
+    now = [0.0]
+    store = SessionStore(max_entries=2, ttl=100, clock=lambda: now[0])
+    first, second = store.create(), store.create()
+    now[0] = 50
+    store.get(first.id)
+    store.create()  # vượt max_entries -> loại phiên ít dùng nhất (second)
+    with pytest.raises(SessionNotFound):
+        store.get(second.id)
+
+    first.remember_tickers(["fpt"])
+    follow_up = first.resolve(parse_intent("còn RSI của nó?", date(2024, 5, 16)))
+    assert follow_up.tickers == ("FPT",) and follow_up.kind == "indicator"
+
+    first.remember_result("get_company_info", {"ticker": "VNM"}, '[{"symbol": "VNM"}]')
+    assert first.cached_result("get_company_info", {"ticker": "VNM"}) == '[{"symbol": "VNM"}]'
+    assert first.tickers == ("VNM",)
+
+    now[0] = 200
+    with pytest.raises(SessionNotFound):
+        store.get(first.id)
+    assert len(store) == 0
+
+
+def test_session_endpoint_reuses_context_and_tool_results(monkeypatch):
+    """
+    Test Case 3: Câu hỏi tiếp theo trong phiên hiểu "nó", LLM nhận lịch sử và dùng lại kết quả tool
+    """
+    monkeypatch.setattr(main, "session_store", SessionStore())
+    request = SimpleNamespace(headers={}, client=SimpleNamespace(host="127.0.0.1"))
+    timer = StageTimer()
+
+    async def ask(session_id, question):
+        return await main.handle_session_query(session_id, main.QueryRequest(question=question), request)
+
+    async def run():
+        created = await main.create_session()
+        session_id = created.session_id
+
+        first = await ask(session_id, "Thông tin công ty FPT?")
+        follow_up = await ask(session_id, "Còn RSI của nó?")
+        assert "FPT" in first.answer and "RSI" in follow_up.answer and "FPT" in follow_up.answer
+
+        # Câu hỏi cần phân tích đi qua LLM, chat nhận lịch sử của hai lượt trước
+        analysis = await ask(session_id, "Phân tích giá FPT")
+        session = main.session_store.get(session_id)
+        assert analysis.turns == 3
+        assert session.history[0].parts[0].text == "Thông tin công ty FPT?"
+
+        tool_calls = timer.counts["tool"]
+        await ask(session_id, "Phân tích giá FPT")
+        assert timer.counts["tool"] == tool_calls  # kết quả tool lấy từ phiên
+
+        await main.delete_session(session_id)
+        with pytest.raises(HTTPException) as missing:
+            await ask(session_id, "Giá FPT")
+        assert missing.value.status_code == 404
+
+    with offline_environment(timer):
+        asyncio.run(run())
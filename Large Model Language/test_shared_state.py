@@ -0,0 +1,100 @@
+"""
+Pytest test suite cho shared_state.py
+Cache có TTL, khóa liên process và trạng thái dùng chung giữa các worker (mô phỏng bằng nhiều process/kết nối)
+"""
+
+import multiprocessing
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from answer_cache import AnswerCache
+from cache import MARKET_TZ, PriceCache
+from intent import parse_intent
+from sessions import SessionStore
+from shared_state import SharedState
+
+
+def test_kv_ttl_and_lease_expiry(tmp_path):
+    """
+    Test Case 1: Giá trị hết hạn theo TTL; khóa bị giữ thì process khác không lấy được cho tới khi release hoặc hết hạn
+    """
+    now = [1000.0]
+    path = str(tmp_path / "shared.db")
+    worker_a, worker_b = SharedState(path, clock=lambda: now[0]), SharedState(path, clock=lambda: now[0])
+
+    worker_a.put("company", "FPT", {"name": "FPT"}, ttl=60)
+    assert worker_b.get("company", "FPT") == {"name": "FPT"}
+    now[0] += 61
+    assert worker_b.get("company", "FPT") is None
+
+    token = worker_a.try_acquire("price:FPT", ttl=30)
+    assert token and worker_b.try_acquire("price:FPT") is None
+    worker_a.release("price:FPT", token)
+    assert worker_b.try_acquire("price:FPT", ttl=30)
+    now[0] += 31  # worker b bị chết khi đang giữ khóa: khóa tự hết hạn
+    assert worker_a.try_acquire("price:FPT")
+
+    assert worker_a.claim("prewarm", ttl=600) and not worker_b.claim("prewarm", ttl=600)
+    assert SharedState("").claim("prewarm", ttl=600)  # Một process: luôn tự làm
+
+
+def _worker_fetch(path: str, log_path: str):
+    """Một worker: đọc cùng khoảng giá qua kho nến dùng chung, fetch chậm ghi lại mỗi lần gọi nguồn"""
+    def fetch(ticker, start_date, end_date):
+        with open(log_path, "a") as f:
+            f.write(f"{ticker}\n")
+        time.sleep(0.3)
+        days = pd.bdate_range(start_date, end_date)
+        return pd.DataFrame({"time": days, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 100})
+
+    cache = PriceCache(db_path=path, shared=SharedState(path),
+                       clock=lambda: datetime(2024, 6, 3, 16, 0, tzinfo=MARKET_TZ))
+    return len(cache.get_history("FPT", "2024-01-01", "2024-05-31", "VCI", fetch))
+
+
+def test_workers_share_price_store_with_single_flight(tmp_path):
+    """
+    Test Case 2: Bốn process cùng hỏi một khoảng giá, chỉ một process gọi nguồn dữ liệu
+    """
+    path, log_path = str(tmp_path / "shared.db"), str(tmp_path / "fetches.log")
+    SharedState(path)  # Tạo bảng trước khi các worker khởi động
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(4) as pool:
+        sizes = pool.starmap(_worker_fetch, [(path, log_path)] * 4)
+
+    assert sizes == [110] * 4
+    with open(log_path) as f:
+        assert f.read().splitlines() == ["FPT"]
+
+
+def test_sessions_and_answers_visible_across_workers(tmp_path):
+    """
+    Test Case 3: Câu hỏi tiếp theo của phiên tới worker khác vẫn có ngữ cảnh; câu trả lời cache dùng chung
+    """
+    path = str(tmp_path / "shared.db")
+    worker_a, worker_b = SessionStore(shared=SharedState(path)), SessionStore(shared=SharedState(path))
+
+    session = worker_a.create()
+    session.remember_tickers(["FPT"])
+    session.add_turn("Thông tin FPT?", "FPT là công ty công nghệ")
+    worker_a.save(session)
+
+    remote = worker_b.get(session.id)
+    assert remote.tickers == ("FPT",) and remote.turns == 1
+    assert remote.history[0].parts[0].text == "Thông tin FPT?"
+
+    worker_b.delete(session.id)
+    try:
+        worker_a.get(session.id)
+        assert False, "phiên đã bị xóa ở worker khác"
+    except KeyError:
+        pass
+
+    clock = lambda: datetime(2024, 6, 3, 16, 0, tzinfo=MARKET_TZ)  # noqa: E731
+    answers_a = AnswerCache(clock=clock, shared=SharedState(path))
+    answers_b = AnswerCache(clock=clock, shared=SharedState(path))
+    intent = parse_intent("Thông tin công ty FPT?", clock().date())
+    answers_a.put(intent, "FPT ...")
+    assert answers_b.get(intent) == "FPT ..." and answers_b.stats()["hits"] == 1
@@ -0,0 +1,93 @@
+"""
+Pytest test suite cho singleflight.py
+Các request đồng thời cùng khóa dùng chung một lần gọi nguồn dữ liệu
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import market_data
+import sources
+from cache import PriceCache, TTLCache
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_result_and_error():
+    """
+    Test Case 1: Một lần gọi cho mỗi khóa; lỗi được trả cho mọi request đang chờ
+    """
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def slow(value):
+        def call():
+            calls.append(value)
+            started.set()
+            time.sleep(0.1)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return call
+
+    def run(value, follower=False):
+        if follower:
+            # Chỉ vào sau khi lần gọi đầu tiên đã bắt đầu
+            started.wait()
+        return flight.do("k", slow(value))
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(run, 42)
+        followers = [pool.submit(run, 0, follower=True) for _ in range(4)]
+        assert leader.result() == (42, False)
+        assert [f.result() for f in followers] == [(42, True)] * 4
+    assert calls == [42] and len(flight) == 0
+
+    started.clear()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(run, ValueError("nguồn lỗi"))]
+        futures += [pool.submit(run, 0, follower=True) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError, match="nguồn lỗi"):
+                future.result()
+
+    # Lần gọi sau khi đã xong không dùng lại kết quả cũ
+    assert flight.do("k", lambda: 7) == (7, False)
+
+
+def test_market_data_coalesces_cold_fetches(monkeypatch):
+    """
+    Test Case 2: Nhiều request cùng mã, cùng khoảng ngày khi cache trống chỉ gọi nguồn một lần
+    """
+    history_calls, overview_calls = [], []
+
+    def fake_fetch(ticker, start_date, end_date, source="VCI"):
+        history_calls.append((ticker, start_date, end_date))
+        time.sleep(0.1)
+        days = pd.bdate_range(start_date, end_date)
+        return pd.DataFrame({"time": days, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 100})
+
+    def overview():
+        overview_calls.append(1)
+        time.sleep(0.1)
+        return pd.DataFrame([{"symbol": "FPT"}])
+
+    monkeypatch.setattr(market_data, "price_cache", PriceCache())
+    monkeypatch.setattr(market_data, "company_cache", TTLCache("company", max_entries=64, ttl=60))
+    monkeypatch.setattr(market_data, "_fetch_history", fake_fetch)
+    monkeypatch.setattr(sources, "get_stock",
+                        lambda ticker, source: SimpleNamespace(company=SimpleNamespace(overview=overview)))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        frames = list(pool.map(lambda _: market_data.load_price_frame("FPT", "2024-05-06", "2024-05-10"), range(8)))
+        companies = list(pool.map(lambda _: market_data.load_company_overview("fpt"), range(8)))
+
+    assert len(history_calls) == 1 and len(overview_calls) == 1
+    assert all(len(df) == 5 for df in frames)
+    # Mỗi request nhận bản sao riêng
+    assert len({id(df) for df in frames}) == 8 and len({id(df) for df in companies}) == 8
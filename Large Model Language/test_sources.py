@@ -0,0 +1,100 @@
+"""
+Pytest test suite cho sources.py
+Deadline, retry, circuit breaker và failover với nguồn giả lập (không cần kết nối mạng)
+"""
+
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import sources
+from sources import CircuitBreaker, SourceError, SourcePool, normalize_history
+
+
+def fake_stock(history=None, overview=None):
+    """Handle stock giả lập giống đối tượng của vnstock"""
+    return SimpleNamespace(
+        quote=SimpleNamespace(history=lambda start, end: history()),
+        company=SimpleNamespace(overview=lambda: overview()),
+    )
+
+
+def bars(times, tz=None):
+    return pd.DataFrame({
+        "time": pd.to_datetime(times).tz_localize(tz) if tz else pd.to_datetime(times),
+        "open": [10, 11], "high": [12, 12], "low": [9, 10], "close": [11, 11.5], "volume": [100.0, 200.0],
+    })
+
+
+def test_failover_normalizes_to_one_schema(monkeypatch):
+    """
+    Test Case 1: VCI lỗi kết nối -> thử lại rồi chuyển sang TCBS; dữ liệu cùng schema với VCI
+    """
+    calls = []
+
+    def vci_history():
+        calls.append("VCI")
+        raise ConnectionError("VCI không phản hồi")
+
+    def tcbs_history():
+        calls.append("TCBS")
+        return bars(["2024-05-17", "2024-05-16"])
+
+    stocks = {
+        "VCI": fake_stock(history=vci_history),
+        "TCBS": fake_stock(history=tcbs_history,
+                           overview=lambda: pd.DataFrame([{"symbol": "FPT", "industry": "Phần mềm", "outstanding_share": 1270.5}])),
+    }
+    monkeypatch.setattr(sources, "get_stock", lambda ticker, source: stocks[source])
+    pool = SourcePool(("VCI", "TCBS"), attempts=2, sleep=lambda s: None)
+
+    df = pool.history("FPT", "2024-05-16", "2024-05-17")
+    assert calls == ["VCI", "VCI", "TCBS"]
+    assert list(df.columns) == ["time", "open", "high", "low", "close", "volume"]
+    assert df["time"].dt.strftime("%Y-%m-%d").tolist() == ["2024-05-16", "2024-05-17"]
+    assert df["volume"].dtype == "int64"
+
+    company = pool.company("FPT", preferred="TCBS")
+    assert company.loc[0, "icb_name3"] == "Phần mềm" and company.loc[0, "issue_share"] == 1_270_500_000
+
+    # VCI giờ giao dịch có múi giờ -> cùng ngày giao dịch với TCBS
+    vci_bars = normalize_history(bars(["2024-05-16 00:00", "2024-05-17 00:00"], tz="Asia/Ho_Chi_Minh"))
+    assert vci_bars["time"].equals(df["time"])
+
+
+def test_deadline_bounds_hung_source(monkeypatch):
+    """
+    Test Case 2: Nguồn bị treo bị cắt theo deadline thay vì giữ request vô hạn
+    """
+    monkeypatch.setattr(sources, "get_stock", lambda ticker, source: fake_stock(history=lambda: time.sleep(1)))
+    pool = SourcePool(("VCI",), timeout=0.05, attempts=2, sleep=lambda s: None)
+
+    started = time.perf_counter()
+    with pytest.raises(SourceError, match="VCI: quá 0.05s"):
+        pool.history("FPT", "2024-05-16", "2024-05-17")
+    assert time.perf_counter() - started < 0.5
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """
+    Test Case 3: Ngắt mạch sau số lỗi liên tiếp, cho một lần gọi thử sau thời gian chờ
+    """
+    now = [0.0]
+    breaker = CircuitBreaker("VCI", failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 31
+    assert breaker.allow() and not breaker.allow()  # chỉ một lần gọi thử
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 62
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
@@ -0,0 +1,101 @@
+"""
+Pytest test suite cho tickers.py
+Danh mục mã giả lập, không cần kết nối mạng
+"""
+
+import pytest
+
+import market_data
+import sources
+from market_data import MarketDataError
+from tickers import TickerError, TickerIndex, TickerInfo
+
+
+LISTING = [
+    TickerInfo("FPT", "HSX", "STOCK", "Công ty Cổ phần FPT", "FPT Corp", "Phần mềm & Dịch vụ máy tính"),
+    TickerInfo("FTS", "HSX", "STOCK", "Công ty Cổ phần Chứng khoán FPT", "FPTS", "Dịch vụ tài chính"),
+    TickerInfo("VNM", "HSX", "STOCK", "Công ty Cổ phần Sữa Việt Nam", "Vinamilk", "Sản xuất thực phẩm"),
+    TickerInfo("VCB", "HSX", "STOCK", "Ngân hàng TMCP Ngoại thương Việt Nam", "Vietcombank", "Ngân hàng"),
+    TickerInfo("HAG", "DELISTED", "STOCK", "Công ty Cổ phần Hoàng Anh Gia Lai", "HAGL", ""),
+]
+
+
+@pytest.fixture
+def index():
+    index = TickerIndex(path="", fetch=lambda: LISTING, clock=lambda: 1000.0)
+    assert index.load()
+    return index
+
+
+def test_search_by_symbol_and_name(index):
+    """
+    Test Case 1: Autocomplete theo mã, tên có dấu/không dấu và mã gõ nhầm
+    """
+    assert [r["symbol"] for r in index.search("F")] == ["FPT", "FTS"]
+    assert [r["symbol"] for r in index.search("vinamilk")][0] == "VNM"
+    assert [r["symbol"] for r in index.search("ngoại thương")] == ["VCB"]
+    assert [r["symbol"] for r in index.search("sua viet")] == ["VNM"]
+    assert "FPT" in [r["symbol"] for r in index.search("FTP")]
+    assert index.search("VNM")[0]["industry"] == "Sản xuất thực phẩm"
+
+
+def test_validate_resolves_and_rejects(index):
+    """
+    Test Case 2: Chuẩn hóa mã, nhận tên viết tắt, từ chối mã sai/đã hủy niêm yết kèm gợi ý
+    """
+    assert index.validate(" fpt ") == "FPT"
+    assert index.validate("Vinamilk") == "VNM"
+
+    with pytest.raises(TickerError, match="Có phải bạn muốn: .*FPT"):
+        index.validate("FTP")
+    with pytest.raises(TickerError, match="hủy niêm yết"):
+        index.validate("HAG")
+
+
+def test_empty_index_passes_through():
+    """
+    Test Case 3: Chưa tải được listing thì không chặn mã nào
+    """
+    def failing_fetch():
+        raise ConnectionError("offline")
+
+    index = TickerIndex(path="", fetch=failing_fetch)
+    assert not index.load()
+    assert index.validate("xyz") == "XYZ"
+
+
+def test_snapshot_is_reused_until_stale(tmp_path):
+    """
+    Test Case 4: Snapshot trên đĩa được nạp lại khi khởi động, chỉ tải listing khi đã cũ
+    """
+    path = str(tmp_path / "tickers.json")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return LISTING
+
+    now = {"t": 1000.0}
+    assert TickerIndex(path=path, fetch=fetch, clock=lambda: now["t"]).load()
+
+    reloaded = TickerIndex(path=path, fetch=fetch, clock=lambda: now["t"])
+    assert reloaded.load() and len(reloaded) == len(LISTING) and len(calls) == 1
+
+    now["t"] += 2 * 86400
+    assert TickerIndex(path=path, fetch=fetch, clock=lambda: now["t"]).load()
+    assert len(calls) == 2
+
+
+def test_market_data_validates_before_fetch(index, monkeypatch):
+    """
+    Test Case 5: Mã sai bị chặn trước khi gọi nguồn dữ liệu
+    """
+    fetches = []
+    monkeypatch.setattr(market_data, "ticker_index", index)
+    monkeypatch.setattr(sources, "get_stock", lambda *args: fetches.append(args))
+
+    with pytest.raises(MarketDataError, match="không tồn tại"):
+        market_data.load_company_overview("FTP")
+    with pytest.raises(MarketDataError, match="không tồn tại"):
+        market_data.load_price_history("ABCD", "2025-01-01", "2025-01-31")
+    assert fetches == []
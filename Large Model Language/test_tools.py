@@ -0,0 +1,166 @@
+"""
+Pytest test suite offline cho tools.py
+Thay nguồn vnstock bằng dữ liệu giá giả lập nên không cần kết nối mạng
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import market_data
+import tools
+from cache import PriceCache, TTLCache
+from indicator_state import IndicatorStateStore
+
+
+def fixture_prices(ticker, start_date, end_date):
+    """Sinh nến ngày giả lập: giá đóng cửa tăng dần từ 100"""
+    days = pd.bdate_range(start_date, end_date)
+    close = 100.0 + np.arange(len(days), dtype=float)
+    return pd.DataFrame({
+        "time": days,
+        "open": close - 0.5,
+        "high": close + 1.0,
+        "low": close - 1.0,
+        "close": close,
+        "volume": np.full(len(days), 1000, dtype=np.int64),
+    })
+
+
+@pytest.fixture(autouse=True)
+def offline_source(monkeypatch):
+    """Dùng cache riêng cho mỗi test và nguồn dữ liệu giả lập"""
+    fetches = []
+
+    def fake_fetch(ticker, start_date, end_date, source="VCI"):
+        fetches.append((ticker, start_date, end_date))
+        return fixture_prices(ticker, start_date, end_date)
+
+    monkeypatch.setattr(market_data, "price_cache", PriceCache())
+    monkeypatch.setattr(market_data, "company_cache", TTLCache("company", max_entries=64, ttl=60))
+    monkeypatch.setattr(market_data, "_fetch_history", fake_fetch)
+    monkeypatch.setattr(tools, "indicator_states", IndicatorStateStore())
+    return fetches
+
+
+def test_historical_price_json():
+    """
+    Test Case 1: get_historical_price trả về tóm tắt và nến dạng cột đủ các cột OHLCV
+    """
+    result = json.loads(tools.get_historical_price("vcb", "2024-10-01", "2024-10-31"))
+
+    assert result["ticker"] == "VCB"
+    assert result["granularity"] == "daily"
+    assert set(result["bars"]) == {"time", "open", "high", "low", "close", "volume"}
+    assert len(result["bars"]["close"]) == 23
+    assert result["summary"]["change_pct"] == 22.0
+
+
+def test_historical_price_respects_token_budget(monkeypatch):
+    """
+    Test Case 1b: Khoảng thời gian dài được gộp nến để vừa ngân sách token
+    """
+    monkeypatch.setattr("payload.PRICE_PAYLOAD_TOKEN_BUDGET", 1500)
+
+    shaped = tools.get_historical_price("FPT", "2022-01-01", "2024-12-31")
+    full = tools.get_historical_price("FPT", "2022-01-01", "2024-12-31", full_series=True)
+
+    assert len(shaped) / 3 <= 1500
+    assert json.loads(shaped)["granularity"] in ("weekly", "monthly")
+    assert json.loads(full)["granularity"] == "daily"
+    assert len(json.loads(full)["bars"]["close"]) == len(pd.bdate_range("2022-01-01", "2024-12-31"))
+
+
+def test_indicator_uses_dataframe_without_json(monkeypatch, offline_source):
+    """
+    Test Case 2: calculate_technical_indicator không serialize giá lịch sử sang JSON
+    """
+    def fail_to_json(*args, **kwargs):
+        raise AssertionError("Không được serialize giá lịch sử khi tính chỉ báo")
+
+    monkeypatch.setattr(pd.DataFrame, "to_json", fail_to_json)
+
+    result = tools.calculate_technical_indicator("FPT", "SMA", 5, "2024-10-01", "2024-10-31")
+
+    # 5 phiên cuối có close 118..122
+    assert result == "Chỉ số SMA 5 ngày của FPT là 120.00"
+    assert len(offline_source) == 1
+
+
+def test_empty_history_returns_error(monkeypatch):
+    """
+    Test Case 3: Không có dữ liệu giá trả về JSON lỗi thay vì exception
+    """
+    monkeypatch.setattr(market_data, "_fetch_history", lambda *args, **kwargs: pd.DataFrame())
+
+    result = json.loads(tools.calculate_technical_indicator("XYZ", "RSI", 14, "2024-10-01", "2024-10-31"))
+
+    assert "Không có dữ liệu giá cho mã XYZ" in result["error"]
+
+
+def test_many_indicators_single_fetch(offline_source):
+    """
+    Test Case 4: calculate_technical_indicators tính nhiều chỉ báo với một lần lấy dữ liệu
+    """
+    result = json.loads(tools.calculate_technical_indicators(
+        "HPG", ["RSI14", "MACD", "SMA50"], "2024-06-03", "2024-10-31"
+    ))
+
+    assert len(offline_source) == 1
+    assert result["ticker"] == "HPG"
+    assert result["as_of"] == "2024-10-31"
+    # Giá tăng đều nên không có phiên giảm: RSI = 100
+    assert result["indicators"]["RSI_14"] == 100.0
+    assert set(result["indicators"]["MACD_12_26_9"]) == {"macd", "signal", "histogram"}
+    assert result["indicators"]["SMA_50"] is not None
+
+
+def test_batch_indicators_concurrent_with_per_ticker_errors(monkeypatch):
+    """
+    Test Case 5: Tool theo lô chạy đồng thời và báo lỗi riêng cho từng mã
+    """
+    def fake_fetch(ticker, start_date, end_date, source="VCI"):
+        if ticker == "XXX":
+            return pd.DataFrame()
+        return fixture_prices(ticker, start_date, end_date)
+
+    monkeypatch.setattr(market_data, "_fetch_history", fake_fetch)
+
+    result = json.loads(tools.calculate_technical_indicators_batch(
+        "vcb, BID,ctg,XXX,VCB", ["SMA5"], "2024-10-01", "2024-10-31"
+    ))
+
+    assert list(result["results"]) == ["VCB", "BID", "CTG"]
+    assert result["results"]["BID"]["indicators"]["SMA_5"] == 120.0
+    assert "XXX" in result["errors"]
+
+
+def test_batch_price_summary():
+    """
+    Test Case 6: get_historical_price_batch trả về tóm tắt gọn thay vì toàn bộ chuỗi giá
+    """
+    result = json.loads(tools.get_historical_price_batch(["VCB", "TCB"], "2024-10-01", "2024-10-31"))
+
+    summary = result["results"]["TCB"]
+    assert summary["sessions"] == 23
+    assert summary["first_close"] == 100.0
+    assert summary["last_close"] == 122.0
+    assert summary["change_pct"] == 22.0
+
+
+def test_compact_company_matches_json_records(monkeypatch):
+    """
+    Test Case 7: Bản ghi công ty rút gọn giống kết quả to_json (NaN -> null, thời gian -> epoch ms) mà không qua JSON
+    """
+    overview = pd.DataFrame([{
+        "symbol": "FPT", "charter_capital": np.int64(14710000000000), "rating": np.nan,
+        "listed_date": pd.Timestamp("2006-12-13"), "profile": "x" * 500, "is_vn30": np.bool_(True),
+    }])
+    monkeypatch.setattr(tools, "load_company_overview", lambda ticker: overview)
+
+    expected = json.loads(overview.to_json(orient="records", force_ascii=False))[0]
+    expected["profile"] = "x" * tools.BATCH_TEXT_LIMIT + "..."
+    compact = tools._compact_company("FPT")
+    assert compact == expected and json.dumps(compact)
@@ -0,0 +1,57 @@
+"""
+Pytest test suite cho warmup.py và các endpoint /live, /ready
+Warmup chạy các bước nạp ở nền; readiness chỉ sẵn sàng khi mọi bước xong
+"""
+
+import asyncio
+import json
+import threading
+
+import main
+import warmup
+from benchmark import asgi_request, measure_startup
+
+
+def test_ready_only_after_all_steps_succeed(monkeypatch):
+    """
+    Test Case 1: /live trả 200 ngay, /ready trả 503 khi warmup chưa xong hoặc có bước lỗi
+    """
+    release = threading.Event()
+
+    def failing():
+        raise RuntimeError("không import được SDK")
+
+    warmer = warmup.Warmup({"slow": release.wait, "broken": failing})
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", True)
+    monkeypatch.setattr(warmup, "warmer", warmer)
+
+    async def scenario():
+        task = asyncio.create_task(warmer.run())
+        await asyncio.sleep(0.05)
+        during = [await asgi_request(main.app, "GET", path) for path in ("/live", "/ready")]
+        release.set()
+        await task
+        return during, await asgi_request(main.app, "GET", "/ready")
+
+    (live, not_ready), (status, body) = asyncio.run(scenario())
+    assert live[0] == 200 and not_ready[0] == 503
+    assert json.loads(not_ready[1])["steps"] == {"slow": "running", "broken": "pending"}
+
+    report = json.loads(body)
+    assert status == 503 and report["steps"] == {"slow": "ok", "broken": "error"}
+    assert "SDK" in report["errors"]["broken"]
+
+    warmer.steps["broken"] = lambda: None
+    asyncio.run(warmer.run())
+    assert warmer.ready and asyncio.run(asgi_request(main.app, "GET", "/ready"))[0] == 200
+
+
+def test_import_main_leaves_heavy_sdks_to_warmup():
+    """
+    Test Case 2: Process mới import main không kéo theo Gemini SDK/vnstock; warmup nạp được cả hai
+    """
+    report = measure_startup(runs=1)
+
+    assert report["eager_modules"] == []
+    assert set(report["warmup_steps_ms"]) == {"gemini", "vnstock"} and not report["warmup_errors"]
+    assert report["import_ms"]["p50"] > 0
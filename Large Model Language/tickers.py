@@ -0,0 +1,298 @@
+"""
+Danh mục mã chứng khoán niêm yết giữ trong bộ nhớ
+Dựng từ dữ liệu listing của vnstock (sàn, ngành, tên công ty có dấu và không dấu),
+dùng để kiểm tra/chuẩn hóa mã trước khi gọi nguồn dữ liệu và cho endpoint /tickers/search
+"""
+
+import asyncio
+import difflib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from intent import normalize_text
+from observability import logger
+from shared_state import SHARED_STATE_DB, shared_state
+
+
+# Cấu hình danh mục (có thể thay đổi qua biến môi trường)
+# File JSON lưu snapshot; rỗng = chỉ giữ trong bộ nhớ (nhiều worker: mặc định cạnh SHARED_STATE_DB)
+TICKER_INDEX_FILE = os.getenv("TICKER_INDEX_FILE", "") or (f"{SHARED_STATE_DB}.tickers.json" if SHARED_STATE_DB else "")
+TICKER_INDEX_REFRESH = float(os.getenv("TICKER_INDEX_REFRESH", "86400"))  # Chu kỳ làm mới (giây)
+TICKER_INDEX_RETRY = 300  # Thử lại sau (giây) khi làm mới thất bại
+LISTING_SOURCE = os.getenv("LISTING_SOURCE", "VCI")
+
+# Sàn của các mã đã hủy niêm yết trong dữ liệu VCI
+DELISTED_EXCHANGES = {"DELISTED"}
+
+
+class TickerError(ValueError):
+    """Mã chứng khoán không có trong danh mục; message kèm gợi ý mã gần đúng"""
+
+
+@dataclass(frozen=True)
+class TickerInfo:
+    """
+    Thông tin niêm yết của một mã
+
+    Attributes:
+        symbol: Mã chứng khoán (viết hoa)
+        exchange: Sàn (HSX, HNX, UPCOM, ...)
+        type: Loại chứng khoán (STOCK, ETF, ...)
+        name: Tên công ty (có dấu)
+        short_name: Tên viết tắt
+        industry: Ngành ICB cấp 3
+    """
+    symbol: str
+    exchange: str = ""
+    type: str = ""
+    name: str = ""
+    short_name: str = ""
+    industry: str = ""
+
+    @property
+    def listed(self) -> bool:
+        return self.exchange.upper() not in DELISTED_EXCHANGES
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "listed": self.listed}
+
+
+def _text(value) -> str:
+    return "" if value is None or value != value else str(value).strip()
+
+
+def fetch_listing(source: str = LISTING_SOURCE) -> list:
+    """
+    Tải danh sách mã từ vnstock (sàn niêm yết + phân ngành ICB)
+
+    Returns:
+        Danh sách TickerInfo
+    """
+    from vnstock import Listing
+
+    listing = Listing(source=source)
+    exchanges = listing.symbols_by_exchange()
+    try:
+        industries = listing.symbols_by_industries()
+        industry_by_symbol = {
+            _text(row.get("symbol")).upper(): (_text(row.get("icb_name3")), _text(row.get("organ_name")))
+            for row in industries.to_dict("records")
+        }
+    except Exception as e:
+        # Phân ngành chỉ bổ sung thông tin, thiếu vẫn dựng được danh mục
+        logger.warning("Không tải được phân ngành ICB: %s", e)
+        industry_by_symbol = {}
+
+    entries = []
+    for row in exchanges.to_dict("records"):
+        symbol = _text(row.get("symbol")).upper()
+        if not symbol:
+            continue
+        industry, industry_name = industry_by_symbol.get(symbol, ("", ""))
+        entries.append(TickerInfo(
+            symbol=symbol,
+            exchange=_text(row.get("exchange")),
+            type=_text(row.get("type")),
+            name=_text(row.get("organ_name")) or industry_name,
+            short_name=_text(row.get("organ_short_name")),
+            industry=industry,
+        ))
+    return entries
+
+
+class TickerIndex:
+    """
+    Danh mục mã trong bộ nhớ: tra cứu chính xác, tìm gần đúng theo mã và tên không dấu
+
+    Khi danh mục còn rỗng (chưa tải được listing), validate cho mọi mã đi qua
+    để không chặn các tools khi nguồn listing gặp sự cố.
+    """
+
+    def __init__(self, path: str = TICKER_INDEX_FILE, fetch=fetch_listing, clock=time.time):
+        self.path = path
+        self.fetch = fetch
+        self.clock = clock
+        self.loaded_at = None
+        self._entries = {}  # symbol -> TickerInfo
+        self._names = {}  # symbol -> tên/tên viết tắt đã chuẩn hóa (không dấu, chữ thường)
+        self._aliases = {}  # tên viết tắt đã chuẩn hóa -> symbol (chỉ các tên không trùng)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, symbol) -> bool:
+        return str(symbol).upper() in self._entries
+
+    def get(self, symbol: str):
+        return self._entries.get(str(symbol).strip().upper())
+
+    def listed_symbols(self) -> list:
+        """Các mã còn niêm yết (theo thứ tự chữ cái)"""
+        return sorted(symbol for symbol, info in self._entries.items() if info.listed)
+
+    def replace(self, entries, loaded_at: float = None):
+        """Thay toàn bộ danh mục (đổi tham chiếu một lần, không khóa khi đọc)"""
+        entries = {info.symbol: info for info in entries}
+        names = {
+            symbol: " ".join(filter(None, (normalize_text(info.short_name), normalize_text(info.name))))
+            for symbol, info in entries.items()
+        }
+        aliases = {}
+        for symbol, info in entries.items():
+            alias = normalize_text(info.short_name)
+            if alias:
+                aliases[alias] = None if alias in aliases else symbol
+        aliases = {alias: symbol for alias, symbol in aliases.items() if symbol}
+        with self._lock:
+            self._entries, self._names, self._aliases = entries, names, aliases
+            self.loaded_at = self.clock() if loaded_at is None else loaded_at
+
+    def load(self, max_age: float = TICKER_INDEX_REFRESH) -> bool:
+        """
+        Nạp danh mục: đọc snapshot nếu có (có thể do worker khác vừa ghi), snapshot
+        cũ hơn max_age hoặc chưa có thì tải từ vnstock
+
+        Returns:
+            True nếu danh mục có dữ liệu
+        """
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                if self.loaded_at is None or snapshot["loaded_at"] > self.loaded_at:
+                    self.replace([TickerInfo(**entry) for entry in snapshot["entries"]], snapshot["loaded_at"])
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning("Không đọc được snapshot danh mục mã %s: %s", self.path, e)
+        if not self._entries or self.stale(max_age):
+            self.refresh()
+        return bool(self._entries)
+
+    def refresh(self) -> bool:
+        """Tải lại listing từ vnstock và ghi snapshot; lỗi thì giữ danh mục cũ"""
+        try:
+            entries = self.fetch()
+        except Exception as e:
+            logger.warning("Không tải được danh sách mã: %s", e)
+            return False
+        if not entries:
+            return False
+
+        self.replace(entries)
+        if self.path:
+            snapshot = {"loaded_at": self.loaded_at, "entries": [asdict(info) for info in entries]}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        logger.info("Đã nạp %d mã chứng khoán", len(entries))
+        return True
+
+    def stale(self, max_age: float = TICKER_INDEX_REFRESH) -> bool:
+        return self.loaded_at is None or self.clock() - self.loaded_at >= max_age
+
+    def validate(self, ticker: str) -> str:
+        """
+        Chuẩn hóa mã trước khi gọi nguồn dữ liệu
+
+        Nhận cả mã ('fpt') lẫn tên viết tắt của công ty ('Vinamilk').
+
+        Returns:
+            Mã chuẩn (viết hoa)
+
+        Raises:
+            TickerError: Mã không tồn tại hoặc đã hủy niêm yết (kèm gợi ý)
+        """
+        symbol = str(ticker).strip().upper()
+        entries = self._entries
+        if not entries:
+            return symbol
+
+        info = entries.get(symbol)
+        if info is None:
+            alias = self._aliases.get(normalize_text(ticker))
+            if alias is not None:
+                return alias
+            suggestions = [item["symbol"] for item in self.search(ticker, limit=3)]
+            hint = f". Có phải bạn muốn: {', '.join(suggestions)}?" if suggestions else ""
+            raise TickerError(f"Mã chứng khoán '{symbol}' không tồn tại{hint}")
+
+        if not info.listed:
+            raise TickerError(f"Mã chứng khoán '{symbol}' đã hủy niêm yết")
+        return symbol
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        Tìm mã cho autocomplete theo mã hoặc tên công ty (có dấu hay không dấu đều được)
+
+        Thứ tự ưu tiên: trùng mã, mã bắt đầu bằng query, tên có từ bắt đầu bằng query,
+        tên chứa query, mã gần đúng (gõ nhầm)
+
+        Returns:
+            Danh sách dict thông tin mã (xem TickerInfo.to_dict)
+        """
+        entries, names = self._entries, self._names
+        symbol_query = str(query).strip().upper()
+        text_query = normalize_text(query)
+        if not symbol_query or not entries:
+            return []
+
+        ranked = {}
+
+        def add(symbol, rank):
+            if symbol not in ranked or rank < ranked[symbol]:
+                ranked[symbol] = rank
+
+        if symbol_query in entries:
+            add(symbol_query, 0)
+        for symbol, name in names.items():
+            if symbol.startswith(symbol_query):
+                add(symbol, 1)
+            elif text_query and (name.startswith(text_query) or f" {text_query}" in f" {name}"):
+                add(symbol, 2)
+            elif text_query and len(text_query) >= 3 and text_query in name:
+                add(symbol, 3)
+        if len(ranked) < limit:
+            for symbol in difflib.get_close_matches(symbol_query, list(entries), n=limit, cutoff=0.6):
+                add(symbol, 4)
+
+        # Mã còn niêm yết và cổ phiếu lên trước, sau đó theo độ dài mã và thứ tự chữ cái
+        order = sorted(ranked, key=lambda s: (
+            ranked[s], not entries[s].listed, entries[s].type.upper() != "STOCK", len(s), s
+        ))
+        return [entries[symbol].to_dict() for symbol in order[:limit]]
+
+
+def load_shared(index: TickerIndex, max_age: float = TICKER_INDEX_REFRESH) -> bool:
+    """
+    Nạp danh mục dưới khóa liên process: worker đầu tiên tải listing và ghi snapshot,
+    các worker sau chỉ đọc lại snapshot vừa ghi
+
+    Returns:
+        True nếu danh mục còn mới (không cần thử lại sớm)
+    """
+    with shared_state.lock("tickers"):
+        index.load(max_age)
+    return bool(len(index)) and not index.stale(max_age)
+
+
+async def refresh_periodically(index: TickerIndex, interval: float = TICKER_INDEX_REFRESH):
+    """
+    Task nền nạp danh mục khi khởi động rồi làm mới theo chu kỳ (chạy trong lifespan của main.py)
+
+    Nạp trong thread riêng nên server nhận request ngay cả khi nguồn listing chậm;
+    trong lúc đó validate cho mọi mã đi qua.
+    """
+    await asyncio.to_thread(load_shared, index, interval)
+    while True:
+        age = interval if index.loaded_at is None else index.clock() - index.loaded_at
+        await asyncio.sleep(max(interval - age, 0))
+        if not await asyncio.to_thread(load_shared, index, interval):
+            await asyncio.sleep(TICKER_INDEX_RETRY)
+
+
+# Danh mục dùng chung cho toàn bộ process
+ticker_index = TickerIndex()
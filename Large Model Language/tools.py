@@ -3,11 +3,28 @@ Tools lõi cho Vietnamese Financial AI Agent
 Các hàm wrapper cho VnStock API để LLM có thể gọi
 """
 
+import os
 import json
-import pandas as pd
-from vnstock import Vnstock
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import pandas as pd
+
+from indicator_state import indicator_states
+from indicators import IndicatorError, indicator_label, parse_indicator
+from market_data import DEFAULT_SOURCE, MarketDataError, load_company_overview, load_price_frame, load_price_history, resolve_ticker
+from payload import price_summary, shape_price_payload
+from screener import SCREEN_DEFAULT_LIMIT, ScreenerError, screen
+
+
+# Cấu hình tools theo lô (nhiều mã một lần gọi)
+BATCH_MAX_TICKERS = int(os.getenv("BATCH_MAX_TICKERS", "30"))  # Đủ cho cả rổ VN30
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))  # Số request đồng thời tới nguồn dữ liệu
+BATCH_TEXT_LIMIT = int(os.getenv("BATCH_TEXT_LIMIT", "300"))  # Cắt bớt các trường văn bản dài
+
+# Thread pool dùng chung cho mọi tool theo lô, giới hạn tổng số fetch đồng thời
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix="batch-fetch")
+
 
 def get_company_info(ticker: str) -> str:
     """
@@ -20,21 +37,19 @@ def get_company_info(ticker: str) -> str:
         JSON string chứa thông tin công ty hoặc thông báo lỗi
     """
     try:
-        stock = Vnstock().stock(symbol=ticker.upper(), source='VCI')
-        df = stock.company.overview()
-        
-        if df is None or df.empty:
-            return json.dumps({"error": f"Không tìm thấy thông tin cho mã {ticker}"}, ensure_ascii=False)
+        df = load_company_overview(ticker)
         
         # Chuyển DataFrame sang JSON
         result_json = df.to_json(orient='records', force_ascii=False)
         return result_json
         
+    except MarketDataError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
     except Exception as e:
         return json.dumps({"error": f"Lỗi khi lấy thông tin công ty {ticker}: {str(e)}"}, ensure_ascii=False)
 
 
-def get_historical_price(ticker: str, start_date: str, end_date: str) -> str:
+def get_historical_price(ticker: str, start_date: str, end_date: str, full_series: bool = False) -> str:
     """
     Lấy giá lịch sử của cổ phiếu
     
@@ -42,32 +57,32 @@ def get_historical_price(ticker: str, start_date: str, end_date: str) -> str:
         ticker: Mã chứng khoán (ví dụ: 'FPT', 'VCB', 'HPG')
         start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
         end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
+        full_series: True để lấy toàn bộ nến ngày, bỏ qua ngân sách token
     
     Returns:
-        JSON string chứa dữ liệu giá lịch sử hoặc thông báo lỗi
+        JSON string gồm tóm tắt thống kê và các nến (dạng cột, có thể gộp tuần/tháng)
+        hoặc thông báo lỗi
     """
     try:
-        stock = Vnstock().stock(symbol=ticker.upper(), source='VCI')
-        df = stock.quote.history(start=start_date, end=end_date)
-        
-        if df is None or df.empty:
-            return json.dumps({"error": f"Không có dữ liệu giá cho mã {ticker} trong khoảng thời gian này"}, ensure_ascii=False)
+        # Đọc qua cache: phiên đã đóng cửa lấy từ local, chỉ tải phần còn thiếu
+        history = load_price_history(ticker, start_date, end_date)
         
-        # Chuyển DataFrame sang JSON
-        result_json = df.to_json(orient='records', force_ascii=False)
-        return result_json
+        # Serialize một lần tại biên trả về cho LLM, giới hạn theo ngân sách token
+        return shape_price_payload(history, full_series=bool(full_series))
         
+    except MarketDataError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
     except Exception as e:
         return json.dumps({"error": f"Lỗi khi lấy giá lịch sử {ticker}: {str(e)}"}, ensure_ascii=False)
 
 
 def calculate_technical_indicator(ticker: str, indicator_name: str, window_size: int, start_date: str, end_date: str) -> str:
     """
-    Tính các chỉ báo kỹ thuật (SMA, RSI) cho cổ phiếu
+    Tính một chỉ báo kỹ thuật (SMA, EMA, RSI, MACD, BB, ATR, OBV, VWAP, ROC, STOCH) cho cổ phiếu
     
     Args:
         ticker: Mã chứng khoán (ví dụ: 'FPT', 'VCB', 'HPG')
-        indicator_name: Tên chỉ báo ('SMA' hoặc 'RSI')
+        indicator_name: Tên chỉ báo (ví dụ: 'SMA', 'RSI')
         window_size: Độ dài chu kỳ (ví dụ: 14, 20, 50)
         start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
         end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
@@ -76,61 +91,229 @@ def calculate_technical_indicator(ticker: str, indicator_name: str, window_size:
         Chuỗi mô tả kết quả hoặc thông báo lỗi
     """
     try:
-        # Lấy dữ liệu giá lịch sử
-        price_data_json = get_historical_price(ticker, start_date, end_date)
-        
-        # Parse JSON thành DataFrame
-        price_data = json.loads(price_data_json)
+        name, params = parse_indicator(indicator_name, window_size)
+        label = indicator_label(name, params)
         
-        # Kiểm tra nếu có lỗi
-        if isinstance(price_data, dict) and "error" in price_data:
-            return json.dumps(price_data, ensure_ascii=False)
+        # Giá trị mới nhất từ trạng thái tăng dần (RSI, ATR dùng làm trơn Wilder)
+        snapshot = _indicator_snapshot(ticker, [label], start_date, end_date)
+        value = snapshot["indicators"][label]
+        period = f"{params[0]} ngày " if params else ""
         
-        # Chuyển về DataFrame
-        df = pd.DataFrame(price_data)
+        if value is None:
+            return f"Không đủ dữ liệu để tính {name} {period}cho {snapshot['ticker']}"
         
-        if df.empty:
-            return json.dumps({"error": f"Không có dữ liệu để tính {indicator_name}"}, ensure_ascii=False)
+        if isinstance(value, dict):
+            details = ", ".join(f"{key}={v:.2f}" for key, v in value.items())
+            return f"Chỉ số {label} của {snapshot['ticker']}: {details}"
         
-        # Đảm bảo cột 'close' tồn tại
-        if 'close' not in df.columns:
-            return json.dumps({"error": "Dữ liệu không có cột 'close'"}, ensure_ascii=False)
-        
-        # Tính chỉ báo kỹ thuật
-        indicator_name_upper = indicator_name.upper()
-        
-        if indicator_name_upper == 'SMA':
-            # Tính Simple Moving Average
-            df[f'SMA_{window_size}'] = df['close'].rolling(window=window_size).mean()
-            latest_value = df[f'SMA_{window_size}'].iloc[-1]
-            
-            if pd.isna(latest_value):
-                return f"Không đủ dữ liệu để tính SMA {window_size} ngày cho {ticker.upper()}"
-            
-            return f"Chỉ số SMA {window_size} ngày của {ticker.upper()} là {latest_value:.2f}"
+        return f"Chỉ số {name} {period}của {snapshot['ticker']} là {value:.2f}"
+    
+    except IndicatorError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    except MarketDataError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({"error": f"Lỗi khi tính chỉ báo {indicator_name}: {str(e)}"}, ensure_ascii=False)
+
+
+def _parse_specs(indicators) -> list:
+    """Chuẩn hóa danh sách chỉ báo từ LLM (list hoặc chuỗi phân tách bởi dấu phẩy)"""
+    if isinstance(indicators, str):
+        indicators = indicators.split(",")
+    return [str(spec).strip() for spec in indicators if str(spec).strip()]
+
+
+def _indicator_snapshot(ticker: str, specs: list, start_date: str, end_date: str) -> dict:
+    """
+    Giá trị mới nhất của các chỉ báo cho một mã (raise MarketDataError nếu không có dữ liệu)
+
+    Trạng thái chỉ báo được giữ giữa các lần gọi nên chỉ các nến mới được tính thêm
+    """
+    ticker = resolve_ticker(ticker)
+    snapshot = indicator_states.snapshot(
+        ticker, specs, start_date, end_date, DEFAULT_SOURCE,
+        load_frame=lambda t, s, e: load_price_frame(t, s, e, DEFAULT_SOURCE)
+    )
+    if snapshot["as_of"] is None:
+        raise MarketDataError(f"Không có dữ liệu giá cho mã {ticker} trong khoảng thời gian này")
+    return snapshot
+
+
+def calculate_technical_indicators(ticker: str, indicators: list, start_date: str, end_date: str) -> str:
+    """
+    Tính nhiều chỉ báo kỹ thuật trong một lần gọi (một lần lấy dữ liệu, một lượt tính)
+    
+    Args:
+        ticker: Mã chứng khoán (ví dụ: 'FPT', 'VCB', 'HPG')
+        indicators: Danh sách chỉ báo (ví dụ: ['RSI14', 'MACD', 'SMA50', 'BB(20,2)'])
+        start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
+        end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
+    
+    Returns:
+        JSON string chứa giá trị mới nhất của từng chỉ báo hoặc thông báo lỗi
+    """
+    try:
+        specs = _parse_specs(indicators)
+        if not specs:
+            return json.dumps({"error": "Danh sách chỉ báo không được để trống"}, ensure_ascii=False)
         
-        elif indicator_name_upper == 'RSI':
-            # Tính Relative Strength Index
-            # RSI = 100 - (100 / (1 + RS))
-            # RS = Average Gain / Average Loss
-            delta = df['close'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=window_size).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=window_size).mean()
-            
-            rs = gain / loss
-            df[f'RSI_{window_size}'] = 100 - (100 / (1 + rs))
-            latest_value = df[f'RSI_{window_size}'].iloc[-1]
-            
-            if pd.isna(latest_value):
-                return f"Không đủ dữ liệu để tính RSI {window_size} ngày cho {ticker.upper()}"
-            
-            return f"Chỉ số RSI {window_size} ngày của {ticker.upper()} là {latest_value:.2f}"
+        return json.dumps(_indicator_snapshot(ticker, specs, start_date, end_date), ensure_ascii=False)
+    
+    except MarketDataError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({"error": f"Lỗi khi tính chỉ báo cho {ticker}: {str(e)}"}, ensure_ascii=False)
+
+
+def _normalize_tickers(tickers) -> list:
+    """Chuẩn hóa danh sách mã: viết hoa, bỏ trùng, giữ thứ tự"""
+    if isinstance(tickers, str):
+        tickers = tickers.replace(";", ",").split(",")
+    result = []
+    for ticker in tickers:
+        ticker = str(ticker).strip().upper()
+        if ticker and ticker not in result:
+            result.append(ticker)
+    return result
+
+
+def _run_batch(tickers, func) -> dict:
+    """
+    Chạy func(ticker) cho nhiều mã đồng thời (tối đa BATCH_MAX_CONCURRENCY)
+    
+    Returns:
+        Dict {"results": {ticker: kết quả}, "errors": {ticker: thông báo lỗi}}
+        theo đúng thứ tự mã đầu vào
+    """
+    tickers = _normalize_tickers(tickers)
+    if not tickers:
+        return {"error": "Danh sách mã chứng khoán không được để trống"}
+    if len(tickers) > BATCH_MAX_TICKERS:
+        return {"error": f"Tối đa {BATCH_MAX_TICKERS} mã cho mỗi lần gọi, nhận được {len(tickers)} mã"}
+    
+    futures = {ticker: _batch_executor.submit(func, ticker) for ticker in tickers}
+    results, errors = {}, {}
+    for ticker, future in futures.items():
+        try:
+            results[ticker] = future.result()
+        except MarketDataError as e:
+            errors[ticker] = str(e)
+        except Exception as e:
+            errors[ticker] = f"Lỗi khi xử lý mã {ticker}: {str(e)}"
+    
+    batch = {"results": results}
+    if errors:
+        batch["errors"] = errors
+    return batch
+
+
+def _json_value(value):
+    """Giá trị một ô DataFrame dạng serialize JSON được, giống DataFrame.to_json (NaN -> null, thời gian -> epoch ms)"""
+    if isinstance(value, pd.Timestamp):
+        return value.value // 1_000_000
+    if isinstance(value, (list, dict)):
+        return value
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def _compact_company(ticker: str) -> dict:
+    """Thông tin công ty rút gọn: bản ghi đầu tiên, cắt bớt các trường văn bản dài"""
+    record = load_company_overview(ticker).iloc[0].to_dict()
+    return {
+        key: (value[:BATCH_TEXT_LIMIT] + "..." if isinstance(value, str) and len(value) > BATCH_TEXT_LIMIT else value)
+        for key, value in ((key, _json_value(value)) for key, value in record.items())
+    }
+
+
+def _price_summary(ticker: str, start_date: str, end_date: str) -> dict:
+    """Tóm tắt giá của một mã trong khoảng thời gian (thay cho toàn bộ chuỗi OHLCV)"""
+    return price_summary(load_price_history(ticker, start_date, end_date))
+
+
+def get_company_info_batch(tickers: list) -> str:
+    """
+    Lấy thông tin tổng quan của nhiều công ty trong một lần gọi
+    
+    Args:
+        tickers: Danh sách mã chứng khoán (ví dụ: ['VCB', 'BID', 'CTG', 'TCB'])
+    
+    Returns:
+        JSON string {"results": {mã: thông tin rút gọn}, "errors": {mã: lỗi}}
+    """
+    try:
+        return json.dumps(_run_batch(tickers, _compact_company), ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({"error": f"Lỗi khi lấy thông tin công ty theo lô: {str(e)}"}, ensure_ascii=False)
+
+
+def get_historical_price_batch(tickers: list, start_date: str, end_date: str) -> str:
+    """
+    Lấy tóm tắt giá lịch sử của nhiều cổ phiếu trong một lần gọi
+    
+    Args:
+        tickers: Danh sách mã chứng khoán (ví dụ: ['VCB', 'BID', 'CTG', 'TCB'])
+        start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
+        end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
+    
+    Returns:
+        JSON string {"results": {mã: tóm tắt giá}, "errors": {mã: lỗi}}
+    """
+    try:
+        batch = _run_batch(tickers, lambda ticker: _price_summary(ticker, start_date, end_date))
+        return json.dumps(batch, ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({"error": f"Lỗi khi lấy giá lịch sử theo lô: {str(e)}"}, ensure_ascii=False)
+
+
+def calculate_technical_indicators_batch(tickers: list, indicators: list, start_date: str, end_date: str) -> str:
+    """
+    Tính các chỉ báo kỹ thuật cho nhiều cổ phiếu trong một lần gọi
+    
+    Args:
+        tickers: Danh sách mã chứng khoán (ví dụ: ['VCB', 'BID', 'CTG', 'TCB'])
+        indicators: Danh sách chỉ báo (ví dụ: ['RSI14', 'SMA20'])
+        start_date: Ngày bắt đầu (định dạng 'YYYY-MM-DD')
+        end_date: Ngày kết thúc (định dạng 'YYYY-MM-DD')
+    
+    Returns:
+        JSON string {"results": {mã: giá trị chỉ báo}, "errors": {mã: lỗi}}
+    """
+    try:
+        specs = _parse_specs(indicators)
+        if not specs:
+            return json.dumps({"error": "Danh sách chỉ báo không được để trống"}, ensure_ascii=False)
         
-        else:
-            return json.dumps({"error": f"Chỉ báo '{indicator_name}' không được hỗ trợ. Chỉ hỗ trợ 'SMA' và 'RSI'"}, ensure_ascii=False)
+        batch = _run_batch(tickers, lambda ticker: _indicator_snapshot(ticker, specs, start_date, end_date))
+        return json.dumps(batch, ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({"error": f"Lỗi khi tính chỉ báo theo lô: {str(e)}"}, ensure_ascii=False)
+
+
+def screen_stocks(filter: str, sort_by: str = "", ascending: bool = None, limit: int = SCREEN_DEFAULT_LIMIT,
+                  exchange: str = "", tickers: list = None) -> str:
+    """
+    Sàng lọc cổ phiếu toàn sàn theo điều kiện chỉ báo tại phiên gần nhất đã đóng cửa
+    
+    Args:
+        filter: Điều kiện lọc (ví dụ: 'RSI14 < 30 and VOLUME > VOLUME_SMA20')
+        sort_by: Biểu thức xếp hạng (ví dụ: 'ROC20'); mặc định theo vế trái của điều kiện đầu tiên
+        ascending: Xếp tăng dần hay giảm dần
+        limit: Số mã trả về
+        exchange: Giới hạn theo sàn (HOSE, HNX, UPCOM)
+        tickers: Giới hạn theo danh sách mã
     
+    Returns:
+        JSON string {"as_of", "universe", "matched", "results": [...]}
+    """
+    try:
+        return json.dumps(screen(filter, sort_by, ascending, limit, exchange, tickers, mapper=_batch_executor.map),
+                          ensure_ascii=False)
+    except ScreenerError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
     except Exception as e:
-        return json.dumps({"error": f"Lỗi khi tính chỉ báo {indicator_name}: {str(e)}"}, ensure_ascii=False)
+        return json.dumps({"error": f"Lỗi khi sàng lọc cổ phiếu: {str(e)}"}, ensure_ascii=False)
 
 
 # Hàm tiện ích để test
@@ -154,3 +337,8 @@ if __name__ == "__main__":
     print("=" * 50)
     result4 = calculate_technical_indicator('FPT', 'SMA', 20, '2024-09-01', '2024-11-01')
     print(result4)
+    
+    print("\n\nTest Tool 4: Nhiều chỉ báo")
+    print("=" * 50)
+    result5 = calculate_technical_indicators('HPG', ['RSI14', 'MACD', 'SMA50'], '2024-06-01', '2024-11-01')
+    print(result5)
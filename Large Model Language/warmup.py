@@ -0,0 +1,69 @@
+"""
+Nạp các SDK nặng ở nền khi server start
+google.generativeai và vnstock (kèm vnai) không import khi import main nên process trả lời
+/live ngay; tác vụ warmup trong lifespan nạp chúng trong thread nền và dựng model Gemini.
+Request tới trước khi warmup xong vẫn chạy được (SDK nạp ở lần dùng đầu tiên), /ready
+chỉ trả 200 khi warmup xong để load balancer/autoscaler chưa chuyển traffic vào worker lạnh.
+"""
+
+import asyncio
+import os
+
+import agent
+import clients
+from observability import ERRORS, logger, span
+
+
+# Cấu hình (có thể thay đổi qua biến môi trường)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") != "0"  # Tắt thì SDK chỉ nạp ở lần dùng đầu tiên
+
+
+def warm_gemini():
+    """Import SDK Gemini, dựng tool schema và model dùng chung (nếu có API key)"""
+    agent.get_financial_tool()
+    if agent.GEMINI_API_KEY:
+        agent.get_model()
+
+
+class Warmup:
+    """Chạy lần lượt các bước nạp trong thread nền và giữ trạng thái cho /ready"""
+
+    def __init__(self, steps: dict):
+        self.steps = steps  # Tên bước -> hàm đồng bộ
+        self.status = {name: "pending" for name in steps}
+        self.durations = {}
+        self.errors = {}
+
+    @property
+    def ready(self) -> bool:
+        return not WARMUP_ENABLED or all(status == "ok" for status in self.status.values())
+
+    async def run(self):
+        for name, step in self.steps.items():
+            self.status[name] = "running"
+            with span("warmup", name) as attributes:
+                try:
+                    await asyncio.to_thread(step)
+                except Exception as e:
+                    # Bước lỗi sẽ được thử lại ở lần dùng đầu tiên; /ready báo lỗi để dễ phát hiện
+                    self.status[name] = "error"
+                    self.errors[name] = str(e)
+                    ERRORS.labels("warmup").inc()
+                    logger.exception("Warmup %s lỗi", name)
+                else:
+                    self.status[name] = "ok"
+            self.durations[name] = round(attributes["duration"], 3)
+        logger.info("Warmup xong: %s", self.durations)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": WARMUP_ENABLED,
+            "ready": self.ready,
+            "steps": dict(self.status),
+            "durations_s": dict(self.durations),
+            "errors": dict(self.errors),
+        }
+
+
+# Warmup dùng chung cho toàn bộ process
+warmer = Warmup({"gemini": warm_gemini, "vnstock": clients.load_vnstock})